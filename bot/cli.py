@@ -0,0 +1,215 @@
+"""
+Служебные команды
+
+    python -m bot.cli backfill-phones [--batch-size 1000] [--rehash]
+    python -m bot.cli link +79991234567
+    python -m bot.cli reconcile [--full | --since 2024-01-01T00:00:00+03:00]
+    python -m bot.cli retention
+    python -m bot.cli export surveys [--format jsonl] [--from 2026-10-01] [--to 2026-10-31] [--procedure ...] [-o file]
+    python -m bot.cli template reminder_24h [--file new.j2 | --reset]
+"""
+import argparse
+import json
+import logging
+import sys
+
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def cmd_backfill_phones(args) -> int:
+    """Заполнение канонических номеров телефонов (phone_e164)"""
+    from bot.services.phone_index import backfill_all
+    
+    stats = backfill_all(batch_size=args.batch_size, rehash=args.rehash)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    return 0
+
+
+def cmd_link(args) -> int:
+    """Ссылка привязки аккаунта для номера телефона"""
+    from bot.utils.phone import build_start_link, phone_hash
+    
+    link = build_start_link(args.phone)
+    if link:
+        print(link)
+        return 0
+    
+    value = phone_hash(args.phone)
+    if not value:
+        print(f"Номер не распознан: {args.phone}", file=sys.stderr)
+        return 1
+    # TELEGRAM_BOT_USERNAME не задан: выводим только start-параметр
+    print(f"phone_{value}")
+    return 0
+
+
+def cmd_reconcile(args) -> int:
+    """Сверка записей со сделками Битрикс24"""
+    from bot.database import init_db
+    from bot.handlers.notifications import schedule_pending_reminders, set_bot_application
+    from bot.services.deal_sync import DealReconciler
+    from bot.services.scheduler import MODE_SWEEPER, SchedulerService
+    from bot.services.staff_directory import staff_directory
+    
+    init_db()
+    # Имена врачей берутся из справочника, он грузится пакетно один раз
+    staff_directory.load()
+    
+    # В режиме jobs у созданных записей, как у пришедших вебхуком, должны быть
+    # задачи напоминания и опроса; в режиме sweeper их найдёт обход
+    scheduler_service = None
+    if Config.SCHEDULER_MODE != MODE_SWEEPER:
+        scheduler_service = SchedulerService()
+        scheduler_service.start_for_writes()
+        set_bot_application(None, scheduler_service)
+    
+    try:
+        reconciler = DealReconciler(
+            batch_size=args.batch_size,
+            on_created=schedule_pending_reminders if scheduler_service else None
+        )
+        stats = reconciler.run(full=args.full, since=args.since)
+    finally:
+        if scheduler_service:
+            scheduler_service.scheduler.shutdown(wait=False)
+    print(json.dumps(stats, ensure_ascii=False, indent=2, default=str))
+    return 0
+
+
+def cmd_retention(args) -> int:
+    """Архивирование и удаление данных старше сроков хранения"""
+    from bot.services.retention import RetentionService
+    
+    results = RetentionService(batch_size=args.batch_size).run()
+    print(json.dumps(results, ensure_ascii=False, indent=2, default=str))
+    return 1 if any('error' in result for result in results.values()) else 0
+
+
+def cmd_export(args) -> int:
+    """Потоковая выгрузка опросов или записей в CSV/JSONL"""
+    from bot.services.export import parse_date_bound, stream_export
+    
+    try:
+        chunks = stream_export(
+            args.dataset,
+            args.format,
+            date_from=parse_date_bound(args.date_from),
+            date_to=parse_date_bound(args.date_to, end=True),
+            procedure=args.procedure
+        )
+    except ValueError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    
+    if args.output == '-':
+        sys.stdout.writelines(chunks)
+        return 0
+    
+    with open(args.output, 'w', encoding='utf-8', newline='') as output:
+        output.writelines(chunks)
+    return 0
+
+
+def cmd_template(args) -> int:
+    """Просмотр шаблона сообщения и его переопределение в БД"""
+    from bot.database import SessionLocal, init_db
+    from bot.models import MessageTemplate
+    from bot.services.message_templates import message_templates
+    
+    init_db()
+    
+    if args.file:
+        if message_templates.source(args.name) is None:
+            print(f"Шаблон не найден: {args.name}", file=sys.stderr)
+            return 1
+        with open(args.file, encoding='utf-8') as template_file:
+            body = template_file.read()
+        error = message_templates.check_source(body, args.name)
+        if error:
+            print(f"Шаблон не сохранён, ошибка: {error}", file=sys.stderr)
+            return 1
+    
+    if args.file or args.reset:
+        db = SessionLocal()
+        try:
+            template = db.get(MessageTemplate, args.name)
+            if args.reset:
+                if template:
+                    db.delete(template)
+            elif template:
+                template.body = body
+            else:
+                db.add(MessageTemplate(name=args.name, body=body))
+            db.commit()
+        finally:
+            db.close()
+        print(f"Шаблон {args.name} {'сброшен' if args.reset else 'сохранён'}; "
+              f"бот применит его в течение {Config.MESSAGE_TEMPLATES_RELOAD} с")
+        return 0
+    
+    current = message_templates.source(args.name)
+    if current is None:
+        print(f"Шаблон не найден: {args.name}", file=sys.stderr)
+        return 1
+    origin, body = current
+    print(f"# {origin}", file=sys.stderr)
+    print(body, end='')
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m bot.cli', description='Служебные команды бота Uclinic')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    backfill = subparsers.add_parser('backfill-phones', help='Заполнить phone_e164 и phone_hash у пользователей и записей')
+    backfill.add_argument('--batch-size', type=int, default=1000, help='Строк в пачке')
+    backfill.add_argument('--rehash', action='store_true', help='Пересчитать phone_hash у всех строк (после смены PHONE_HASH_SECRET)')
+    backfill.set_defaults(func=cmd_backfill_phones)
+    
+    link = subparsers.add_parser('link', help='Ссылка привязки аккаунта для номера телефона')
+    link.add_argument('phone', help='Номер в любом формате')
+    link.set_defaults(func=cmd_link)
+    
+    reconcile = subparsers.add_parser('reconcile', help='Сверить записи со сделками Битрикс24 (crm.deal.list)')
+    mode = reconcile.add_mutually_exclusive_group()
+    mode.add_argument('--full', action='store_true', help='Все сделки, без сохранённой отметки DATE_MODIFY')
+    mode.add_argument('--since', help='Сделки, изменённые начиная с даты (ISO 8601)')
+    reconcile.add_argument('--batch-size', type=int, default=None, help='Сделок на одну запись в БД')
+    reconcile.set_defaults(func=cmd_reconcile)
+    
+    retention = subparsers.add_parser('retention', help='Архивировать и удалить данные старше сроков хранения')
+    retention.add_argument('--batch-size', type=int, default=None, help='Строк на одну транзакцию удаления')
+    retention.set_defaults(func=cmd_retention)
+    
+    export = subparsers.add_parser('export', help='Выгрузить опросы или записи в CSV/JSONL')
+    export.add_argument('dataset', help='surveys (опросы с записями) или appointments (записи с оценками)')
+    export.add_argument('--format', default='csv', help='csv или jsonl')
+    export.add_argument('--from', dest='date_from', help='Начало периода (ISO 8601, включительно)')
+    export.add_argument('--to', dest='date_to', help='Конец периода (дата включительно)')
+    export.add_argument('--procedure', help='Только эта процедура')
+    export.add_argument('-o', '--output', default='-', help='Файл (по умолчанию stdout)')
+    export.set_defaults(func=cmd_export)
+    
+    template = subparsers.add_parser('template', help='Показать или переопределить шаблон сообщения')
+    template.add_argument('name', help='appointment_notification, reminder_24h, survey_message, survey_thanks')
+    action = template.add_mutually_exclusive_group()
+    action.add_argument('--file', help='Сохранить текст из файла в таблицу message_templates')
+    action.add_argument('--reset', action='store_true', help='Удалить переопределение из БД')
+    template.set_defaults(func=cmd_template)
+    
+    return parser
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=getattr(logging, Config.LOG_LEVEL)
+    )
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,6 +3,7 @@
 Все настройки загружаются из переменных окружения
 """
 import os
+import re
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -22,17 +23,116 @@ class Config:
         if admin_id.strip().isdigit()
     ]
     
+    # Ограничения частоты отправки (лимиты Telegram: ~30 сообщений/с на бота, ~1 сообщение/с в чат)
+    TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+    TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+    OUTBOUND_WORKERS = int(os.getenv('OUTBOUND_WORKERS', '8'))
+    OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+    
+    # Получение обновлений: polling или webhook (через встроенный вебхук-сервер)
+    TELEGRAM_UPDATE_MODE = os.getenv('TELEGRAM_UPDATE_MODE', 'polling').lower()
+    TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL', '')  # публичный адрес, например https://bot.example.com
+    TELEGRAM_WEBHOOK_PATH = os.getenv('TELEGRAM_WEBHOOK_PATH', '/webhook/telegram')
+    TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET', '')
+    TELEGRAM_WEBHOOK_MAX_CONNECTIONS = int(os.getenv('TELEGRAM_WEBHOOK_MAX_CONNECTIONS', '40'))
+    # Ключ подписи callback_data кнопок (по умолчанию выводится из токена бота)
+    CALLBACK_SECRET = os.getenv('CALLBACK_SECRET', '')
+    # Привязка аккаунта по ссылке t.me/<бот>?start=phone_<хэш>
+    TELEGRAM_BOT_USERNAME = os.getenv('TELEGRAM_BOT_USERNAME', '')
+    PHONE_HASH_SECRET = os.getenv('PHONE_HASH_SECRET', '')  # обязателен со ссылками привязки (TELEGRAM_BOT_USERNAME)
+    
     # Битрикс24
     BITRIX24_WEBHOOK_URL = os.getenv('BITRIX24_WEBHOOK_URL', '')
     BITRIX24_INCOMING_WEBHOOK_TOKEN = os.getenv('BITRIX24_INCOMING_WEBHOOK_TOKEN', '')
+    BITRIX24_POOL_SIZE = int(os.getenv('BITRIX24_POOL_SIZE', '10'))  # keep-alive соединений
+    BITRIX24_TIMEOUT = float(os.getenv('BITRIX24_TIMEOUT', '10'))  # секунды
+    BITRIX24_MAX_RETRIES = int(os.getenv('BITRIX24_MAX_RETRIES', '3'))
+    BITRIX24_BACKOFF = float(os.getenv('BITRIX24_BACKOFF', '0.5'))  # базовая задержка повтора, секунды
+    BITRIX24_RATE_LIMIT = float(os.getenv('BITRIX24_RATE_LIMIT', '2'))  # запросов в секунду
+    BITRIX24_RATE_BURST = int(os.getenv('BITRIX24_RATE_BURST', '50'))
+    BITRIX24_BATCH_ENABLED = os.getenv('BITRIX24_BATCH_ENABLED', 'True').lower() == 'true'
+    BITRIX24_BATCH_WINDOW = float(os.getenv('BITRIX24_BATCH_WINDOW', '0.05'))  # окно сборки batch, секунды
+    BITRIX24_CACHE_SIZE = int(os.getenv('BITRIX24_CACHE_SIZE', '5000'))  # записей на тип сущности
+    BITRIX24_DEAL_CACHE_TTL = int(os.getenv('BITRIX24_DEAL_CACHE_TTL', '60'))  # секунды
+    BITRIX24_CONTACT_CACHE_TTL = int(os.getenv('BITRIX24_CONTACT_CACHE_TTL', '600'))  # секунды
+    BITRIX24_DOCTOR_FIELD = os.getenv('BITRIX24_DOCTOR_FIELD', '')  # поле сделки с ID контакта врача (если есть)
+    
+    # Справочник сотрудников и контактов Битрикс24
+    STAFF_DIRECTORY_CONTACTS = os.getenv('STAFF_DIRECTORY_CONTACTS', 'False').lower() == 'true'  # только вместе с BITRIX24_DOCTOR_FIELD
+    STAFF_DIRECTORY_REFRESH = int(os.getenv('STAFF_DIRECTORY_REFRESH', '900'))  # секунды
+    STAFF_DIRECTORY_LOAD_TIMEOUT = int(os.getenv('STAFF_DIRECTORY_LOAD_TIMEOUT', '60'))  # секунды ожидания до запуска очереди вебхуков
+    
+    # Запись взаимодействий (interaction_logs) через буфер в памяти
+    INTERACTION_BUFFER_SIZE = int(os.getenv('INTERACTION_BUFFER_SIZE', '10000'))  # событий, сверх - отбрасываются
+    INTERACTION_BATCH_SIZE = int(os.getenv('INTERACTION_BATCH_SIZE', '500'))  # событий в одном INSERT
+    INTERACTION_FLUSH_INTERVAL = float(os.getenv('INTERACTION_FLUSH_INTERVAL', '2.0'))  # секунды
+    
+    # Агрегаты статистики (stats_hourly, stats_daily) для команды /stats
+    STATS_ROLLUP_INTERVAL = int(os.getenv('STATS_ROLLUP_INTERVAL', '300'))  # секунды
+    STATS_ROLLUP_BATCH = int(os.getenv('STATS_ROLLUP_BATCH', '5000'))  # строк interaction_logs за проход
+    STATS_ROLLUP_LAG = int(os.getenv('STATS_ROLLUP_LAG', '60'))  # секунды: свежие строки ждут следующего запуска
+    
+    # Сроки хранения (задача apply_retention, python -m bot.cli retention); 0 - хранить всё
+    RETENTION_INTERVAL = int(os.getenv('RETENTION_INTERVAL', '86400'))  # секунды между запусками
+    RETENTION_INTERACTION_DAYS = int(os.getenv('RETENTION_INTERACTION_DAYS', '180'))  # interaction_logs
+    RETENTION_WEBHOOK_EVENT_DAYS = int(os.getenv('RETENTION_WEBHOOK_EVENT_DAYS', '30'))  # обработанные вебхуки
+    RETENTION_APPOINTMENT_DAYS = int(os.getenv('RETENTION_APPOINTMENT_DAYS', '730'))  # прошедшие записи с опросами
+    RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '1000'))  # строк на одну транзакцию удаления
+    RETENTION_BATCH_PAUSE = float(os.getenv('RETENTION_BATCH_PAUSE', '0.2'))  # секунды между пачками
+    RETENTION_ARCHIVE_DIR = os.getenv('RETENTION_ARCHIVE_DIR', 'archive')  # '' - удалять без архива
+    RETENTION_PARTITION_MONTHS_AHEAD = int(os.getenv('RETENTION_PARTITION_MONTHS_AHEAD', '2'))  # секции PostgreSQL
+    
+    # Шаблоны сообщений Jinja2: таблица message_templates > MESSAGE_TEMPLATES_DIR > bot/templates/messages
+    MESSAGE_TEMPLATES_DIR = os.getenv('MESSAGE_TEMPLATES_DIR', '')  # каталог с файлами <имя>.j2
+    MESSAGE_TEMPLATES_RELOAD = int(os.getenv('MESSAGE_TEMPLATES_RELOAD', '60'))  # секунды между проверками изменений
+    MESSAGE_RENDER_CACHE_SIZE = int(os.getenv('MESSAGE_RENDER_CACHE_SIZE', '5000'))  # готовых текстов в кэше
+    
+    # Сверка записей со сделками Битрикс24 (python -m bot.cli reconcile)
+    RECONCILE_BATCH_SIZE = int(os.getenv('RECONCILE_BATCH_SIZE', '500'))  # сделок на одну запись в БД
+    RECONCILE_OVERLAP = int(os.getenv('RECONCILE_OVERLAP', '300'))  # секунды запаса назад от DATE_MODIFY
+    
+    # Кэш идентификации пользователей (telegram_id / телефон -> users.id)
+    IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', '20000'))  # записей на вид ключа
+    IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL', '3600'))  # секунды
     
     # Database
     DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///./bot.db')
     
+    # Пул соединений (на процесс; для PostgreSQL учитывайте max_connections сервера)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))  # ожидание свободного соединения, секунды
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))  # пересоздание соединения, секунды
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'True').lower() == 'true'
+    DB_SLOW_CHECKOUT = float(os.getenv('DB_SLOW_CHECKOUT', '0.1'))  # порог медленного получения соединения, секунды
+    
+    # Параметры SQLite (PRAGMA при каждом подключении)
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))  # миллисекунды
+    SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', '-20000'))  # < 0 - в КиБ (20 МБ)
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', '268435456'))  # байты (256 МБ)
+    
     # Webhook Server
     WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
     WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '5000'))
     WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+    # embedded - сервер в потоке бота, external - отдельный процесс (gunicorn bot.wsgi:app),
+    # события передаются боту через таблицу webhook_events
+    WEBHOOK_SERVER_MODE = os.getenv('WEBHOOK_SERVER_MODE', 'embedded').lower()
+    WEBHOOK_REQUEST_TIMEOUT = int(os.getenv('WEBHOOK_REQUEST_TIMEOUT', '30'))  # секунды на чтение запроса
+    ADMIN_API_TOKEN = os.getenv('ADMIN_API_TOKEN', '')  # Bearer-токен /admin/* и /metrics, пустой - эндпоинты отключены
+    EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '1000'))  # строк выгрузки на одно чтение курсора
+    
+    # Очередь обработки вебхуков
+    WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+    WEBHOOK_MAX_BACKLOG = int(os.getenv('WEBHOOK_MAX_BACKLOG', '10000'))  # необработанных событий в БД (режим external)
+    WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '4'))
+    WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', '5'))
+    WEBHOOK_RETRY_DELAY = int(os.getenv('WEBHOOK_RETRY_DELAY', '30'))  # секунды, растёт с каждой попыткой
+    WEBHOOK_POLL_INTERVAL = int(os.getenv('WEBHOOK_POLL_INTERVAL', '5'))  # секунды
+    WEBHOOK_DEBOUNCE = float(os.getenv('WEBHOOK_DEBOUNCE', '2'))  # окно объединения обновлений сделки (секунды)
+    WEBHOOK_LOCK_TIMEOUT = int(os.getenv('WEBHOOK_LOCK_TIMEOUT', '300'))  # секунды до возврата "зависших" событий
     
     # Logging
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -40,6 +140,18 @@ class Config:
     
     # Scheduler
     SCHEDULER_TIMEZONE = os.getenv('SCHEDULER_TIMEZONE', 'Europe/Moscow')
+    SCHEDULER_MODE = os.getenv('SCHEDULER_MODE', 'sweeper')  # sweeper или jobs
+    # Несколько экземпляров бота: общие задачи выполняет только владелец аренды в БД
+    SCHEDULER_LEADER_ELECTION = os.getenv('SCHEDULER_LEADER_ELECTION', 'True').lower() == 'true'
+    SCHEDULER_LEASE_TTL = int(os.getenv('SCHEDULER_LEASE_TTL', '30'))  # секунды, продление каждые TTL/3
+    SCHEDULER_MISFIRE_GRACE = int(os.getenv('SCHEDULER_MISFIRE_GRACE', '3600'))  # секунды опоздания, после которых задача пропускается
+    SWEEPER_INTERVAL = int(os.getenv('SWEEPER_INTERVAL', '60'))  # секунды
+    SWEEPER_BATCH_SIZE = int(os.getenv('SWEEPER_BATCH_SIZE', '200'))
+    SWEEPER_REMINDER_GRACE = int(os.getenv('SWEEPER_REMINDER_GRACE', '60'))  # минуты опоздания напоминания
+    SWEEPER_SURVEY_GRACE = int(os.getenv('SWEEPER_SURVEY_GRACE', '7'))  # дни опоздания опроса
+    
+    # Ожидание корутин, переданных в event loop бота из других потоков (секунды)
+    LOOP_BRIDGE_TIMEOUT = float(os.getenv('LOOP_BRIDGE_TIMEOUT', '30'))
     
     # Application
     DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
@@ -56,6 +168,27 @@ class Config:
         if not cls.BITRIX24_WEBHOOK_URL:
             errors.append("BITRIX24_WEBHOOK_URL не установлен")
         
+        # Ключ, выведенный из токена, меняется вместе с токеном - выданные ссылки перестанут работать
+        if cls.TELEGRAM_BOT_USERNAME and not cls.PHONE_HASH_SECRET:
+            errors.append("PHONE_HASH_SECRET обязателен для ссылок привязки (задан TELEGRAM_BOT_USERNAME)")
+        
+        if cls.WEBHOOK_SERVER_MODE not in ('embedded', 'external'):
+            errors.append("WEBHOOK_SERVER_MODE должен быть embedded или external")
+        
+        if cls.TELEGRAM_UPDATE_MODE not in ('polling', 'webhook'):
+            errors.append("TELEGRAM_UPDATE_MODE должен быть polling или webhook")
+        elif cls.TELEGRAM_UPDATE_MODE == 'webhook':
+            if not cls.TELEGRAM_WEBHOOK_URL:
+                errors.append("TELEGRAM_WEBHOOK_URL не установлен (режим webhook)")
+            # Без секрета любой, кто видит порт, может подделать нажатия кнопок и команды
+            if not re.fullmatch(r'[A-Za-z0-9_-]{16,256}', cls.TELEGRAM_WEBHOOK_SECRET):
+                errors.append(
+                    "TELEGRAM_WEBHOOK_SECRET обязателен в режиме webhook: "
+                    "16-256 символов A-Z, a-z, 0-9, _ и -"
+                )
+            if cls.WEBHOOK_PORT <= 0 or cls.WEBHOOK_SERVER_MODE != 'embedded':
+                errors.append("Режим webhook требует встроенного вебхук-сервера (WEBHOOK_PORT > 0, WEBHOOK_SERVER_MODE=embedded)")
+        
         if errors:
             raise ValueError("Ошибки конфигурации:\n" + "\n".join(f"  - {e}" for e in errors))
         
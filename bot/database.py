@@ -2,24 +2,205 @@
 Инициализация и настройка базы данных
 """
 import logging
-from sqlalchemy import create_engine
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from bot.config import Config
 
 logger = logging.getLogger(__name__)
 
+
+class PoolWaitStats:
+    """Статистика ожидания соединения из пула"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.slow = 0
+        self.timeouts = 0
+    
+    def record(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if wait >= Config.DB_SLOW_CHECKOUT:
+                self.slow += 1
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'avg_wait_ms': round(self.total_wait / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+                'slow_checkouts': self.slow,
+                'timeouts': self.timeouts,
+            }
+
+
+class _TimedPoolMixin:
+    """Замер времени получения соединения из очереди пула"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+    
+    def recreate(self):
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+    
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.wait_stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - started)
+        return connection
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    """QueuePool со статистикой ожидания"""
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool со статистикой ожидания"""
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith('sqlite')
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return _is_sqlite(url) and (url.partition('://')[2] in ('', '/', '/:memory:') or 'mode=memory' in url)
+
+
+def engine_options(url: str, is_async: bool = False) -> Dict:
+    """
+    Параметры create_engine для профиля БД
+    
+    SQLite в памяти использует пул по умолчанию (одно соединение на поток),
+    для файловой SQLite и серверных БД - пул с очередью и замером ожидания.
+    """
+    options = {'echo': Config.DEBUG}
+    
+    if _is_sqlite(url):
+        if not is_async:
+            options['connect_args'] = {'check_same_thread': False}
+        if _is_memory_sqlite(url):
+            return options
+    else:
+        options['pool_pre_ping'] = Config.DB_POOL_PRE_PING
+        options['pool_recycle'] = Config.DB_POOL_RECYCLE
+    
+    options.update(
+        poolclass=TimedAsyncQueuePool if is_async else TimedQueuePool,
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_MAX_OVERFLOW,
+        pool_timeout=Config.DB_POOL_TIMEOUT
+    )
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    PRAGMA для каждого нового соединения SQLite
+    
+    WAL позволяет читать во время записи, busy_timeout заставляет ждать
+    блокировку вместо немедленной ошибки "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {int(Config.SQLITE_BUSY_TIMEOUT)}")
+        cursor.execute(f"PRAGMA journal_mode = {Config.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {Config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size = {int(Config.SQLITE_CACHE_SIZE)}")
+        cursor.execute(f"PRAGMA mmap_size = {int(Config.SQLITE_MMAP_SIZE)}")
+    finally:
+        cursor.close()
+
+
+def create_db_engine(url: str):
+    """Создание синхронного движка с параметрами профиля"""
+    db_engine = create_engine(url, **engine_options(url))
+    if _is_sqlite(url) and not _is_memory_sqlite(url):
+        event.listen(db_engine, 'connect', set_sqlite_pragmas)
+    return db_engine
+
+
+def create_async_db_engine(url: str):
+    """Создание асинхронного движка с параметрами профиля"""
+    async_url = get_async_database_url(url)
+    db_engine = create_async_engine(async_url, **engine_options(async_url, is_async=True))
+    if _is_sqlite(url) and not _is_memory_sqlite(url):
+        event.listen(db_engine.sync_engine, 'connect', set_sqlite_pragmas)
+    return db_engine
+
+
+# Асинхронные драйверы для обработчиков, работающих в event loop бота
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg', 'postgres': 'asyncpg'}
+
+
+def get_async_database_url(url: str) -> str:
+    """
+    URL БД с асинхронным драйвером
+    
+    sqlite:///./bot.db -> sqlite+aiosqlite:///./bot.db,
+    postgresql://... -> postgresql+asyncpg://...
+    """
+    scheme, sep, rest = url.partition('://')
+    dialect = scheme.split('+')[0]
+    driver = ASYNC_DRIVERS.get(dialect)
+    if not sep or not driver:
+        return url
+    if dialect == 'postgres':
+        dialect = 'postgresql'
+    return f"{dialect}+{driver}://{rest}"
+
+
 # Создание движка БД
-engine = create_engine(
-    Config.DATABASE_URL,
-    echo=Config.DEBUG,
-    connect_args={"check_same_thread": False} if "sqlite" in Config.DATABASE_URL else {}
-)
+engine = create_db_engine(Config.DATABASE_URL)
 
 # Создание сессии
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Асинхронный движок и сессии: запросы не блокируют event loop бота.
+# expire_on_commit=False - после коммита атрибуты не перечитываются неявно
+# (ленивая загрузка в асинхронном коде невозможна)
+async_engine = create_async_db_engine(Config.DATABASE_URL)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+def get_pool_stats() -> Dict:
+    """Состояние пулов соединений и время ожидания соединения"""
+    stats = {}
+    for name, pool in (('sync', engine.pool), ('async', async_engine.sync_engine.pool)):
+        stats[name] = {'status': pool.status()}
+        if isinstance(pool, _TimedPoolMixin):
+            stats[name].update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+                **pool.wait_stats.stats()
+            )
+    return stats
+
 # Базовый класс для моделей
 Base = declarative_base()
 
@@ -35,7 +216,10 @@ def get_db():
 
 def init_db():
     """Инициализация БД (создание таблиц)"""
-    from bot.models import User, Appointment, Survey, InteractionLog  # noqa: F401
+    from bot.models import (  # noqa: F401
+        User, Appointment, Survey, InteractionLog, StatsHourly, StatsDaily,
+        WebhookEvent, SchedulerLease, SyncState, MessageTemplate
+    )
     
     logger.info("Создание таблиц в БД...")
     Base.metadata.create_all(bind=engine)
@@ -0,0 +1,37 @@
+"""
+Команды для администраторов клиники
+"""
+import logging
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from bot.config import Config
+from bot.services.stats_rollup import load_stats_summary
+from bot.utils.errors import handle_async_exceptions
+from bot.utils.messages import format_stats_summary
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATS_DAYS = 7
+MAX_STATS_DAYS = 365
+
+
+@handle_async_exceptions
+async def stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /stats [дней] - сводка по агрегатам статистики"""
+    user = update.effective_user
+    if user.id not in Config.TELEGRAM_ADMIN_IDS:
+        logger.warning(f"Попытка вызова /stats не администратором: {user.id}")
+        await update.message.reply_text("Команда доступна только администраторам.")
+        return
+    
+    days = DEFAULT_STATS_DAYS
+    if context.args:
+        try:
+            days = max(1, min(int(context.args[0]), MAX_STATS_DAYS))
+        except ValueError:
+            await update.message.reply_text("Использование: /stats [количество дней]")
+            return
+    
+    summary = await load_stats_summary(days)
+    await update.message.reply_text(format_stats_summary(summary))
@@ -1,30 +1,31 @@
 """
 Обработчики уведомлений о записях
 """
+import asyncio
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, delete, exists, or_, select, true, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, contains_eager, joinedload
+from telegram.error import Forbidden
 
-from bot.database import SessionLocal
-from bot.models import User, Appointment
-from bot.services.bitrix24 import Bitrix24Client
+from bot.database import AsyncSessionLocal, SessionLocal
+from bot.models import User, Appointment, Survey
+from bot.services.bitrix24 import get_bitrix_client
+from bot.services import interactions
+from bot.services.identity_cache import identity_cache
+from bot.services.interactions import record_interaction
+from bot.services.loop_bridge import loop_bridge
+from bot.services.outbound import outbound_dispatcher, Priority
+from bot.services.scheduler import MODE_SWEEPER
+from bot.services.deal_sync import extract_appointment_fields
 from bot.utils.messages import format_appointment_notification, format_reminder_24h, format_survey_message
 from bot.utils.keyboards import get_reminder_keyboard, get_survey_keyboard
 from bot.config import Config
 
 logger = logging.getLogger(__name__)
 
-# Ленивая инициализация клиента Битрикс24
-_bitrix_client = None
-
-def get_bitrix_client():
-    """Получение экземпляра клиента Битрикс24 (создаём при первом вызове)"""
-    global _bitrix_client
-    if _bitrix_client is None:
-        _bitrix_client = Bitrix24Client()
-    return _bitrix_client
-
 # Глобальные переменные для доступа к боту и планировщику (устанавливаются в main.py)
 _app_bot = None
 _app_scheduler = None
@@ -62,8 +63,17 @@ def handle_bitrix24_webhook(webhook_data: Dict) -> bool:
         deal_id = data.get('FIELDS', {}).get('ID')
         if deal_id:
             logger.info(f"Получен вебхук ONCRMDEALUPDATE для сделки {deal_id}")
+            # Закэшированные данные сделки устарели
+            get_bitrix_client().invalidate_deal(int(deal_id))
             return update_appointment(int(deal_id))
     
+    elif event == 'ONCRMCONTACTUPDATE':
+        # Обновлён контакт - достаточно сбросить кэш
+        contact_id = data.get('FIELDS', {}).get('ID')
+        if contact_id:
+            get_bitrix_client().invalidate_contact(int(contact_id))
+            return True
+    
     return False
 
 
@@ -80,6 +90,12 @@ def process_new_appointment(deal_id: int) -> bool:
     db: Session = SessionLocal()
     
     try:
+        # Повторное ONCRMDEALADD по уже сохранённой сделке - запрос к API не нужен
+        existing = db.query(Appointment.id).filter(Appointment.bitrix24_deal_id == deal_id).first()
+        if existing:
+            logger.info(f"Сделка {deal_id} уже обработана (запись {existing.id}), событие пропущено")
+            return True
+        
         # Получаем данные о сделке из Битрикс24
         bitrix_client = get_bitrix_client()
         deal = bitrix_client.get_deal(deal_id)
@@ -87,43 +103,34 @@ def process_new_appointment(deal_id: int) -> bool:
             logger.error(f"Не удалось получить данные сделки {deal_id}")
             return False
         
-        # Извлекаем данные
-        appointment_date_str = deal.get('BEGINDATE') or deal.get('UF_CRM_APPOINTMENT_DATE')
-        if not appointment_date_str:
+        # Извлекаем данные (те же поля, что при сверке со сделками)
+        fields = extract_appointment_fields(deal)
+        if not fields:
             logger.warning(f"У сделки {deal_id} не указана дата записи")
             return False
+        appointment_date = fields['appointment_date']
         
-        # Парсим дату (формат может быть разным)
-        try:
-            appointment_date = datetime.fromisoformat(appointment_date_str.replace('Z', '+00:00'))
-        except:
-            # Альтернативный формат
-            appointment_date = datetime.strptime(appointment_date_str, '%Y-%m-%d %H:%M:%S')
-        
-        # Получаем данные
-        phone = deal.get('PHONE', [])
-        phone_number = phone[0] if phone else None
-        
-        procedure_name = deal.get('TITLE') or deal.get('UF_CRM_PROCEDURE_NAME')
-        doctor_name = deal.get('ASSIGNED_BY_ID')  # TODO: Получить имя через contact.get
-        
-        # Ищем пользователя по телефону
+        # Ищем пользователя по телефону (через кэш идентификации)
         user = None
-        if phone_number:
-            user = db.query(User).filter(User.phone_number == phone_number).first()
+        user_id = identity_cache.user_id_by_phone(fields['phone_e164'])
+        if user_id:
+            user = db.get(User, user_id)
         
         # Создаем запись в БД
         appointment = Appointment(
             bitrix24_deal_id=deal_id,
             user_id=user.id if user else None,
-            phone_number=phone_number,
-            appointment_date=appointment_date,
-            procedure_name=procedure_name,
-            doctor_name=str(doctor_name) if doctor_name else None,
-            notification_sent=False
+            notification_sent=False,
+            **fields
         )
         db.add(appointment)
-        db.commit()
+        try:
+            db.commit()
+        except IntegrityError:
+            # Сделку одновременно обработал другой воркер
+            db.rollback()
+            logger.info(f"Сделка {deal_id} уже сохранена другим обработчиком")
+            return True
         
         # Отправляем уведомление клиенту (если есть пользователь)
         if user and _app_bot:
@@ -134,16 +141,14 @@ def process_new_appointment(deal_id: int) -> bool:
             _app_scheduler.schedule_reminder(
                 appointment.id,
                 appointment_date,
-                send_reminder_24h,
-                bot=_app_bot
+                send_reminder_24h
             )
             
             # Планируем опрос через 3 дня
             _app_scheduler.schedule_survey(
                 appointment.id,
                 appointment_date,
-                send_survey,
-                bot=_app_bot
+                send_survey
             )
         
         logger.info(f"Обработана новая запись {appointment.id} из Битрикс24 сделки {deal_id}")
@@ -178,9 +183,28 @@ def update_appointment(deal_id: int) -> bool:
             return False
         
         # Обновляем поля
-        # TODO: Реализовать обновление полей
+        fields = extract_appointment_fields(deal)
+        if not fields:
+            logger.warning(f"У сделки {deal_id} не указана дата записи")
+            return False
+        
+        rescheduled = appointment.appointment_date != fields['appointment_date']
+        for field, value in fields.items():
+            setattr(appointment, field, value)
+        if appointment.user_id is None:
+            appointment.user_id = identity_cache.user_id_by_phone(fields['phone_e164'])
+        
+        # Запись перенесена на будущее время: напоминание о новом времени ещё не отправлено
+        if rescheduled and appointment.appointment_date > datetime.now():
+            appointment.reminder_sent = False
+            appointment.reminder_confirmed = None
+            appointment.reminder_answered_at = None
         
         db.commit()
+        
+        if rescheduled:
+            reschedule_appointment_jobs(appointment.id, appointment.appointment_date)
+            logger.info(f"Запись {appointment.id} перенесена на {appointment.appointment_date}")
         return True
     
     except Exception as e:
@@ -192,6 +216,38 @@ def update_appointment(deal_id: int) -> bool:
         db.close()
 
 
+def schedule_pending_reminders(pending) -> int:
+    """
+    Планирование напоминаний и опросов для записей, привязанных к пользователю позже
+    
+    Args:
+        pending: Пары (appointment_id, appointment_date)
+    
+    Returns:
+        Количество запланированных записей
+    """
+    if not _app_scheduler:
+        return 0
+    
+    for appointment_id, appointment_date in pending:
+        _app_scheduler.schedule_reminder(appointment_id, appointment_date, send_reminder_24h)
+        _app_scheduler.schedule_survey(appointment_id, appointment_date, send_survey)
+    return len(pending)
+
+
+def reschedule_appointment_jobs(appointment_id: int, appointment_date: datetime):
+    """
+    Перенос задач напоминания и опроса на новую дату записи (режим jobs)
+    
+    Старое напоминание снимается: если новое время уже прошло, оно не планируется.
+    """
+    if not _app_scheduler or _app_scheduler.mode == MODE_SWEEPER:
+        return
+    
+    _app_scheduler.cancel_job(f"reminder_{appointment_id}")
+    schedule_pending_reminders([(appointment_id, appointment_date)])
+
+
 def send_appointment_notification(telegram_id: int, appointment: Appointment, db: Session, bot=None):
     """
     Отправка уведомления о записи клиенту
@@ -213,90 +269,188 @@ def send_appointment_notification(telegram_id: int, appointment: Appointment, db
             procedure_name=appointment.procedure_name
         )
         
-        # Отправка сообщения через бота (синхронно, т.к. вызывается из обработчика вебхука)
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        loop.run_until_complete(bot.send_message(
-            chat_id=telegram_id,
-            text=message_text
+        # Вызывается из потока обработки вебхуков: отправляем через event loop бота
+        loop_bridge.run(outbound_dispatcher.send(
+            telegram_id,
+            message_text,
+            Priority.NOTIFICATION,
+            bot=bot
         ))
         
-        loop.close()
-        
         # Отмечаем, что уведомление отправлено
         appointment.notification_sent = True
         db.commit()
+        record_interaction(appointment.user_id, interactions.NOTIFICATION, 'sent', {'appointment_id': appointment.id})
         logger.info(f"Уведомление отправлено пользователю {telegram_id} о записи {appointment.id}")
     
     except Exception as e:
         logger.error(f"Ошибка отправки уведомления пользователю {telegram_id}: {e}", exc_info=True)
         db.rollback()
+        record_interaction(
+            appointment.user_id, interactions.NOTIFICATION, 'failed',
+            {'appointment_id': appointment.id, 'error': type(e).__name__}
+        )
+
+
+async def _deliver_reminder(appointment: Appointment, user: User, bot):
+    """Формирование и отправка напоминания за 24 часа"""
+    message_text = format_reminder_24h(
+        appointment_date=appointment.appointment_date,
+        doctor_name=appointment.doctor_name,
+        procedure_name=appointment.procedure_name
+    )
+    
+    keyboard = get_reminder_keyboard(appointment.id)
+    
+    try:
+        await outbound_dispatcher.send(
+            user.telegram_id,
+            message_text,
+            Priority.REMINDER,
+            bot=bot,
+            reply_markup=keyboard
+        )
+    except Exception as e:
+        record_interaction(user.id, interactions.REMINDER, 'failed', {'appointment_id': appointment.id, 'error': type(e).__name__})
+        raise
+    record_interaction(user.id, interactions.REMINDER, 'sent', {'appointment_id': appointment.id})
+
+
+async def _deliver_survey(appointment: Appointment, user: User, bot):
+    """Формирование и отправка опроса"""
+    message_text = format_survey_message(procedure_name=appointment.procedure_name)
+    keyboard = get_survey_keyboard(appointment.id)
+    
+    try:
+        await outbound_dispatcher.send(
+            user.telegram_id,
+            message_text,
+            Priority.SURVEY,
+            bot=bot,
+            reply_markup=keyboard
+        )
+    except Exception as e:
+        record_interaction(user.id, interactions.SURVEY, 'failed', {'appointment_id': appointment.id, 'error': type(e).__name__})
+        raise
+    record_interaction(user.id, interactions.SURVEY, 'sent', {'appointment_id': appointment.id})
+
+
+async def _claim_reminders(appointment_ids, session_factory=AsyncSessionLocal) -> set:
+    """
+    Атомарная отметка напоминаний до отправки
+    
+    UPDATE ... WHERE reminder_sent = false: если несколько экземпляров бота
+    выбрали одну запись, отправит её только тот, чей UPDATE её изменил.
+    
+    Returns:
+        ID записей, захваченных этим вызовом
+    """
+    async with session_factory() as db:
+        result = await db.execute(
+            update(Appointment)
+            .where(Appointment.id.in_(appointment_ids), Appointment.reminder_sent == False)
+            .values(reminder_sent=True)
+            .returning(Appointment.id),
+            execution_options={'synchronize_session': False}
+        )
+        claimed = set(result.scalars().all())
+        await db.commit()
+    return claimed
+
+
+async def _release_reminder(appointment_id: int, session_factory=AsyncSessionLocal):
+    """Снятие отметки после неудачной отправки (напоминание будет отправлено повторно)"""
+    async with session_factory() as db:
+        await db.execute(
+            update(Appointment).where(Appointment.id == appointment_id).values(reminder_sent=False),
+            execution_options={'synchronize_session': False}
+        )
+        await db.commit()
+
+
+async def _claim_survey(appointment: Appointment, session_factory=AsyncSessionLocal) -> bool:
+    """
+    Захват опроса до отправки: создание записи Survey
+    
+    Уникальный индекс по appointment_id не даёт второму экземпляру
+    создать опрос для той же записи.
+    """
+    async with session_factory() as db:
+        db.add(Survey(
+            appointment_id=appointment.id,
+            user_id=appointment.user_id,
+            sent_at=datetime.utcnow()
+        ))
+        try:
+            await db.commit()
+            return True
+        except IntegrityError:
+            await db.rollback()
+            return False
+
+
+async def _release_survey(appointment_id: int, session_factory=AsyncSessionLocal):
+    """Удаление неотправленного опроса (будет отправлен повторно)"""
+    async with session_factory() as db:
+        await db.execute(
+            delete(Survey).where(Survey.appointment_id == appointment_id, Survey.answered_at == None),
+            execution_options={'synchronize_session': False}
+        )
+        await db.commit()
+
+
+async def _load_appointment(appointment_id: int) -> Optional[Appointment]:
+    """Запись вместе с пользователем одним запросом (без ленивой загрузки)"""
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(
+            select(Appointment).options(joinedload(Appointment.user)).where(Appointment.id == appointment_id)
+        )
 
 
 async def send_reminder_24h(appointment_id: int, bot=None):
     """Отправка напоминания за 24 часа"""
+    bot = bot or _app_bot
     if not bot:
         logger.warning(f"Бот не передан для отправки напоминания записи {appointment_id}")
         return
     
-    db = SessionLocal()
-    
     try:
-        appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
+        appointment = await _load_appointment(appointment_id)
         if not appointment:
             logger.warning(f"Запись {appointment_id} не найдена")
             return
         
-        if appointment.reminder_sent:
-            logger.info(f"Напоминание для записи {appointment_id} уже было отправлено")
-            return
-        
         user = appointment.user
         if not user:
             logger.warning(f"Пользователь не найден для записи {appointment_id}")
             return
         
-        message_text = format_reminder_24h(
-            appointment_date=appointment.appointment_date,
-            doctor_name=appointment.doctor_name,
-            procedure_name=appointment.procedure_name
-        )
-        
-        keyboard = get_reminder_keyboard()
-        
-        # Сохраняем appointment_id в user_data для обработки callback
-        # TODO: Передать appointment_id в callback_data кнопок
+        if not await _claim_reminders([appointment_id]):
+            logger.info(f"Напоминание для записи {appointment_id} уже было отправлено")
+            return
         
-        await bot.send_message(
-            chat_id=user.telegram_id,
-            text=message_text,
-            reply_markup=keyboard
-        )
+        try:
+            await _deliver_reminder(appointment, user, bot)
+        except BaseException:
+            # В т.ч. при отмене задачи: иначе запись останется захваченной без сообщения
+            await _release_reminder(appointment_id)
+            raise
         
-        appointment.reminder_sent = True
-        db.commit()
         logger.info(f"Напоминание отправлено пользователю {user.telegram_id} для записи {appointment_id}")
     
     except Exception as e:
         logger.error(f"Ошибка отправки напоминания для записи {appointment_id}: {e}", exc_info=True)
-        db.rollback()
-    
-    finally:
-        db.close()
 
 
 async def send_survey(appointment_id: int, bot=None):
     """Отправка опроса через 3 дня"""
+    bot = bot or _app_bot
     if not bot:
         logger.warning(f"Бот не передан для отправки опроса записи {appointment_id}")
         return
     
-    db = SessionLocal()
-    
     try:
-        appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
+        appointment = await _load_appointment(appointment_id)
         if not appointment:
             logger.warning(f"Запись {appointment_id} не найдена")
             return
@@ -311,40 +465,175 @@ async def send_survey(appointment_id: int, bot=None):
             logger.warning(f"Пользователь не найден для записи {appointment_id}")
             return
         
-        # Проверяем, не был ли уже отправлен опрос
-        from bot.models import Survey
-        existing_survey = db.query(Survey).filter(
-            Survey.appointment_id == appointment_id,
-            Survey.user_id == user.id
-        ).first()
-        
-        if existing_survey:
+        # Создаём запись опроса до отправки: не отправлен ли он уже (в т.ч. другим экземпляром)
+        if not await _claim_survey(appointment):
             logger.info(f"Опрос для записи {appointment_id} уже был отправлен")
             return
         
-        message_text = format_survey_message(procedure_name=appointment.procedure_name)
-        keyboard = get_survey_keyboard()
-        
-        await bot.send_message(
-            chat_id=user.telegram_id,
-            text=message_text,
-            reply_markup=keyboard
-        )
+        try:
+            await _deliver_survey(appointment, user, bot)
+        except BaseException:
+            await _release_survey(appointment_id)
+            raise
         
-        # Создаем запись опроса
-        survey = Survey(
-            appointment_id=appointment_id,
-            user_id=user.id,
-            sent_at=datetime.utcnow()
-        )
-        db.add(survey)
-        db.commit()
         logger.info(f"Опрос отправлен пользователю {user.telegram_id} для записи {appointment_id}")
     
     except Exception as e:
         logger.error(f"Ошибка отправки опроса для записи {appointment_id}: {e}", exc_info=True)
-        db.rollback()
+
+
+async def _release_quietly(release, appointment_id: int, kind: str):
+    """Снятие захвата без прерывания обхода при ошибке"""
+    try:
+        await release(appointment_id)
+    except Exception as e:
+        logger.error(f"Не удалось снять захват ({kind}) записи {appointment_id}: {e}")
+
+
+def _after_cursor(cursor):
+    """Условие keyset-пагинации по (appointment_date, id)"""
+    if cursor is None:
+        return true()
+    last_date, last_id = cursor
+    return or_(
+        Appointment.appointment_date > last_date,
+        and_(Appointment.appointment_date == last_date, Appointment.id > last_id)
+    )
+
+
+async def _sweep(kind: str, build_filters, deliver, claim, release, bot=None) -> int:
+    """
+    Пакетный обход подошедших записей
     
-    finally:
-        db.close()
+    Записи выбираются одним диапазонным запросом по appointment_date пачками
+    по SWEEPER_BATCH_SIZE, каждая пачка отправляется параллельно через
+    диспетчер исходящих сообщений (он и ограничивает скорость).
+    Перед отправкой записи захватываются атомарно, поэтому при нескольких
+    экземплярах бота каждое сообщение отправляется один раз. Захват записей,
+    не отправленных из-за временной ошибки, снимается - их выберет следующий обход.
+    
+    Args:
+        kind: Название обхода для логов
+        build_filters: Функция, возвращающая условия выборки
+        deliver: Корутина отправки (appointment, user, bot)
+        claim: Корутина захвата (appointments), возвращает ID захваченных записей
+        release: Корутина снятия захвата (appointment_id)
+        bot: Экземпляр бота (по умолчанию установленный через set_bot_application)
+    
+    Returns:
+        Количество отправленных сообщений
+    """
+    bot = bot or _app_bot
+    if not bot:
+        logger.warning(f"Бот не установлен, обход ({kind}) пропущен")
+        return 0
+    
+    sent = 0
+    cursor = None
+    
+    while True:
+        db = AsyncSessionLocal()
+        try:
+            appointments = (await db.scalars(
+                select(Appointment).join(Appointment.user).options(
+                    contains_eager(Appointment.user)
+                ).where(
+                    *build_filters(),
+                    User.is_active == True,
+                    _after_cursor(cursor)
+                ).order_by(
+                    Appointment.appointment_date, Appointment.id
+                ).limit(Config.SWEEPER_BATCH_SIZE)
+            )).all()
+            
+            if not appointments:
+                break
+            
+            cursor = (appointments[-1].appointment_date, appointments[-1].id)
+            
+            claimed = await claim(appointments)
+            batch = [appointment for appointment in appointments if appointment.id in claimed]
+            # Захват остаётся только у отправленных и у заблокировавших бота
+            keep_claimed = set()
+            
+            async def deliver_one(appointment):
+                await deliver(appointment, appointment.user, bot)
+                keep_claimed.add(appointment.id)
+            
+            try:
+                results = await asyncio.gather(
+                    *(deliver_one(appointment) for appointment in batch),
+                    return_exceptions=True
+                )
+                
+                for appointment, result in zip(batch, results):
+                    if isinstance(result, Forbidden):
+                        # Пользователь заблокировал бота - больше ему не пишем
+                        logger.warning(f"Пользователь {appointment.user.telegram_id} заблокировал бота")
+                        appointment.user.is_active = False
+                        keep_claimed.add(appointment.id)
+                    elif isinstance(result, BaseException):
+                        logger.error(f"Ошибка отправки ({kind}) для записи {appointment.id}: {result!r}")
+                    else:
+                        sent += 1
+            
+            finally:
+                # Выполняется и при отмене обхода: неотправленные записи выберет следующий обход
+                for appointment in batch:
+                    if appointment.id not in keep_claimed:
+                        await _release_quietly(release, appointment.id, kind)
+            
+            await db.commit()
+            
+            if len(appointments) < Config.SWEEPER_BATCH_SIZE:
+                break
+        
+        except Exception as e:
+            logger.error(f"Ошибка обхода ({kind}): {e}", exc_info=True)
+            await db.rollback()
+            break
+        
+        finally:
+            await db.close()
+    
+    if sent:
+        logger.info(f"Обход ({kind}): отправлено {sent}")
+    return sent
+
+
+async def sweep_reminders(bot=None) -> int:
+    """Отправка всех подошедших напоминаний за 24 часа (режим sweeper)"""
+    window_end = datetime.now() + timedelta(hours=24)
+    window_start = window_end - timedelta(minutes=Config.SWEEPER_REMINDER_GRACE)
+    
+    def build_filters():
+        return (
+            Appointment.reminder_sent == False,
+            Appointment.appointment_date > window_start,
+            Appointment.appointment_date <= window_end,
+        )
+    
+    async def claim(appointments):
+        return await _claim_reminders([appointment.id for appointment in appointments])
+    
+    return await _sweep('напоминания', build_filters, _deliver_reminder, claim, _release_reminder, bot=bot)
+
 
+async def sweep_surveys(bot=None) -> int:
+    """Отправка всех подошедших опросов через 3 дня после процедуры (режим sweeper)"""
+    window_end = datetime.now() - timedelta(days=3)
+    window_start = window_end - timedelta(days=Config.SWEEPER_SURVEY_GRACE)
+    
+    def build_filters():
+        return (
+            Appointment.appointment_date > window_start,
+            Appointment.appointment_date <= window_end,
+            # Клиент не отменял запись
+            or_(Appointment.reminder_confirmed == None, Appointment.reminder_confirmed == True),
+            ~exists().where(Survey.appointment_id == Appointment.id),
+        )
+    
+    async def claim(appointments):
+        return {appointment.id for appointment in appointments if await _claim_survey(appointment)}
+    
+    return await _sweep('опросы', build_filters, _deliver_survey, claim, _release_survey, bot=bot)
@@ -4,25 +4,19 @@
 import logging
 from datetime import datetime
 from telegram import Update
+from sqlalchemy import select
 from telegram.ext import ContextTypes
 
-from bot.database import SessionLocal
+from bot.database import AsyncSessionLocal
 from bot.models import Appointment
-from bot.services.bitrix24 import Bitrix24Client
+from bot.services.bitrix24 import get_bitrix_client
+from bot.services.identity_cache import identity_cache
+from bot.services.interactions import REMINDER_ANSWER, record_interaction
+from bot.utils.callback_data import decode_callback
 from bot.utils.errors import handle_async_exceptions
 
 logger = logging.getLogger(__name__)
 
-# Ленивая инициализация клиента Битрикс24
-_bitrix_client = None
-
-def get_bitrix_client():
-    """Получение экземпляра клиента Битрикс24"""
-    global _bitrix_client
-    if _bitrix_client is None:
-        _bitrix_client = Bitrix24Client()
-    return _bitrix_client
-
 
 @handle_async_exceptions
 async def reminder_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -33,43 +27,55 @@ async def reminder_callback_handler(update: Update, context: ContextTypes.DEFAUL
     user_id = query.from_user.id
     callback_data = query.data
     
-    db = SessionLocal()
+    payload = decode_callback(callback_data)
+    if payload is None and callback_data not in ("reminder_confirm", "reminder_cancel"):
+        # Подпись не сошлась или формат неизвестен: не угадываем запись
+        await query.edit_message_text("Не удалось обработать ответ. Кнопка устарела.")
+        return
+    
+    db = AsyncSessionLocal()
     
     try:
-        # Извлекаем appointment_id из callback_data или из данных запроса
-        # TODO: Сохранять appointment_id в callback_data при создании кнопки
+        owner_id = await identity_cache.user_id_by_telegram_async(user_id)
         
-        # Временная заглушка - нужно будет передавать appointment_id
-        appointment_id = context.user_data.get('pending_reminder_appointment_id')
-        
-        if not appointment_id:
-            # Пытаемся найти последнюю запись пользователя
-            from bot.models import User
-            user = db.query(User).filter(User.telegram_id == user_id).first()
-            if user:
-                appointment = db.query(Appointment).filter(
-                    Appointment.user_id == user.id,
-                    Appointment.reminder_sent == True,
-                    Appointment.reminder_confirmed == None
-                ).order_by(Appointment.appointment_date.desc()).first()
-            else:
+        if not owner_id:
+            appointment = None
+        elif payload:
+            # ID записи подписан в callback_data: поиск по первичному ключу
+            # с проверкой, что запись принадлежит нажавшему пользователю
+            confirmed = payload.action == 'y'
+            appointment = await db.get(Appointment, payload.appointment_id)
+            if appointment and appointment.user_id != owner_id:
                 appointment = None
         else:
-            appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
+            # Кнопки старого формата (сообщения, отправленные до обновления):
+            # ищем последнюю запись пользователя
+            confirmed = callback_data == "reminder_confirm"
+            appointment = await db.scalar(
+                select(Appointment).where(
+                    Appointment.user_id == owner_id,
+                    Appointment.reminder_sent == True,
+                    Appointment.reminder_confirmed == None
+                ).order_by(Appointment.appointment_date.desc()).limit(1)
+            )
         
         if not appointment:
             await query.edit_message_text("Не найдена запись для подтверждения.")
             return
         
+        if appointment.reminder_confirmed is not None:
+            await query.edit_message_text("Вы уже ответили на это напоминание. Спасибо!")
+            return
+        
         # Обработка ответа
-        if callback_data == "reminder_confirm":
+        if confirmed:
             appointment.reminder_confirmed = True
             appointment.reminder_answered_at = datetime.utcnow()
             
             # Обновляем статус в Битрикс24
             try:
                 bitrix_client = get_bitrix_client()
-                bitrix_client.update_deal(
+                await bitrix_client.update_deal_async(
                     appointment.bitrix24_deal_id,
                     {'UF_CRM_REMINDER_CONFIRMED': 'Y'}
                 )
@@ -79,14 +85,14 @@ async def reminder_callback_handler(update: Update, context: ContextTypes.DEFAUL
             await query.edit_message_text("✅ Спасибо за подтверждение! Ждём вас в назначенное время.")
             logger.info(f"Пользователь {user_id} подтвердил запись {appointment.id}")
         
-        elif callback_data == "reminder_cancel":
+        else:
             appointment.reminder_confirmed = False
             appointment.reminder_answered_at = datetime.utcnow()
             
             # Обновляем статус в Битрикс24
             try:
                 bitrix_client = get_bitrix_client()
-                bitrix_client.update_deal(
+                await bitrix_client.update_deal_async(
                     appointment.bitrix24_deal_id,
                     {'UF_CRM_REMINDER_CONFIRMED': 'N', 'STAGE_ID': 'CANCELED'}  # TODO: Уточнить статусы
                 )
@@ -104,13 +110,17 @@ async def reminder_callback_handler(update: Update, context: ContextTypes.DEFAUL
             if scheduler:
                 scheduler.cancel_job(f"survey_{appointment.id}")
         
-        db.commit()
+        await db.commit()
+        record_interaction(
+            owner_id, REMINDER_ANSWER, 'confirmed' if confirmed else 'cancelled',
+            {'appointment_id': appointment.id}
+        )
     
     except Exception as e:
         logger.error(f"Ошибка обработки напоминания: {e}", exc_info=True)
         await query.edit_message_text("Произошла ошибка при обработке ответа.")
-        db.rollback()
+        await db.rollback()
     
     finally:
-        db.close()
+        await db.close()
 
@@ -5,6 +5,9 @@ import logging
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from bot.handlers.notifications import schedule_pending_reminders
+from bot.services.account_linking import link_account
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,13 +24,22 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if start_param and start_param.startswith('phone_'):
         # Связывание пользователя по номеру телефона
-        phone_hash = start_param.replace('phone_', '')
-        # TODO: Реализовать связывание с Битрикс24
-        welcome_text = (
-            "Добро пожаловать в Uclinic! 💙\n\n"
-            "Вы успешно подписаны на уведомления. "
-            "Теперь вы будете получать напоминания о записях здесь."
-        )
+        phone_hash = start_param.replace('phone_', '', 1)
+        result = await link_account(user, phone_hash)
+        
+        if result:
+            schedule_pending_reminders(result.pending)
+            welcome_text = (
+                "Добро пожаловать в Uclinic! 💙\n\n"
+                "Вы успешно подписаны на уведомления. "
+                "Теперь вы будете получать напоминания о записях здесь."
+            )
+        else:
+            welcome_text = (
+                "Добро пожаловать в Uclinic! 💙\n\n"
+                "К сожалению, ссылка для подписки недействительна. "
+                "Пожалуйста, запросите новую ссылку у администратора клиники."
+            )
     else:
         welcome_text = (
             "Добро пожаловать в Uclinic! 💙\n\n"
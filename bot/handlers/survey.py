@@ -4,11 +4,15 @@
 import logging
 from datetime import datetime
 from telegram import Update
+from sqlalchemy import select
 from telegram.ext import ContextTypes
 
-from bot.database import SessionLocal
-from bot.models import Appointment, Survey, User
+from bot.database import AsyncSessionLocal
+from bot.models import Appointment, Survey
+from bot.services.identity_cache import identity_cache
+from bot.services.interactions import SURVEY_ANSWER, record_interaction
 from bot.services.yandex_maps import generate_yandex_maps_review_link
+from bot.utils.callback_data import decode_callback
 from bot.utils.messages import format_survey_thanks
 from bot.utils.errors import handle_async_exceptions
 
@@ -24,39 +28,51 @@ async def survey_callback_handler(update: Update, context: ContextTypes.DEFAULT_
     user_id = query.from_user.id
     callback_data = query.data
     
-    # Извлекаем оценку из callback_data (survey_1, survey_2, ..., survey_5)
-    rating = int(callback_data.split('_')[1])
+    payload = decode_callback(callback_data)
+    if payload is None and callback_data not in {f"survey_{i}" for i in range(1, 6)}:
+        # Подпись не сошлась или формат неизвестен: не угадываем запись
+        await query.edit_message_text("Не удалось обработать ответ. Кнопка устарела.")
+        return
     
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     
     try:
-        # Находим пользователя
-        user = db.query(User).filter(User.telegram_id == user_id).first()
-        if not user:
+        # Находим пользователя (через кэш идентификации)
+        owner_id = await identity_cache.user_id_by_telegram_async(user_id)
+        if not owner_id:
             await query.edit_message_text("Пользователь не найден.")
             return
         
-        # Находим запись для опроса
-        appointment_id = context.user_data.get('pending_survey_appointment_id')
-        
-        if appointment_id:
-            appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
+        if payload:
+            # Оценка и ID записи подписаны в callback_data (sv:5:<id>:<подпись>):
+            # запись загружается по первичному ключу с проверкой владельца
+            rating = int(payload.action)
+            appointment = await db.get(Appointment, payload.appointment_id)
+            if appointment and appointment.user_id != owner_id:
+                appointment = None
         else:
+            # Кнопки старого формата (survey_1, ..., survey_5)
+            rating = int(callback_data.split('_')[1])
+            
             # Ищем последнюю завершенную запись
-            appointment = db.query(Appointment).filter(
-                Appointment.user_id == user.id,
-                Appointment.appointment_date < datetime.utcnow()
-            ).order_by(Appointment.appointment_date.desc()).first()
+            appointment = await db.scalar(
+                select(Appointment).where(
+                    Appointment.user_id == owner_id,
+                    Appointment.appointment_date < datetime.utcnow()
+                ).order_by(Appointment.appointment_date.desc()).limit(1)
+            )
         
         if not appointment:
             await query.edit_message_text("Не найдена запись для опроса.")
             return
         
         # Проверяем, не отвечал ли уже пользователь
-        existing_survey = db.query(Survey).filter(
-            Survey.appointment_id == appointment.id,
-            Survey.user_id == user.id
-        ).first()
+        existing_survey = await db.scalar(
+            select(Survey).where(
+                Survey.appointment_id == appointment.id,
+                Survey.user_id == owner_id
+            )
+        )
         
         if existing_survey and existing_survey.answered_at:
             await query.edit_message_text("Вы уже ответили на этот опрос. Спасибо!")
@@ -68,7 +84,7 @@ async def survey_callback_handler(update: Update, context: ContextTypes.DEFAULT_
         else:
             survey = Survey(
                 appointment_id=appointment.id,
-                user_id=user.id,
+                user_id=owner_id,
                 sent_at=datetime.utcnow()
             )
             db.add(survey)
@@ -93,14 +109,15 @@ async def survey_callback_handler(update: Update, context: ContextTypes.DEFAULT_
             thanks_message = format_survey_thanks(rating)
             await query.edit_message_text(thanks_message)
         
-        db.commit()
+        await db.commit()
+        record_interaction(owner_id, SURVEY_ANSWER, 'answered', {'appointment_id': appointment.id, 'rating': rating})
         logger.info(f"Пользователь {user_id} поставил оценку {rating} для записи {appointment.id}")
     
     except Exception as e:
         logger.error(f"Ошибка обработки опроса: {e}", exc_info=True)
         await query.edit_message_text("Произошла ошибка при обработке ответа.")
-        db.rollback()
+        await db.rollback()
     
     finally:
-        db.close()
+        await db.close()
 
@@ -1,23 +1,34 @@
 """
 Точка входа для Telegram-бота Uclinic
 """
+import asyncio
 import logging
 import threading
-from telegram import Update
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler
 
 from bot.config import Config
 from bot.handlers.start import start_handler, help_handler
+from bot.handlers.admin import stats_handler
 from bot.handlers.reminders import reminder_callback_handler
 from bot.handlers.survey import survey_callback_handler
 from bot.handlers.menu import (
     menu_handler, book_handler, promotions_handler, 
     prices_handler, contacts_handler
 )
-from bot.handlers.notifications import set_bot_application
+from bot.handlers.notifications import set_bot_application, sweep_reminders, sweep_surveys
 from bot.database import init_db
 from bot.services.scheduler import SchedulerService
-from bot.services.webhook_server import run_webhook_server
+from bot.services.loop_bridge import loop_bridge
+from bot.services.staff_directory import staff_directory, refresh_staff_directory
+from bot.services.retention import apply_retention
+from bot.services.stats_rollup import update_stats_rollups
+from bot.services.identity_cache import identity_cache
+from bot.services.interactions import interaction_recorder
+from bot.services.message_templates import message_templates, reload_message_templates
+from bot.services.outbound import outbound_dispatcher
+from bot.services.telegram_webhook import ALLOWED_UPDATES, run_webhook_mode
+from bot.services.webhook_server import start_webhook_server, stop_webhook_server
+from bot.services.webhook_queue import get_webhook_queue
 from bot.utils.errors import error_handler
 
 # Настройка логирования
@@ -49,34 +60,92 @@ def main():
     init_db()
     logger.info("База данных инициализирована")
     
+    # Шаблоны сообщений компилируются один раз, изменения подхватывает задача ниже
+    message_templates.load()
+    
+    # Журнал взаимодействий пишется в БД пачками из фонового потока
+    interaction_recorder.start()
+    
     # Запуск планировщика
     scheduler_service.start()
     logger.info("Планировщик задач запущен")
     
+    # Справочник сотрудников грузится в фоне, чтобы не задерживать запуск бота
+    staff_directory_load = threading.Thread(target=staff_directory.load, daemon=True, name="StaffDirectoryLoad")
+    staff_directory_load.start()
+    threading.Thread(target=identity_cache.warm, daemon=True, name="IdentityCacheWarm").start()
+    scheduler_service.add_interval_job(
+        'refresh_staff_directory',
+        Config.STAFF_DIRECTORY_REFRESH,
+        refresh_staff_directory,
+        local=True
+    )
+    scheduler_service.add_interval_job(
+        'reload_message_templates',
+        Config.MESSAGE_TEMPLATES_RELOAD,
+        reload_message_templates,
+        local=True
+    )
+    
+    # Агрегаты для /stats пересчитывает только ведущий экземпляр
+    scheduler_service.add_interval_job(
+        'update_stats_rollups',
+        Config.STATS_ROLLUP_INTERVAL,
+        update_stats_rollups
+    )
+    scheduler_service.add_interval_job('apply_retention', Config.RETENTION_INTERVAL, apply_retention)
+    
+    # Устанавливаем бота, планировщик и мост к event loop для обработчиков вебхуков
+    async def post_init(application: Application):
+        loop_bridge.attach()
+        await outbound_dispatcher.start(application.bot)
+        set_bot_application(application.bot, scheduler_service)
+        scheduler_service.start_sweepers(sweep_reminders, sweep_surveys)
+        logger.info("Бот и планировщик установлены для обработчиков вебхуков")
+        
+        # Воркеры очереди стартуют только теперь: события, оставшиеся с прошлого
+        # запуска, иначе обработались бы без бота и были бы помечены done
+        if Config.WEBHOOK_PORT > 0:
+            # Имя врача сохраняется в записи при обработке события, поэтому ждём
+            # первую загрузку справочника (не дольше STAFF_DIRECTORY_LOAD_TIMEOUT)
+            await asyncio.to_thread(staff_directory_load.join, Config.STAFF_DIRECTORY_LOAD_TIMEOUT)
+            if not staff_directory.loaded:
+                logger.warning("Справочник сотрудников не загружен, вебхуки обрабатываются без имён врачей")
+            await asyncio.to_thread(get_webhook_queue().start)
+    
+    async def post_stop(application: Application):
+        # Воркеры ждут event loop (loop_bridge), поэтому останавливаем их, пока он работает
+        if Config.WEBHOOK_PORT > 0:
+            await asyncio.to_thread(get_webhook_queue().stop)
+        # Бот ещё может отправлять сообщения: дожидаемся очереди исходящих
+        await outbound_dispatcher.stop()
+    
+    async def post_shutdown(application: Application):
+        loop_bridge.detach()
+    
     # Создание приложения
-    application = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(Config.TELEGRAM_BOT_TOKEN)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Сохраняем ID администраторов для уведомлений об ошибках
     application.bot_data['admin_ids'] = Config.TELEGRAM_ADMIN_IDS
     application.bot_data['scheduler'] = scheduler_service
     
-    # Устанавливаем бота и планировщик для обработчиков вебхуков
-    # Используем initialize callback для доступа к боту
-    async def initialize(application: Application):
-        bot = application.bot
-        set_bot_application(bot, scheduler_service)
-        logger.info("Бот и планировщик установлены для обработчиков вебхуков")
-    
-    application.initialize = initialize
-    
     # Регистрация handlers
     application.add_handler(CommandHandler("start", start_handler))
     application.add_handler(CommandHandler("help", help_handler))
     application.add_handler(CommandHandler("menu", menu_handler))
+    application.add_handler(CommandHandler("stats", stats_handler))
     
     # Обработчики callback-кнопок
-    application.add_handler(CallbackQueryHandler(reminder_callback_handler, pattern="^reminder_"))
-    application.add_handler(CallbackQueryHandler(survey_callback_handler, pattern="^survey_"))
+    application.add_handler(CallbackQueryHandler(reminder_callback_handler, pattern=r"^(reminder_|rm:)"))
+    application.add_handler(CallbackQueryHandler(survey_callback_handler, pattern=r"^(survey_|sv:)"))
     
     # Обработчики меню
     from telegram.ext import MessageHandler, filters
@@ -89,24 +158,30 @@ def main():
     # Глобальный обработчик ошибок
     application.add_error_handler(error_handler)
     
-    # Запуск вебхук-сервера в отдельном потоке (если нужен)
+    # Обработка вебхуков: воркеры очереди работают в процессе бота в обоих режимах
+    # (запускаются в post_init), сервер запускается здесь только в режиме embedded
+    # (иначе - gunicorn bot.wsgi:app); принятые до старта воркеров события ждут в БД
     if Config.WEBHOOK_PORT > 0:
-        webhook_thread = threading.Thread(
-            target=run_webhook_server,
-            daemon=True,
-            name="WebhookServer"
-        )
-        webhook_thread.start()
-        logger.info(f"Вебхук-сервер запущен на порту {Config.WEBHOOK_PORT}")
+        if Config.WEBHOOK_SERVER_MODE == 'embedded':
+            start_webhook_server()
+            logger.info(f"Вебхук-сервер запущен на порту {Config.WEBHOOK_PORT}")
+        else:
+            logger.info("Вебхуки принимает внешний сервер, события читаются из БД")
     
     # Запуск бота
-    logger.info("Бот запускается...")
+    logger.info(f"Бот запускается (режим {Config.TELEGRAM_UPDATE_MODE})...")
     try:
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if Config.TELEGRAM_UPDATE_MODE == 'webhook':
+            # Тот же event loop, к которому привязан AsyncIOScheduler (как в run_polling)
+            asyncio.get_event_loop().run_until_complete(run_webhook_mode(application))
+        else:
+            application.run_polling(allowed_updates=ALLOWED_UPDATES)
     except KeyboardInterrupt:
         logger.info("Получен сигнал остановки")
     finally:
+        stop_webhook_server()
         scheduler_service.shutdown()
+        interaction_recorder.stop()
         logger.info("Бот остановлен")
 
 
@@ -4,7 +4,14 @@
 from bot.models.user import User
 from bot.models.appointment import Appointment
 from bot.models.survey import Survey
-from bot.models.statistics import InteractionLog
+from bot.models.statistics import InteractionLog, StatsDaily, StatsHourly
+from bot.models.webhook_event import WebhookEvent
+from bot.models.scheduler_lease import SchedulerLease
+from bot.models.sync_state import SyncState
+from bot.models.message_template import MessageTemplate
 
-__all__ = ["User", "Appointment", "Survey", "InteractionLog"]
+__all__ = [
+    "User", "Appointment", "Survey", "InteractionLog", "StatsHourly", "StatsDaily",
+    "WebhookEvent", "SchedulerLease", "SyncState", "MessageTemplate"
+]
 
@@ -1,7 +1,7 @@
 """
 Модель записи клиента
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from bot.database import Base
@@ -10,11 +10,22 @@ from bot.database import Base
 class Appointment(Base):
     """Модель записи клиента"""
     __tablename__ = "appointments"
+    __table_args__ = (
+        # Обход подошедших напоминаний: reminder_sent = false и диапазон по дате
+        Index("ix_appointments_reminder_due", "reminder_sent", "appointment_date"),
+        Index("ix_appointments_appointment_date", "appointment_date"),
+        # Ответ на напоминание: последняя неподтверждённая запись пользователя
+        Index("ix_appointments_user_reminder", "user_id", "reminder_sent", "reminder_confirmed", "appointment_date"),
+        # Ответ на опрос: последняя прошедшая запись пользователя
+        Index("ix_appointments_user_date", "user_id", "appointment_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     bitrix24_deal_id = Column(Integer, unique=True, index=True, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     phone_number = Column(String, nullable=True, index=True)
+    phone_e164 = Column(String, nullable=True, index=True)  # Канонический номер (+79991234567) для поиска
+    phone_hash = Column(String, nullable=True, index=True)  # Ключевой хэш номера для ссылок привязки
     
     # Данные о записи
     appointment_date = Column(DateTime, nullable=False)
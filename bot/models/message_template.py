@@ -0,0 +1,15 @@
+"""
+Модель переопределённых шаблонов сообщений
+"""
+from sqlalchemy import Column, String, DateTime, Text
+from datetime import datetime
+from bot.database import Base
+
+
+class MessageTemplate(Base):
+    """Текст шаблона Jinja2, заменяющий встроенный файл bot/templates/messages/<name>.j2"""
+    __tablename__ = "message_templates"
+    
+    name = Column(String, primary_key=True)  # appointment_notification, reminder_24h, ...
+    body = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,16 @@
+"""
+Модель аренды (lease) для выбора ведущего экземпляра бота
+"""
+from sqlalchemy import Column, String, DateTime
+from datetime import datetime
+from bot.database import Base
+
+
+class SchedulerLease(Base):
+    """Аренда роли: ей владеет один экземпляр, пока продлевает её до expires_at"""
+    __tablename__ = "scheduler_leases"
+    
+    name = Column(String, primary_key=True)  # Название роли (scheduler)
+    holder = Column(String, nullable=False)  # ID экземпляра: хост:pid:случайный суффикс
+    expires_at = Column(DateTime, nullable=False)
+    renewed_at = Column(DateTime, default=datetime.utcnow)
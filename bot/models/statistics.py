@@ -1,7 +1,7 @@
 """
 Модель для хранения статистики взаимодействий
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import Column, Integer, String, Date, DateTime, Text, Index
 from datetime import datetime
 from bot.database import Base
 
@@ -15,5 +15,35 @@ class InteractionLog(Base):
     interaction_type = Column(String, nullable=False, index=True)  # notification, reminder, survey, etc.
     interaction_data = Column(Text, nullable=True)  # JSON данные о взаимодействии
     status = Column(String, nullable=False)  # sent, delivered, read, failed
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # В PostgreSQL - ключ секционирования по месяцам
 
+
+class _RollupColumns:
+    """Общие колонки агрегатов InteractionLog"""
+    id = Column(Integer, primary_key=True)
+    interaction_type = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    procedure_name = Column(String, nullable=False, default='')  # '' - процедура неизвестна
+    count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)  # сумма оценок (для survey_answer)
+    rating_count = Column(Integer, nullable=False, default=0)
+
+
+class StatsHourly(_RollupColumns, Base):
+    """Почасовые агрегаты взаимодействий (обновляются задачей update_stats_rollups)"""
+    __tablename__ = "stats_hourly"
+    __table_args__ = (
+        Index("uq_stats_hourly_key", "bucket", "interaction_type", "status", "procedure_name", unique=True),
+    )
+    
+    bucket = Column(DateTime, nullable=False)  # начало часа (UTC)
+
+
+class StatsDaily(_RollupColumns, Base):
+    """Дневные агрегаты взаимодействий (отвечают на /stats)"""
+    __tablename__ = "stats_daily"
+    __table_args__ = (
+        Index("uq_stats_daily_key", "bucket", "interaction_type", "status", "procedure_name", unique=True),
+    )
+    
+    bucket = Column(Date, nullable=False)  # день (UTC)
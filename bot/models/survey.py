@@ -1,7 +1,7 @@
 """
 Модель опроса клиента
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from bot.database import Base
@@ -10,6 +10,10 @@ from bot.database import Base
 class Survey(Base):
     """Модель опроса удовлетворенности"""
     __tablename__ = "surveys"
+    __table_args__ = (
+        # Один опрос на запись (захват перед отправкой), поиск опроса по записи
+        Index("uq_surveys_appointment_id", "appointment_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     appointment_id = Column(Integer, ForeignKey("appointments.id"), nullable=False)
@@ -0,0 +1,15 @@
+"""
+Модель состояния синхронизации с внешними системами
+"""
+from sqlalchemy import Column, String, DateTime
+from datetime import datetime
+from bot.database import Base
+
+
+class SyncState(Base):
+    """Отметка (high-water mark), с которой продолжается инкрементальная синхронизация"""
+    __tablename__ = "sync_state"
+    
+    name = Column(String, primary_key=True)  # Название синхронизации (deals)
+    watermark = Column(String, nullable=True)  # Например, максимальный DATE_MODIFY сделки
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
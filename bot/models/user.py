@@ -17,6 +17,7 @@ class User(Base):
     first_name = Column(String, nullable=True)
     last_name = Column(String, nullable=True)
     phone_number = Column(String, nullable=True, index=True)
+    phone_e164 = Column(String, nullable=True, index=True)  # Канонический номер (+79991234567) для поиска
     phone_hash = Column(String, nullable=True, index=True)  # Для персонализированных ссылок
     linked_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
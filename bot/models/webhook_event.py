@@ -0,0 +1,34 @@
+"""
+Модель очереди входящих вебхуков Битрикс24
+"""
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
+from datetime import datetime
+from bot.database import Base
+
+
+class WebhookEvent(Base):
+    """Входящее событие Битрикс24, ожидающее обработки воркером"""
+    __tablename__ = "webhook_events"
+    __table_args__ = (
+        # Дозагрузка готовых к обработке событий и подсчёт очереди
+        Index("ix_webhook_events_status_available", "status", "available_at"),
+        Index("uq_webhook_events_dedup_key", "dedup_key", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    event = Column(String, nullable=False)  # ONCRMDEALADD, ONCRMDEALUPDATE
+    payload = Column(Text, nullable=False)  # JSON тела вебхука
+    deal_id = Column(Integer, nullable=True, index=True)  # ID сделки (для объединения обновлений)
+    dedup_key = Column(String, nullable=True)  # событие:ID:ts - защита от повторной доставки
+    coalesced = Column(Integer, nullable=False, default=0)  # Сколько обновлений объединено с событием
+    
+    # Состояние обработки
+    status = Column(String, nullable=False, default='pending', index=True)  # pending, processing, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, default=datetime.utcnow)  # Не обрабатывать раньше (для повторов)
+    locked_at = Column(DateTime, nullable=True)  # Когда воркер взял событие в работу
+    last_error = Column(Text, nullable=True)
+    
+    # Метаданные
+    created_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
@@ -0,0 +1,117 @@
+"""
+Привязка Telegram-аккаунта к пациенту по ссылке t.me/<бот>?start=phone_<хэш>
+
+Хэш ищется по индексу appointments.phone_hash (без запросов к Битрикс24),
+после чего все записи этого номера одним UPDATE привязываются к пользователю.
+"""
+import logging
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from bot.database import AsyncSessionLocal
+from bot.models import Appointment, User
+from bot.services.identity_cache import identity_cache
+from bot.utils.phone import is_valid_phone_hash
+
+logger = logging.getLogger(__name__)
+
+
+class LinkResult(NamedTuple):
+    """Результат привязки"""
+    user_id: int
+    phone_e164: str
+    linked_appointments: int
+    # Будущие записи без отправленного напоминания: (id, дата)
+    pending: List[Tuple[int, datetime]]
+
+
+async def link_account(tg_user, phone_hash: str, session_factory=AsyncSessionLocal) -> Optional[LinkResult]:
+    """
+    Привязка пользователя Telegram к номеру телефона из ссылки
+    
+    Args:
+        tg_user: telegram.User (id, username, first_name, last_name)
+        phone_hash: Хэш номера из start-параметра
+        session_factory: Фабрика асинхронных сессий
+    
+    Returns:
+        LinkResult или None, если ссылка недействительна или привязка не удалась
+    """
+    if not is_valid_phone_hash(phone_hash):
+        return None
+    
+    db = session_factory()
+    
+    try:
+        source = (await db.execute(
+            select(Appointment.phone_number, Appointment.phone_e164)
+            .where(Appointment.phone_hash == phone_hash)
+            .limit(1)
+        )).first()
+        if not source:
+            logger.info(f"Ссылка привязки phone_{phone_hash} не соответствует ни одной записи")
+            return None
+        
+        user = await db.scalar(select(User).where(User.telegram_id == tg_user.id))
+        if user is None:
+            user = User(telegram_id=tg_user.id)
+            db.add(user)
+        
+        previous_phone = user.phone_e164
+        user.username = tg_user.username
+        user.first_name = tg_user.first_name
+        user.last_name = tg_user.last_name
+        user.phone_number = source.phone_number
+        user.phone_e164 = source.phone_e164
+        user.phone_hash = phone_hash
+        user.linked_at = datetime.utcnow()
+        user.is_active = True
+        await db.flush()
+        user_id = user.id
+        
+        # Все записи этого номера - одним UPDATE по индексу phone_e164
+        result = await db.execute(
+            update(Appointment)
+            .where(
+                Appointment.phone_e164 == source.phone_e164,
+                or_(Appointment.user_id == None, Appointment.user_id != user_id)
+            )
+            .values(user_id=user_id)
+            .execution_options(synchronize_session=False)
+        )
+        
+        pending = (await db.execute(
+            select(Appointment.id, Appointment.appointment_date).where(
+                Appointment.user_id == user_id,
+                Appointment.reminder_sent == False,
+                Appointment.appointment_date > datetime.now()
+            ).order_by(Appointment.appointment_date)
+        )).all()
+        
+        await db.commit()
+    
+    except IntegrityError:
+        # Тот же пользователь одновременно нажал /start ещё раз
+        await db.rollback()
+        logger.info(f"Привязка пользователя {tg_user.id} уже выполняется")
+        return None
+    
+    except Exception as e:
+        logger.error(f"Ошибка привязки пользователя {tg_user.id}: {e}", exc_info=True)
+        await db.rollback()
+        return None
+    
+    finally:
+        await db.close()
+    
+    identity_cache.invalidate(telegram_id=tg_user.id, phone=previous_phone)
+    identity_cache.remember(user_id, tg_user.id, source.phone_e164)
+    
+    logger.info(
+        f"Пользователь {tg_user.id} привязан к номеру {source.phone_e164}: "
+        f"записей {result.rowcount}, ожидают напоминания {len(pending)}"
+    )
+    return LinkResult(user_id, source.phone_e164, result.rowcount, [tuple(row) for row in pending])
@@ -1,13 +1,113 @@
 """
 Сервис интеграции с Битрикс24
 """
+import asyncio
 import logging
+import random
+import threading
+import time
+import urllib.parse
 import requests
-from typing import Dict, Optional, List
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, Iterator, Optional, List, Tuple
 from bot.config import Config
+from bot.utils.rate_limit import TokenBucket
+from bot.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Ошибки Битрикс24, после которых запрос имеет смысл повторить
+RETRYABLE_ERRORS = {'QUERY_LIMIT_EXCEEDED', 'OPERATION_TIME_LIMIT', 'INTERNAL_SERVER_ERROR'}
+
+# Максимум команд в одном вызове batch
+BATCH_MAX_COMMANDS = 50
+
+# Размер страницы списочных методов
+LIST_PAGE_SIZE = 50
+
+
+def build_query(params: Dict) -> str:
+    """
+    Кодирование параметров в строку запроса в формате PHP http_build_query
+    (так Битрикс24 ожидает параметры команд внутри batch)
+    
+    Пример: {'id': 1, 'fields': {'TITLE': 'A'}} -> 'id=1&fields%5BTITLE%5D=A'
+    """
+    pairs = []
+    
+    def walk(value, key):
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                walk(sub_value, f"{key}[{sub_key}]" if key else str(sub_key))
+        elif isinstance(value, (list, tuple)):
+            for index, sub_value in enumerate(value):
+                walk(sub_value, f"{key}[{index}]")
+        elif isinstance(value, bool):
+            pairs.append((key, '1' if value else '0'))
+        else:
+            pairs.append((key, '' if value is None else str(value)))
+    
+    walk(params, '')
+    return urllib.parse.urlencode(pairs)
+
+
+class Bitrix24Batcher:
+    """
+    Объединение одиночных запросов из разных потоков в вызовы batch
+    
+    Команды, пришедшие в течение окна window, отправляются одним запросом
+    (до 50 команд), результаты раздаются вызывающим через Future.
+    """
+    
+    def __init__(self, client: 'Bitrix24Client', window: float):
+        self.client = client
+        self.window = window
+        self._pending: List[Tuple[str, Dict, Future]] = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self.commands = 0
+        self.batches = 0
+    
+    def submit(self, method: str, params: Dict) -> Future:
+        """Постановка команды в ближайший batch"""
+        future = Future()
+        with self._condition:
+            self._pending.append((method, params, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="Bitrix24Batcher")
+                self._thread.start()
+            self._condition.notify()
+        return future
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                
+                # Собираем команды в течение окна или до заполнения batch
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < BATCH_MAX_COMMANDS:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                
+                chunk = self._pending[:BATCH_MAX_COMMANDS]
+                del self._pending[:BATCH_MAX_COMMANDS]
+            
+            try:
+                results = self.client.batch_call([(method, params) for method, params, _ in chunk])
+            except Exception as e:
+                logger.error(f"Ошибка выполнения batch Битрикс24: {e}", exc_info=True)
+                results = [None] * len(chunk)
+            
+            self.commands += len(chunk)
+            self.batches += 1
+            for (_, _, future), result in zip(chunk, results):
+                future.set_result(result)
+
 
 class Bitrix24Client:
     """Клиент для работы с Битрикс24 REST API"""
@@ -18,61 +118,271 @@ class Bitrix24Client:
         
         if not self.webhook_url:
             raise ValueError("BITRIX24_WEBHOOK_URL не настроен")
+        
+        self.timeout = Config.BITRIX24_TIMEOUT
+        self.max_retries = Config.BITRIX24_MAX_RETRIES
+        self.backoff = Config.BITRIX24_BACKOFF
+        
+        # Пул keep-alive соединений, общий для всех потоков
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.BITRIX24_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        # Лимит Битрикс24 - "дырявое ведро": 2 запроса/с, запас 50 запросов
+        self.rate_limiter = TokenBucket(Config.BITRIX24_RATE_LIMIT, capacity=Config.BITRIX24_RATE_BURST)
+        
+        # Потоки для асинхронных вызовов из обработчиков бота
+        self._executor = ThreadPoolExecutor(
+            max_workers=Config.BITRIX24_POOL_SIZE,
+            thread_name_prefix='Bitrix24'
+        )
+        
+        # Объединение одиночных get/update в batch
+        self.batcher = Bitrix24Batcher(self, Config.BITRIX24_BATCH_WINDOW) if Config.BITRIX24_BATCH_ENABLED else None
+        
+        # Кэш сделок и контактов (сделка сбрасывается при вебхуке обновления)
+        self.deal_cache = TTLCache(Config.BITRIX24_CACHE_SIZE, Config.BITRIX24_DEAL_CACHE_TTL)
+        self.contact_cache = TTLCache(Config.BITRIX24_CACHE_SIZE, Config.BITRIX24_CONTACT_CACHE_TTL)
+        
+        self.requests_count = 0
+        self.retries_count = 0
     
-    def _make_request(self, method: str, params: Dict = None) -> Optional[Dict]:
+    def _call(self, method: str, params: Dict = None) -> Optional[Dict]:
         """
-        Выполнение запроса к Битрикс24 API
+        Выполнение запроса к Битрикс24 API с повторами
+        
+        Повторяются сетевые ошибки, ответы 5xx и превышение лимита запросов
+        (QUERY_LIMIT_EXCEEDED) с экспоненциальной задержкой.
         
         Args:
             method: Метод API (например, 'crm.deal.get')
             params: Параметры запроса
-            
+        
         Returns:
-            Ответ API или None в случае ошибки
+            Полный ответ API (result, next, total, ...) или None в случае ошибки
         """
         if params is None:
             params = {}
         
         url = f"{self.webhook_url}{method}"
+        error = None
         
-        try:
-            response = requests.post(url, json=params, timeout=10)
-            response.raise_for_status()
-            result = response.json()
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries_count += 1
+                delay = self.backoff * (2 ** (attempt - 1)) * (1 + random.random() / 2)
+                logger.warning(f"Повтор запроса {method} через {delay:.1f} с ({error})")
+                time.sleep(delay)
+            
+            self.rate_limiter.acquire()
+            self.requests_count += 1
+            
+            try:
+                response = self.session.post(url, json=params, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                error = str(e)
+                continue
             
-            if 'error' in result:
-                logger.error(f"Ошибка Битрикс24 API: {result['error']}")
+            try:
+                result = response.json()
+            except ValueError:
+                result = {}
+            
+            error = result.get('error')
+            
+            if error == 'QUERY_LIMIT_EXCEEDED':
+                # Ведро на стороне Битрикс24 переполнено - притормаживаем все потоки
+                self.rate_limiter.penalize(1 / Config.BITRIX24_RATE_LIMIT)
+            
+            if response.status_code >= 500 or error in RETRYABLE_ERRORS:
+                error = error or f"HTTP {response.status_code}"
+                continue
+            
+            if error or response.status_code >= 400:
+                logger.error(f"Ошибка Битрикс24 API: {error or response.status_code}")
                 return None
             
-            return result.get('result')
+            return result
+        
+        logger.error(f"Ошибка запроса к Битрикс24 {method} после {self.max_retries + 1} попыток: {error}")
+        return None
+    
+    def _make_request(self, method: str, params: Dict = None) -> Optional[Dict]:
+        """
+        Выполнение запроса к Битрикс24 API
+        
+        Args:
+            method: Метод API (например, 'crm.deal.get')
+            params: Параметры запроса
+        
+        Returns:
+            Ответ API или None в случае ошибки
+        """
+        result = self._call(method, params)
+        return result.get('result') if result is not None else None
+    
+    def _request(self, method: str, params: Dict) -> Optional[Any]:
+        """
+        Одиночная команда: через batcher (если включён) или отдельным запросом
+        
+        Returns:
+            Результат команды или None в случае ошибки
+        """
+        if self.batcher is None:
+            return self._make_request(method, params)
         
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Ошибка запроса к Битрикс24: {e}")
+        # Ожидание с запасом на окно сборки и повторы самого batch
+        timeout = self.timeout * (self.max_retries + 2) + self.batcher.window
+        try:
+            return self.batcher.submit(method, params).result(timeout=timeout)
+        except FutureTimeoutError:
+            logger.error(f"Не дождались выполнения {method} в batch за {timeout:.0f} с")
             return None
     
-    def get_deal(self, deal_id: int) -> Optional[Dict]:
+    def batch_call(self, commands: List[Tuple[str, Dict]]) -> List[Optional[Any]]:
+        """
+        Выполнение списка команд через метод batch (по 50 команд за запрос)
+        
+        Args:
+            commands: Список пар (метод, параметры)
+        
+        Returns:
+            Результаты в порядке команд (None для команд с ошибкой)
+        """
+        if len(commands) == 1:
+            method, params = commands[0]
+            return [self._make_request(method, params)]
+        
+        results = []
+        for offset in range(0, len(commands), BATCH_MAX_COMMANDS):
+            chunk = commands[offset:offset + BATCH_MAX_COMMANDS]
+            cmd = {
+                f"c{index}": f"{method}?{build_query(params)}"
+                for index, (method, params) in enumerate(chunk)
+            }
+            
+            response = self._make_request('batch', {'halt': 0, 'cmd': cmd})
+            if response is None:
+                results.extend([None] * len(chunk))
+                continue
+            
+            command_results = response.get('result') or {}
+            command_errors = response.get('result_error') or {}
+            for key in cmd:
+                if key in command_errors:
+                    logger.error(f"Ошибка команды batch {cmd[key].split('?')[0]}: {command_errors[key]}")
+                # Пустой результат batch приходит списком, а не словарём
+                results.append(command_results.get(key) if isinstance(command_results, dict) else None)
+        
+        return results
+    
+    def get_deals(self, deal_ids: List[int]) -> Dict[int, Optional[Dict]]:
+        """
+        Получение нескольких сделок через batch
+        
+        Args:
+            deal_ids: ID сделок
+        
+        Returns:
+            Словарь {ID сделки: данные или None}
+        """
+        results = self.batch_call([('crm.deal.get', {'id': deal_id}) for deal_id in deal_ids])
+        return dict(zip(deal_ids, results))
+    
+    def get_contacts(self, contact_ids: List[int]) -> Dict[int, Optional[Dict]]:
+        """
+        Получение нескольких контактов через batch
+        
+        Args:
+            contact_ids: ID контактов
+        
+        Returns:
+            Словарь {ID контакта: данные или None}
+        """
+        results = self.batch_call([('crm.contact.get', {'id': contact_id}) for contact_id in contact_ids])
+        return dict(zip(contact_ids, results))
+    
+    def update_deals(self, updates: Dict[int, Dict]) -> Dict[int, bool]:
+        """
+        Обновление нескольких сделок через batch
+        
+        Args:
+            updates: Словарь {ID сделки: поля для обновления}
+        
+        Returns:
+            Словарь {ID сделки: True если успешно}
+        """
+        deal_ids = list(updates)
+        results = self.batch_call([
+            ('crm.deal.update', {'id': deal_id, 'fields': updates[deal_id]})
+            for deal_id in deal_ids
+        ])
+        for deal_id in deal_ids:
+            self.invalidate_deal(deal_id)
+        return {deal_id: result is not None for deal_id, result in zip(deal_ids, results)}
+    
+    def stats(self) -> Dict:
+        """Счётчики запросов к API"""
+        stats = {
+            'requests': self.requests_count,
+            'retries': self.retries_count,
+        }
+        if self.batcher is not None:
+            stats['batched_commands'] = self.batcher.commands
+            stats['batches'] = self.batcher.batches
+        stats['deal_cache'] = self.deal_cache.stats()
+        stats['contact_cache'] = self.contact_cache.stats()
+        return stats
+    
+    def invalidate_deal(self, deal_id: int):
+        """Сброс сделки из кэша (при вебхуке ONCRMDEALUPDATE)"""
+        self.deal_cache.invalidate(int(deal_id))
+    
+    def invalidate_contact(self, contact_id: int):
+        """Сброс контакта из кэша (при вебхуке ONCRMCONTACTUPDATE)"""
+        self.contact_cache.invalidate(int(contact_id))
+    
+    async def _run_async(self, func, *args):
+        """Выполнение синхронного вызова в пуле потоков клиента, не блокируя event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+    
+    def get_deal(self, deal_id: int, use_cache: bool = True) -> Optional[Dict]:
         """
         Получение информации о сделке
         
         Args:
             deal_id: ID сделки в Битрикс24
-            
+            use_cache: Разрешить ответ из кэша
+        
         Returns:
             Данные сделки или None
         """
-        return self._make_request('crm.deal.get', {'id': deal_id})
+        if not use_cache:
+            return self._request('crm.deal.get', {'id': deal_id})
+        return self.deal_cache.get_or_load(
+            int(deal_id),
+            lambda: self._request('crm.deal.get', {'id': deal_id})
+        )
     
-    def get_contact(self, contact_id: int) -> Optional[Dict]:
+    def get_contact(self, contact_id: int, use_cache: bool = True) -> Optional[Dict]:
         """
         Получение информации о контакте
         
         Args:
             contact_id: ID контакта в Битрикс24
-            
+            use_cache: Разрешить ответ из кэша
+        
         Returns:
             Данные контакта или None
         """
-        return self._make_request('crm.contact.get', {'id': contact_id})
+        if not use_cache:
+            return self._request('crm.contact.get', {'id': contact_id})
+        return self.contact_cache.get_or_load(
+            int(contact_id),
+            lambda: self._request('crm.contact.get', {'id': contact_id})
+        )
     
     def update_deal(self, deal_id: int, fields: Dict) -> bool:
         """
@@ -81,14 +391,15 @@ class Bitrix24Client:
         Args:
             deal_id: ID сделки
             fields: Словарь полей для обновления
-            
+        
         Returns:
             True если успешно, False в противном случае
         """
-        result = self._make_request('crm.deal.update', {
+        result = self._request('crm.deal.update', {
             'id': deal_id,
             'fields': fields
         })
+        self.invalidate_deal(deal_id)
         return result is not None
     
     def get_deals_by_phone(self, phone: str) -> List[Dict]:
@@ -97,7 +408,7 @@ class Bitrix24Client:
         
         Args:
             phone: Номер телефона (в любом формате)
-            
+        
         Returns:
             Список сделок
         """
@@ -111,4 +422,106 @@ class Bitrix24Client:
         })
         
         return result if result else []
+    
+    def iter_list(self, method: str, params: Dict = None) -> Iterator[List[Dict]]:
+        """
+        Постраничный обход списочного метода (crm.*.list, user.get)
+        
+        Страницы запрашиваются по курсору start/next и отдаются по мере
+        получения, без загрузки всего списка в память.
+        
+        Args:
+            method: Списочный метод API
+            params: Параметры (filter, select, order)
+        
+        Yields:
+            Страницы результатов (до 50 элементов)
+        """
+        params = dict(params or {})
+        start = 0
+        
+        while True:
+            params['start'] = start
+            response = self._call(method, params)
+            if response is None:
+                raise RuntimeError(f"Не удалось получить страницу {method} (start={start})")
+            
+            page = response.get('result') or []
+            if page:
+                yield page
+            
+            start = response.get('next')
+            if not start:
+                break
+    
+    def iter_list_by_id(self, method: str, params: Dict = None, pages_per_call: int = BATCH_MAX_COMMANDS) -> Iterator[List[Dict]]:
+        """
+        Быстрый обход больших списков по ключу ID
+        
+        Вместо курсора start используется фильтр >ID и start=-1: Битрикс24 не
+        считает total на каждой странице, и запрос не замедляется к концу списка.
+        За один вызов batch запрашивается до pages_per_call страниц подряд:
+        каждая следующая команда берёт ID последнего элемента предыдущей
+        через ссылку $result[...].
+        
+        Args:
+            method: Списочный метод API (crm.deal.list, crm.contact.list)
+            params: Параметры (filter, select); order задаётся по ID
+            pages_per_call: Страниц на один HTTP-запрос (1 - без batch)
+        
+        Yields:
+            Страницы результатов по LIST_PAGE_SIZE элементов (последняя короче)
+        """
+        params = dict(params or {})
+        base_filter = dict(params.pop('filter', None) or {})
+        params.update({'order': {'ID': 'ASC'}, 'start': -1})
+        last_id = 0
+        
+        while True:
+            commands = []
+            for index in range(max(1, min(pages_per_call, BATCH_MAX_COMMANDS))):
+                cursor = last_id if index == 0 else f"$result[c{index - 1}][{LIST_PAGE_SIZE - 1}][ID]"
+                commands.append((method, {**params, 'filter': {**base_filter, '>ID': cursor}}))
+            
+            for page in self.batch_call(commands):
+                if page is None:
+                    # Предыдущая страница была полной, значит это ошибка, а не конец списка
+                    raise RuntimeError(f"Не удалось получить страницу {method} (>ID {last_id})")
+                if page:
+                    yield page
+                    last_id = int(page[-1]['ID'])
+                if len(page) < LIST_PAGE_SIZE:
+                    return
+    
+    async def get_deal_async(self, deal_id: int) -> Optional[Dict]:
+        """Асинхронный вариант get_deal для обработчиков бота"""
+        return await self._run_async(self.get_deal, deal_id)
+    
+    async def get_contact_async(self, contact_id: int) -> Optional[Dict]:
+        """Асинхронный вариант get_contact для обработчиков бота"""
+        return await self._run_async(self.get_contact, contact_id)
+    
+    async def update_deal_async(self, deal_id: int, fields: Dict) -> bool:
+        """Асинхронный вариант update_deal для обработчиков бота"""
+        return await self._run_async(self.update_deal, deal_id, fields)
+    
+    async def get_deals_by_phone_async(self, phone: str) -> List[Dict]:
+        """Асинхронный вариант get_deals_by_phone для обработчиков бота"""
+        return await self._run_async(self.get_deals_by_phone, phone)
+
+
+# Ленивая инициализация общего клиента (один пул соединений на процесс)
+_bitrix_client = None
+
+
+def get_bitrix_client() -> Bitrix24Client:
+    """Получение экземпляра клиента Битрикс24 (создаём при первом вызове)"""
+    global _bitrix_client
+    if _bitrix_client is None:
+        _bitrix_client = Bitrix24Client()
+    return _bitrix_client
+
 
+def get_bitrix_stats() -> Dict:
+    """Счётчики клиента Битрикс24 (пусто, если клиент ещё не создавался)"""
+    return _bitrix_client.stats() if _bitrix_client is not None else {}
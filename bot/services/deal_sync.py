@@ -0,0 +1,322 @@
+"""
+Сверка записей с Битрикс24 (crm.deal.list)
+
+Вебхуки - основной источник записей, но если вебхук-сервер был недоступен,
+сделки теряются. Сверка постранично читает сделки (по ключу ID, пачками
+страниц через batch), сравнивает их с таблицей appointments в памяти по
+bitrix24_deal_id и записывает изменения bulk INSERT / UPDATE. Инкрементальный
+запуск начинается с сохранённого максимального DATE_MODIFY (SyncState).
+
+Для созданных записей вызывается on_created - как и в обработчике вебхука,
+для них планируются напоминания и опросы (режим jobs).
+"""
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, select, update
+
+from bot.config import Config
+from bot.database import SessionLocal
+from bot.models import Appointment, SyncState, User
+from bot.services.bitrix24 import get_bitrix_client
+from bot.services.retention import appointment_retention_cutoff
+from bot.services.staff_directory import resolve_doctor_name
+from bot.utils.phone import normalize_phone, phone_hash, phone_values
+
+logger = logging.getLogger(__name__)
+
+SYNC_NAME = 'deals'
+
+# Поля сделки, нужные для записи
+DEAL_SELECT = [
+    'ID', 'TITLE', 'DATE_MODIFY', 'BEGINDATE', 'ASSIGNED_BY_ID', 'PHONE',
+    'UF_CRM_APPOINTMENT_DATE', 'UF_CRM_PROCEDURE_NAME',
+]
+
+# Поля записи, которые сверяются со сделкой
+SYNC_FIELDS = ('appointment_date', 'phone_number', 'phone_e164', 'phone_hash', 'procedure_name', 'doctor_name')
+
+
+def parse_deal_date(value: str) -> datetime:
+    """
+    Дата записи из сделки (ISO 8601 или 'YYYY-MM-DD HH:MM:SS')
+    
+    Часовой пояс отбрасывается: в БД хранится местное время клиники.
+    
+    Raises:
+        ValueError: если формат не распознан
+    """
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        # Альтернативный формат
+        parsed = datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    return parsed.replace(tzinfo=None)
+
+
+def extract_appointment_fields(deal: Dict) -> Optional[Dict]:
+    """
+    Поля записи из сделки Битрикс24 (общие для вебхуков и сверки)
+    
+    Returns:
+        Словарь с полями SYNC_FIELDS или None, если у сделки нет даты записи
+    
+    Raises:
+        ValueError: если дата записи в неизвестном формате
+    """
+    appointment_date_str = deal.get('BEGINDATE') or deal.get('UF_CRM_APPOINTMENT_DATE')
+    if not appointment_date_str:
+        return None
+    
+    # PHONE - мультиполе: [{'VALUE': ..., 'VALUE_TYPE': ...}]
+    phones = phone_values(deal.get('PHONE'))
+    phone_number = phones[0] if phones else None
+    phone_e164 = normalize_phone(phone_number)
+    
+    return {
+        'appointment_date': parse_deal_date(appointment_date_str),
+        'phone_number': phone_number,
+        'phone_e164': phone_e164,
+        'phone_hash': phone_hash(phone_e164),
+        'procedure_name': deal.get('TITLE') or deal.get('UF_CRM_PROCEDURE_NAME'),
+        'doctor_name': resolve_doctor_name(deal),
+    }
+
+
+def _parse_watermark(value: Optional[str]) -> Optional[datetime]:
+    """DATE_MODIFY в datetime (без часового пояса считается UTC)"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class DealReconciler:
+    """Сверка таблицы appointments со сделками Битрикс24"""
+    
+    def __init__(
+        self,
+        client=None,
+        session_factory=SessionLocal,
+        batch_size: int = None,
+        overlap: int = None,
+        on_created: Callable[[List[Tuple[int, datetime]]], int] = None
+    ):
+        """
+        Args:
+            client: Клиент Битрикс24 (по умолчанию общий)
+            session_factory: Фабрика сессий БД
+            batch_size: Сделок на одну запись в БД
+            overlap: Запас (секунды) назад от сохранённого DATE_MODIFY
+            on_created: Вызывается после записи пачки с парами (appointment_id,
+                        appointment_date) созданных записей; возвращает число
+                        запланированных (например, schedule_pending_reminders)
+        """
+        self._client = client
+        self.on_created = on_created
+        self.session_factory = session_factory
+        self.batch_size = batch_size or Config.RECONCILE_BATCH_SIZE
+        self.overlap = Config.RECONCILE_OVERLAP if overlap is None else overlap
+    
+    @property
+    def client(self):
+        return self._client or get_bitrix_client()
+    
+    def get_watermark(self) -> Optional[str]:
+        """Сохранённый максимальный DATE_MODIFY"""
+        db = self.session_factory()
+        try:
+            state = db.get(SyncState, SYNC_NAME)
+            return state.watermark if state else None
+        finally:
+            db.close()
+    
+    def _save_watermark(self, watermark: str):
+        db = self.session_factory()
+        try:
+            state = db.get(SyncState, SYNC_NAME)
+            if state is None:
+                db.add(SyncState(name=SYNC_NAME, watermark=watermark))
+            else:
+                state.watermark = watermark
+            db.commit()
+        finally:
+            db.close()
+    
+    def _deal_filter(self, since: Optional[str]) -> Dict:
+        """Фильтр по DATE_MODIFY с запасом на сделки, изменённые во время прошлой сверки"""
+        since_dt = _parse_watermark(since)
+        if since_dt is None:
+            return {}
+        return {'>=DATE_MODIFY': (since_dt - timedelta(seconds=self.overlap)).isoformat()}
+    
+    def _iter_deals(self, since: Optional[str]) -> Iterable[List[Dict]]:
+        params = {'filter': self._deal_filter(since), 'select': DEAL_SELECT + (
+            [Config.BITRIX24_DOCTOR_FIELD] if Config.BITRIX24_DOCTOR_FIELD else []
+        )}
+        return self.client.iter_list_by_id('crm.deal.list', params)
+    
+    def _insert_ignoring_conflicts(self, db, rows: List[Dict]) -> List[Tuple[int, datetime]]:
+        """
+        INSERT, пропускающий сделки, которые успел сохранить обработчик вебхука
+        
+        Returns:
+            Пары (appointment_id, appointment_date) действительно созданных записей
+        """
+        table = Appointment.__table__
+        dialect = db.get_bind().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            db.execute(insert(table), rows)
+            return [tuple(row) for row in db.execute(
+                select(table.c.id, table.c.appointment_date).where(
+                    table.c.bitrix24_deal_id.in_([row['bitrix24_deal_id'] for row in rows])
+                )
+            )]
+        
+        statement = dialect_insert(table).on_conflict_do_nothing(
+            index_elements=['bitrix24_deal_id']
+        ).returning(table.c.id, table.c.appointment_date)
+        return [tuple(row) for row in db.execute(statement, rows)]
+    
+    def _apply(self, deals: List[Dict], stats: Dict):
+        """Сравнение пачки сделок с БД и запись изменений"""
+        rows: Dict[int, Dict] = {}
+        for deal in deals:
+            try:
+                fields = extract_appointment_fields(deal)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Сделка {deal.get('ID')}: не удалось разобрать дату записи ({e})")
+                stats['invalid'] += 1
+                continue
+            if fields is None:
+                stats['skipped'] += 1
+                continue
+            rows[int(deal['ID'])] = fields
+        
+        if not rows:
+            return
+        
+        db = self.session_factory()
+        try:
+            existing = {
+                row.bitrix24_deal_id: row
+                for row in db.execute(
+                    select(
+                        Appointment.id, Appointment.bitrix24_deal_id, Appointment.user_id,
+                        *(getattr(Appointment, field) for field in SYNC_FIELDS)
+                    ).where(Appointment.bitrix24_deal_id.in_(list(rows)))
+                )
+            }
+            
+            # Пользователи по номерам всей пачки - одним запросом
+            phones = {fields['phone_e164'] for fields in rows.values() if fields['phone_e164']}
+            users = dict(db.execute(
+                select(User.phone_e164, User.id).where(User.phone_e164.in_(phones))
+            ).all()) if phones else {}
+            
+            now = datetime.utcnow()
+            archived_before = appointment_retention_cutoff(now)
+            inserts, updates = [], []
+            for deal_id, fields in rows.items():
+                user_id = users.get(fields['phone_e164'])
+                row = existing.get(deal_id)
+                
+                if row is None:
+                    # Старые записи уже ушли в архив, полная сверка не должна их возвращать
+                    if archived_before and fields['appointment_date'] < archived_before:
+                        stats['skipped'] += 1
+                        continue
+                    inserts.append({
+                        'bitrix24_deal_id': deal_id,
+                        'user_id': user_id,
+                        'notification_sent': False,
+                        **fields
+                    })
+                    continue
+                
+                changes = {field: value for field, value in fields.items() if getattr(row, field) != value}
+                if row.user_id is None and user_id:
+                    changes['user_id'] = user_id
+                if changes:
+                    updates.append({'id': row.id, 'updated_at': now, **changes})
+                else:
+                    stats['unchanged'] += 1
+            
+            created = self._insert_ignoring_conflicts(db, inserts) if inserts else []
+            if updates:
+                db.execute(update(Appointment), updates)
+            db.commit()
+            
+            stats['created'] += len(created)
+            stats['updated'] += len(updates)
+            if created and self.on_created:
+                stats['scheduled'] += self.on_created(created)
+        
+        except Exception:
+            db.rollback()
+            raise
+        
+        finally:
+            db.close()
+    
+    def run(self, full: bool = False, since: Optional[str] = None) -> Dict:
+        """
+        Сверка сделок
+        
+        Args:
+            full: Сверить все сделки, игнорируя сохранённую отметку
+            since: Явная отметка DATE_MODIFY (ISO 8601) вместо сохранённой
+        
+        Returns:
+            Статистика: страницы, сделки, созданные/обновлённые записи, время
+        """
+        if since is None and not full:
+            since = self.get_watermark()
+        
+        stats = {
+            'since': since, 'pages': 0, 'deals': 0, 'created': 0, 'updated': 0,
+            'unchanged': 0, 'skipped': 0, 'invalid': 0, 'scheduled': 0,
+        }
+        started = time.monotonic()
+        watermark, watermark_dt = since, _parse_watermark(since)
+        buffer: List[Dict] = []
+        
+        for page in self._iter_deals(since):
+            stats['pages'] += 1
+            stats['deals'] += len(page)
+            
+            for deal in page:
+                modified = _parse_watermark(deal.get('DATE_MODIFY'))
+                if modified and (watermark_dt is None or modified > watermark_dt):
+                    watermark, watermark_dt = deal['DATE_MODIFY'], modified
+            
+            buffer.extend(page)
+            if len(buffer) >= self.batch_size:
+                self._apply(buffer, stats)
+                buffer = []
+        
+        if buffer:
+            self._apply(buffer, stats)
+        
+        # Отметка сдвигается только после успешной сверки всех страниц
+        if watermark and watermark != since:
+            self._save_watermark(watermark)
+        
+        stats['watermark'] = watermark
+        stats['elapsed'] = round(time.monotonic() - started, 1)
+        logger.info(f"Сверка сделок с Битрикс24 завершена: {stats}")
+        return stats
+
+
+def reconcile_deals(full: bool = False, since: Optional[str] = None, on_created=None) -> Dict:
+    """Сверка сделок с настройками по умолчанию"""
+    return DealReconciler(on_created=on_created).run(full=full, since=since)
@@ -0,0 +1,194 @@
+"""
+Потоковая выгрузка опросов и записей для аналитики (CSV / JSONL)
+
+Строки читаются серверным курсором (stream_results) порциями по
+EXPORT_CHUNK_SIZE (yield_per) и сразу превращаются в текст генератором,
+поэтому память не зависит от размера выгрузки. Используется командой
+python -m bot.cli export и эндпоинтом /admin/export/<набор>.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import select
+
+from bot.config import Config
+from bot.database import SessionLocal
+from bot.models import Appointment, Survey, User
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Текст копится до такого размера и отдаётся одним куском
+WRITE_BUFFER_SIZE = 64 * 1024
+
+
+def _surveys_query():
+    return select(
+        Survey.id.label('survey_id'),
+        Survey.rating,
+        Survey.sent_at,
+        Survey.answered_at,
+        Survey.yandex_link_sent,
+        Appointment.id.label('appointment_id'),
+        Appointment.bitrix24_deal_id,
+        Appointment.appointment_date,
+        Appointment.procedure_name,
+        Appointment.doctor_name,
+        Appointment.reminder_confirmed,
+        User.id.label('user_id'),
+        User.telegram_id,
+    ).join(Appointment, Survey.appointment_id == Appointment.id).join(User, Survey.user_id == User.id)
+
+
+def _appointments_query():
+    return select(
+        Appointment.id.label('appointment_id'),
+        Appointment.bitrix24_deal_id,
+        Appointment.appointment_date,
+        Appointment.procedure_name,
+        Appointment.doctor_name,
+        Appointment.notification_sent,
+        Appointment.reminder_sent,
+        Appointment.reminder_confirmed,
+        Appointment.reminder_answered_at,
+        Survey.rating,
+        Survey.answered_at.label('survey_answered_at'),
+        Survey.yandex_link_sent,
+        User.id.label('user_id'),
+        User.telegram_id,
+    ).outerjoin(Survey, Survey.appointment_id == Appointment.id).outerjoin(User, Appointment.user_id == User.id)
+
+
+# Набор -> (запрос, колонка фильтра по дате, ключ сортировки)
+DATASETS = {
+    'surveys': (_surveys_query, Survey.sent_at, Survey.id),
+    'appointments': (_appointments_query, Appointment.appointment_date, Appointment.id),
+}
+
+
+def parse_date_bound(value: Optional[str], end: bool = False) -> Optional[datetime]:
+    """
+    Граница периода из ISO 8601 (2026-10-01 или 2026-10-01T12:00)
+    
+    Дата без времени в конце периода включает весь день.
+    
+    Raises:
+        ValueError: если значение не распознано
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.replace(tzinfo=None)
+
+
+def build_export_query(dataset: str, date_from: datetime = None, date_to: datetime = None, procedure: str = None):
+    """
+    Запрос выгрузки с фильтрами
+    
+    Args:
+        dataset: surveys или appointments
+        date_from: Начало периода (включительно)
+        date_to: Конец периода (не включительно)
+        procedure: Название процедуры (точное совпадение)
+    """
+    if dataset not in DATASETS:
+        raise ValueError(f"Неизвестный набор данных: {dataset}")
+    
+    build, date_column, order_column = DATASETS[dataset]
+    query = build()
+    if date_from:
+        query = query.where(date_column >= date_from)
+    if date_to:
+        query = query.where(date_column < date_to)
+    if procedure:
+        query = query.where(Appointment.procedure_name == procedure)
+    return query.order_by(order_column)
+
+
+def iter_export_rows(
+    dataset: str,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    procedure: str = None,
+    session_factory=SessionLocal,
+    chunk_size: int = None
+) -> Iterator[Dict]:
+    """Строки выгрузки, читаемые серверным курсором порциями по chunk_size"""
+    query = build_export_query(dataset, date_from, date_to, procedure)
+    
+    db = session_factory()
+    try:
+        result = db.execute(query.execution_options(
+            stream_results=True, yield_per=chunk_size or Config.EXPORT_CHUNK_SIZE
+        ))
+        for row in result.mappings():
+            yield dict(row)
+    finally:
+        db.close()
+
+
+def _format_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def iter_export_text(rows: Iterator[Dict], fmt: str, columns: List[str]) -> Iterator[str]:
+    """
+    Текст выгрузки кусками примерно по WRITE_BUFFER_SIZE
+    
+    Args:
+        rows: Строки (iter_export_rows)
+        fmt: csv или jsonl
+        columns: Колонки (заголовок CSV)
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+    
+    for row in rows:
+        if writer:
+            writer.writerow(['' if row[column] is None else _format_value(row[column]) for column in columns])
+        else:
+            buffer.write(json.dumps({column: _format_value(row[column]) for column in columns}, ensure_ascii=False))
+            buffer.write('\n')
+        
+        if buffer.tell() >= WRITE_BUFFER_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_export(
+    dataset: str,
+    fmt: str,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    procedure: str = None,
+    session_factory=SessionLocal
+) -> Iterator[str]:
+    """
+    Выгрузка набора данных текстом
+    
+    Набор и формат проверяются сразу (ValueError), а БД читается только
+    при переборе результата.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    columns = list(build_export_query(dataset).selected_columns.keys())
+    rows = iter_export_rows(dataset, date_from, date_to, procedure, session_factory)
+    return iter_export_text(rows, fmt, columns)
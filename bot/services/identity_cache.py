@@ -0,0 +1,139 @@
+"""
+Кэш идентификации пользователей: telegram_id / телефон -> users.id
+
+Нажатия кнопок и новые сделки повторно ищут одних и тех же пациентов,
+поэтому соответствие хранится в ограниченном LRU-кэше (TTLCache). Кэш
+прогревается при запуске и сбрасывается при связывании аккаунта (/start).
+Хранится только id строки: сами объекты User привязаны к сессиям.
+"""
+import logging
+from typing import Optional
+
+from sqlalchemy import select
+
+from bot.config import Config
+from bot.database import AsyncSessionLocal, SessionLocal
+from bot.models import User
+from bot.utils.cache import TTLCache
+from bot.utils.phone import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+
+class IdentityCache:
+    """Соответствие telegram_id и телефона (E.164) пользователя id строки в таблице users"""
+    
+    def __init__(
+        self,
+        maxsize: int = None,
+        ttl: float = None,
+        session_factory=SessionLocal,
+        async_session_factory=AsyncSessionLocal
+    ):
+        """
+        Args:
+            maxsize: Максимум записей на каждый вид ключа
+            ttl: Время жизни записи (секунды)
+            session_factory: Фабрика синхронных сессий (потоки вебхуков)
+            async_session_factory: Фабрика асинхронных сессий (обработчики бота)
+        """
+        self.maxsize = maxsize or Config.IDENTITY_CACHE_SIZE
+        ttl = ttl or Config.IDENTITY_CACHE_TTL
+        self.session_factory = session_factory
+        self.async_session_factory = async_session_factory
+        self.by_telegram = TTLCache(self.maxsize, ttl)
+        self.by_phone = TTLCache(self.maxsize, ttl)
+        self.warmed = 0
+    
+    def remember(self, user_id: int, telegram_id: int = None, phone: str = None):
+        """Сохранение известного соответствия"""
+        if telegram_id is not None:
+            self.by_telegram.set(telegram_id, user_id)
+        key = normalize_phone(phone)
+        if key:
+            self.by_phone.set(key, user_id)
+    
+    def invalidate(self, telegram_id: int = None, phone: str = None):
+        """Сброс записей (при связывании аккаунта или смене телефона)"""
+        if telegram_id is not None:
+            self.by_telegram.invalidate(telegram_id)
+        key = normalize_phone(phone)
+        if key:
+            self.by_phone.invalidate(key)
+    
+    def clear(self):
+        self.by_telegram.clear()
+        self.by_phone.clear()
+    
+    def warm(self) -> int:
+        """
+        Прогрев последними обновлёнными активными пользователями
+        
+        Returns:
+            Количество загруженных пользователей
+        """
+        db = self.session_factory()
+        try:
+            rows = db.execute(
+                select(User.id, User.telegram_id, User.phone_e164)
+                .where(User.is_active == True)
+                .order_by(User.updated_at.desc())
+                .limit(self.maxsize)
+            ).all()
+        except Exception as e:
+            logger.error(f"Не удалось прогреть кэш пользователей: {e}")
+            return 0
+        finally:
+            db.close()
+        
+        # Старые записи первыми, чтобы свежие оказались в конце LRU
+        for user_id, telegram_id, phone in reversed(rows):
+            self.remember(user_id, telegram_id, phone)
+        self.warmed = len(rows)
+        logger.info(f"Кэш пользователей прогрет: {len(rows)} записей")
+        return len(rows)
+    
+    def _load(self, condition) -> Optional[int]:
+        db = self.session_factory()
+        try:
+            return db.scalar(select(User.id).where(condition).limit(1))
+        finally:
+            db.close()
+    
+    async def _load_async(self, condition) -> Optional[int]:
+        async with self.async_session_factory() as db:
+            return await db.scalar(select(User.id).where(condition).limit(1))
+    
+    def user_id_by_telegram(self, telegram_id: int) -> Optional[int]:
+        """ID пользователя по telegram_id (синхронно, для рабочих потоков)"""
+        return self.by_telegram.get_or_load(
+            telegram_id, lambda: self._load(User.telegram_id == telegram_id)
+        )
+    
+    def user_id_by_phone(self, phone: str) -> Optional[int]:
+        """ID пользователя по номеру телефона в любом формате (синхронно, для рабочих потоков)"""
+        key = normalize_phone(phone)
+        if not key:
+            return None
+        return self.by_phone.get_or_load(key, lambda: self._load(User.phone_e164 == key))
+    
+    async def user_id_by_telegram_async(self, telegram_id: int) -> Optional[int]:
+        """ID пользователя по telegram_id (для обработчиков в event loop)"""
+        user_id = self.by_telegram.get(telegram_id)
+        if user_id is None:
+            user_id = await self._load_async(User.telegram_id == telegram_id)
+            if user_id is not None:
+                self.by_telegram.set(telegram_id, user_id)
+        return user_id
+    
+    def stats(self):
+        """Статистика попаданий по видам ключей"""
+        return {
+            'warmed': self.warmed,
+            'telegram_id': self.by_telegram.stats(),
+            'phone': self.by_phone.stats(),
+        }
+
+
+# Общий кэш для обработчиков и обработки сделок
+identity_cache = IdentityCache()
@@ -0,0 +1,215 @@
+"""
+Запись взаимодействий с пользователями в interaction_logs
+
+Обработчики не пишут в БД сами: record() кладёт событие в буфер в памяти
+и сразу возвращается, а фоновый поток сбрасывает буфер одним bulk INSERT
+при наборе INTERACTION_BATCH_SIZE событий или раз в INTERACTION_FLUSH_INTERVAL
+секунд. При переполнении буфера новые события отбрасываются со счётчиком
+dropped - статистика не должна тормозить отправку сообщений.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import insert
+
+from bot.config import Config
+from bot.database import SessionLocal
+from bot.models import InteractionLog
+
+logger = logging.getLogger(__name__)
+
+# Типы взаимодействий
+NOTIFICATION = 'notification'
+REMINDER = 'reminder'
+SURVEY = 'survey'
+REMINDER_ANSWER = 'reminder_answer'
+SURVEY_ANSWER = 'survey_answer'
+
+
+class InteractionRecorder:
+    """Буферизованная пакетная запись InteractionLog"""
+    
+    def __init__(
+        self,
+        max_buffer: int = None,
+        batch_size: int = None,
+        flush_interval: float = None,
+        session_factory=SessionLocal
+    ):
+        """
+        Args:
+            max_buffer: Максимум событий в буфере (сверх него события отбрасываются)
+            batch_size: Событий в одном INSERT и порог досрочного сброса
+            flush_interval: Период сброса буфера (секунды)
+            session_factory: Фабрика сессий БД
+        """
+        self.max_buffer = max_buffer or Config.INTERACTION_BUFFER_SIZE
+        self.batch_size = batch_size or Config.INTERACTION_BATCH_SIZE
+        self.flush_interval = flush_interval or Config.INTERACTION_FLUSH_INTERVAL
+        self.session_factory = session_factory
+        
+        self._buffer: deque = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+    
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def record(self, user_id: Optional[int], interaction_type: str, status: str, data: Dict[str, Any] = None) -> bool:
+        """
+        Постановка события в буфер (не блокирует вызывающего)
+        
+        Args:
+            user_id: ID пользователя в БД (users.id); без него событие не пишется
+            interaction_type: Тип (NOTIFICATION, REMINDER, SURVEY, ...)
+            status: Статус (sent, failed, confirmed, ...)
+            data: Дополнительные данные (сериализуются в JSON при записи)
+        
+        Returns:
+            False, если событие отброшено
+        """
+        if user_id is None:
+            return False
+        
+        event = (user_id, interaction_type, status, data, datetime.utcnow())
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                return False
+            self._buffer.append(event)
+            self.recorded += 1
+            size = len(self._buffer)
+        
+        if size >= self.batch_size:
+            self._wakeup.set()
+        return True
+    
+    def _take(self) -> list:
+        with self._lock:
+            count = min(len(self._buffer), self.batch_size)
+            return [self._buffer.popleft() for _ in range(count)]
+    
+    def _requeue(self, events: list):
+        """Возврат несохранённых событий в начало буфера (в пределах места)"""
+        with self._lock:
+            room = max(0, self.max_buffer - len(self._buffer))
+            kept = events[:room]
+            self._buffer.extendleft(reversed(kept))
+            self.dropped += len(events) - len(kept)
+    
+    def flush(self) -> int:
+        """
+        Запись всего буфера пачками по batch_size
+        
+        Returns:
+            Количество записанных событий
+        """
+        written = 0
+        with self._flush_lock:
+            while True:
+                events = self._take()
+                if not events:
+                    break
+                
+                rows = [
+                    {
+                        'user_id': user_id,
+                        'interaction_type': interaction_type,
+                        'status': status,
+                        'interaction_data': json.dumps(data, ensure_ascii=False, default=str) if data else None,
+                        'created_at': created_at,
+                    }
+                    for user_id, interaction_type, status, data, created_at in events
+                ]
+                
+                started = time.monotonic()
+                db = None
+                try:
+                    db = self.session_factory()
+                    db.execute(insert(InteractionLog.__table__), rows)
+                    db.commit()
+                except Exception as e:
+                    if db is not None:
+                        db.rollback()
+                    self.failed += len(events)
+                    logger.error(f"Не удалось записать {len(events)} событий взаимодействий: {e}")
+                    # БД недоступна: пробуем в следующий раз, не крутимся в цикле
+                    self._requeue(events)
+                    break
+                finally:
+                    if db is not None:
+                        db.close()
+                
+                self.last_flush_ms = round((time.monotonic() - started) * 1000, 1)
+                self.flushes += 1
+                self.written += len(events)
+                written += len(events)
+        
+        return written
+    
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка сброса буфера взаимодействий: {e}", exc_info=True)
+    
+    def start(self):
+        """Запуск фонового сброса"""
+        if self.is_running:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="InteractionRecorder")
+        self._thread.start()
+        logger.info("Запись взаимодействий запущена")
+    
+    def stop(self, timeout: float = 10):
+        """Остановка с финальным сбросом буфера"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        written = self.flush()
+        logger.info(f"Запись взаимодействий остановлена, при остановке сохранено {written}")
+    
+    def stats(self) -> Dict:
+        """Счётчики записи"""
+        with self._lock:
+            buffered = len(self._buffer)
+        return {
+            'buffered': buffered,
+            'recorded': self.recorded,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'flushes': self.flushes,
+            'last_flush_ms': self.last_flush_ms,
+        }
+
+
+# Общий буфер для всего приложения
+interaction_recorder = InteractionRecorder()
+
+
+def record_interaction(user_id: Optional[int], interaction_type: str, status: str, data: Dict[str, Any] = None) -> bool:
+    """Запись события через общий буфер"""
+    return interaction_recorder.record(user_id, interaction_type, status, data)
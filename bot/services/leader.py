@@ -0,0 +1,179 @@
+"""
+Выбор ведущего экземпляра через аренду (lease) в БД
+
+Несколько экземпляров бота могут работать с общей БД, но задачи планировщика
+(напоминания, опросы) выполняет только владелец аренды. Владелец продлевает её
+каждые ttl/3 секунд; если он упал, аренду через ttl забирает другой экземпляр.
+Часы серверов должны быть синхронизированы (NTP).
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from bot.config import Config
+from bot.database import SessionLocal
+from bot.models import SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    """Захват и продление аренды роли в таблице scheduler_leases"""
+    
+    def __init__(
+        self,
+        name: str = 'scheduler',
+        ttl: int = None,
+        session_factory=SessionLocal,
+        on_elected: Optional[Callable[[], None]] = None,
+        on_demoted: Optional[Callable[[], None]] = None
+    ):
+        """
+        Args:
+            name: Название роли
+            ttl: Срок аренды (секунды)
+            session_factory: Фабрика сессий БД
+            on_elected: Вызывается при получении роли
+            on_demoted: Вызывается при потере роли
+        """
+        self.name = name
+        self.ttl = ttl or Config.SCHEDULER_LEASE_TTL
+        self.session_factory = session_factory
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        
+        self._leader = False
+        self._valid_until = 0.0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def is_leader(self) -> bool:
+        """Владеет ли экземпляр ролью (аренда продлена и не истекла локально)"""
+        return self._leader and time.monotonic() < self._valid_until
+    
+    def try_acquire(self) -> bool:
+        """
+        Захват или продление аренды
+        
+        Returns:
+            True, если экземпляр владеет ролью
+        """
+        now = datetime.utcnow()
+        started = time.monotonic()
+        db = self.session_factory()
+        
+        try:
+            # Атомарно: продлеваем свою аренду или забираем истёкшую
+            acquired = db.execute(
+                update(SchedulerLease)
+                .where(
+                    SchedulerLease.name == self.name,
+                    or_(SchedulerLease.holder == self.instance_id, SchedulerLease.expires_at < now)
+                )
+                .values(holder=self.instance_id, expires_at=now + timedelta(seconds=self.ttl), renewed_at=now)
+            ).rowcount > 0
+            
+            if not acquired and db.get(SchedulerLease, self.name) is None:
+                db.add(SchedulerLease(
+                    name=self.name,
+                    holder=self.instance_id,
+                    expires_at=now + timedelta(seconds=self.ttl),
+                    renewed_at=now
+                ))
+                try:
+                    db.commit()
+                    acquired = True
+                except IntegrityError:
+                    # Аренду одновременно создал другой экземпляр
+                    db.rollback()
+            else:
+                db.commit()
+        
+        except Exception as e:
+            logger.error(f"Ошибка продления аренды {self.name}: {e}")
+            db.rollback()
+            acquired = False
+        
+        finally:
+            db.close()
+        
+        if acquired:
+            # Локальный срок отсчитываем от начала запроса: аренда в БД не короче
+            self._valid_until = started + self.ttl
+        self._set_leader(acquired)
+        return acquired
+    
+    def release(self):
+        """Досрочное освобождение аренды (при остановке)"""
+        if not self._leader:
+            return
+        
+        db = self.session_factory()
+        try:
+            db.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.name == self.name, SchedulerLease.holder == self.instance_id)
+                .values(expires_at=datetime.utcnow())
+            )
+            db.commit()
+        except Exception as e:
+            logger.error(f"Ошибка освобождения аренды {self.name}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+        
+        self._set_leader(False)
+    
+    def start(self):
+        """Запуск фонового продления аренды"""
+        self._stop_event.clear()
+        self.try_acquire()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"Leader-{self.name}")
+        self._thread.start()
+    
+    def stop(self):
+        """Остановка продления и освобождение аренды"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.release()
+    
+    def _run(self):
+        while not self._stop_event.wait(self.ttl / 3):
+            self.try_acquire()
+    
+    def _set_leader(self, leader: bool):
+        if leader == self._leader:
+            return
+        
+        self._leader = leader
+        if leader:
+            logger.info(f"Экземпляр {self.instance_id} стал ведущим ({self.name})")
+            callback = self.on_elected
+        else:
+            logger.warning(f"Экземпляр {self.instance_id} больше не ведущий ({self.name})")
+            callback = self.on_demoted
+        
+        if callback:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Ошибка обработчика смены ведущего ({self.name}): {e}", exc_info=True)
+    
+    def stats(self):
+        return {
+            'instance_id': self.instance_id,
+            'is_leader': self.is_leader,
+            'ttl': self.ttl,
+        }
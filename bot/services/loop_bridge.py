@@ -0,0 +1,122 @@
+"""
+Мост между рабочими потоками (вебхуки, APScheduler) и event loop приложения PTB
+
+Корутины, запущенные из других потоков, выполняются в том же loop, что и бот,
+поэтому используют общий HTTP-пул соединений Telegram вместо создания нового
+event loop на каждое сообщение.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import time
+from typing import Any, Coroutine, Optional
+
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class LoopBridge:
+    """Потокобезопасная передача корутин в работающий event loop приложения"""
+    
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def attach(self, loop: asyncio.AbstractEventLoop = None):
+        """
+        Привязка к event loop (вызывается из post_init приложения)
+        
+        Args:
+            loop: Event loop; по умолчанию текущий работающий
+        """
+        self._loop = loop or asyncio.get_running_loop()
+        logger.info("Мост к event loop приложения установлен")
+    
+    def detach(self):
+        """Отвязка от event loop (при остановке приложения)"""
+        self._loop = None
+    
+    @property
+    def is_attached(self) -> bool:
+        return self._loop is not None and self._loop.is_running()
+    
+    def in_loop_thread(self) -> bool:
+        """Вызывается ли код из потока самого event loop"""
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+    
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """
+        Передача корутины в event loop без ожидания результата
+        
+        Args:
+            coro: Корутина для выполнения
+        
+        Returns:
+            Future с результатом корутины
+        """
+        if not self.is_attached:
+            coro.close()
+            raise RuntimeError("Event loop приложения не запущен")
+        
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+    
+    def run(self, coro: Coroutine, timeout: float = None) -> Any:
+        """
+        Выполнение корутины в event loop с ожиданием результата
+        
+        Args:
+            coro: Корутина для выполнения
+            timeout: Максимальное время ожидания (секунды)
+        
+        Returns:
+            Результат корутины
+        
+        Raises:
+            TimeoutError: если корутина не завершилась за timeout (она отменяется)
+        """
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("Нельзя синхронно ждать корутину из потока event loop")
+        
+        if timeout is None:
+            timeout = Config.LOOP_BRIDGE_TIMEOUT
+        
+        future = self.submit(coro)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Корутина не выполнена за {timeout} с")
+
+
+# Общий мост для всего приложения
+loop_bridge = LoopBridge()
+
+
+def run_coroutine_job(coro_func, *args, **kwargs):
+    """
+    Точка входа для задач APScheduler: выполняет асинхронную функцию в loop приложения
+    
+    Задачи ждут завершения без таймаута: обход напоминаний, ограниченный частотой
+    отправки, может идти дольше LOOP_BRIDGE_TIMEOUT, и отмена посреди пачки оставила
+    бы часть записей неотправленными. Долгие запуски только логируются.
+    
+    Args:
+        coro_func: Асинхронная функция
+        *args, **kwargs: Аргументы функции
+    """
+    if loop_bridge.in_loop_thread():
+        raise RuntimeError("Нельзя синхронно ждать корутину из потока event loop")
+    
+    started = time.monotonic()
+    result = loop_bridge.submit(coro_func(*args, **kwargs)).result()
+    
+    elapsed = time.monotonic() - started
+    if elapsed > Config.LOOP_BRIDGE_TIMEOUT:
+        logger.warning(f"Задача {coro_func.__name__} выполнялась {elapsed:.1f} с")
+    else:
+        logger.debug(f"Задача {coro_func.__name__} выполнена за {elapsed:.1f} с")
+    return result
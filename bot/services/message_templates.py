@@ -0,0 +1,235 @@
+"""
+Шаблоны сообщений клиентам (Jinja2)
+
+Шаблоны берутся из таблицы message_templates, каталога MESSAGE_TEMPLATES_DIR и
+встроенного каталога bot/templates/messages (в порядке убывания приоритета),
+компилируются один раз при загрузке и заменяются целиком при изменении.
+Изменения проверяет задача reload_message_templates раз в
+MESSAGE_TEMPLATES_RELOAD секунд, сам рендер к БД и диску не обращается.
+
+Готовые тексты кэшируются по (шаблон, параметры): напоминания на один и тот же
+слот с той же процедурой и врачом рендерятся один раз. Если шаблон падает при
+рендере, используется следующий вариант (в итоге встроенный).
+
+Шаблоны из БД правят администраторы, поэтому окружение песочное
+(SandboxedEnvironment): доступ к внутренним атрибутам объектов запрещён.
+"""
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from jinja2 import Template, TemplateSyntaxError
+from jinja2.sandbox import SandboxedEnvironment
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from bot.config import Config
+from bot.database import SessionLocal
+from bot.models import MessageTemplate
+from bot.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_SUFFIX = '.j2'
+DEFAULT_TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates', 'messages')
+
+# Тексты зависят только от шаблонов и параметров; кэш очищается при перезагрузке
+RENDER_CACHE_TTL = 24 * 3600
+
+# Параметры для пробного рендера перед сохранением шаблона (cli template --file)
+_SAMPLE_DATE = datetime(2026, 1, 15, 9, 30)
+SAMPLE_CONTEXTS: Dict[str, List[Dict]] = {
+    'appointment_notification': [
+        {'appointment_date': _SAMPLE_DATE, 'doctor_name': doctor, 'procedure_name': procedure, 'address': address}
+        for doctor in (None, 'Анна Смирнова')
+        for procedure in (None, 'Чистка лица')
+        for address in (None, 'ул. Ленина, 1')
+    ],
+    'reminder_24h': [
+        {'appointment_date': _SAMPLE_DATE, 'doctor_name': doctor, 'procedure_name': procedure}
+        for doctor in (None, 'Анна Смирнова')
+        for procedure in (None, 'Чистка лица')
+    ],
+    'survey_message': [{'procedure_name': None}, {'procedure_name': 'Чистка лица'}],
+    'survey_thanks': [{'rating': rating} for rating in range(1, 6)],
+}
+
+
+def create_environment() -> SandboxedEnvironment:
+    """Окружение Jinja2 для текстовых сообщений (без HTML-экранирования)"""
+    env = SandboxedEnvironment(autoescape=False, trim_blocks=True, lstrip_blocks=True)
+    env.filters['date'] = lambda value, fmt='%d.%m.%Y': value.strftime(fmt) if value else ''
+    env.filters['time'] = lambda value, fmt='%H:%M': value.strftime(fmt) if value else ''
+    return env
+
+
+class MessageTemplates:
+    """Скомпилированные шаблоны сообщений и кэш готовых текстов"""
+    
+    def __init__(self, directories: List[str] = None, session_factory=SessionLocal, cache_size: int = None):
+        """
+        Args:
+            directories: Каталоги шаблонов по убыванию приоритета
+                         (по умолчанию MESSAGE_TEMPLATES_DIR и встроенный)
+            session_factory: Фабрика сессий БД (None - без таблицы message_templates)
+            cache_size: Размер кэша готовых текстов
+        """
+        if directories is None:
+            directories = [path for path in (Config.MESSAGE_TEMPLATES_DIR, DEFAULT_TEMPLATES_DIR) if path]
+        self.directories = directories
+        self.session_factory = session_factory
+        self.env = create_environment()
+        self.render_cache = TTLCache(cache_size or Config.MESSAGE_RENDER_CACHE_SIZE, RENDER_CACHE_TTL)
+        self._sources: Dict[str, List[Tuple[str, str]]] = {}
+        self._templates: Dict[str, List[Tuple[str, Template]]] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.reloads = 0
+        self.errors = 0
+    
+    def _read_sources(self, include_db: bool = True) -> Dict[str, List[Tuple[str, str]]]:
+        """Варианты каждого шаблона по убыванию приоритета: [(источник, текст)]"""
+        sources: Dict[str, List[Tuple[str, str]]] = {}
+        
+        for directory in reversed(self.directories):
+            if not os.path.isdir(directory):
+                continue
+            for entry in sorted(os.scandir(directory), key=lambda item: item.name):
+                if entry.is_file() and entry.name.endswith(TEMPLATE_SUFFIX):
+                    with open(entry.path, encoding='utf-8') as template_file:
+                        sources.setdefault(entry.name[:-len(TEMPLATE_SUFFIX)], []).insert(
+                            0, (entry.path, template_file.read())
+                        )
+        
+        if include_db and self.session_factory is not None:
+            db = self.session_factory()
+            try:
+                for name, body in db.execute(select(MessageTemplate.name, MessageTemplate.body)):
+                    sources.setdefault(name, []).insert(0, (f"message_templates:{name}", body))
+            except SQLAlchemyError as e:
+                # Таблицы ещё нет (init_db не запускался) - работаем по файлам
+                logger.warning(f"Шаблоны из БД не загружены: {e}")
+            finally:
+                db.close()
+        
+        return sources
+    
+    def _compile(self, name: str, variants: List[Tuple[str, str]]) -> List[Tuple[str, Template]]:
+        """Варианты шаблона, которые компилируются без ошибок: [(источник, шаблон)]"""
+        compiled = []
+        for origin, source in variants:
+            try:
+                compiled.append((origin, self.env.from_string(source)))
+            except TemplateSyntaxError as e:
+                self.errors += 1
+                logger.error(f"Ошибка в шаблоне {name} ({origin}, строка {e.lineno}): {e.message}")
+        return compiled
+    
+    def load(self, include_db: bool = True) -> bool:
+        """
+        Загрузка и компиляция шаблонов, если они изменились
+        
+        Returns:
+            True, если шаблоны перезагружены
+        """
+        sources = self._read_sources(include_db)
+        if self.loaded and sources == self._sources:
+            return False
+        
+        templates = {}
+        for name, variants in sources.items():
+            compiled = self._compile(name, variants)
+            if compiled:
+                templates[name] = compiled
+        
+        with self._lock:
+            self._sources = sources
+            self._templates = templates
+            self._generation += 1
+            self.loaded = True
+            self.reloads += 1
+        self.render_cache.clear()
+        logger.info(f"Шаблоны сообщений загружены: {', '.join(sorted(templates))}")
+        return True
+    
+    def check_source(self, source: str, name: str = None) -> Optional[str]:
+        """
+        Проверка шаблона перед сохранением
+        
+        Args:
+            source: Текст шаблона
+            name: Имя шаблона - для пробного рендера с SAMPLE_CONTEXTS
+        
+        Returns:
+            Текст ошибки или None, если шаблон корректен
+        """
+        try:
+            template = self.env.from_string(source)
+        except TemplateSyntaxError as e:
+            return f"строка {e.lineno}: {e.message}"
+        
+        for context in SAMPLE_CONTEXTS.get(name, []):
+            try:
+                template.render(**context)
+            except Exception as e:
+                return f"ошибка рендера с параметрами {context}: {e}"
+        return None
+    
+    def source(self, name: str) -> Optional[Tuple[str, str]]:
+        """Действующий вариант шаблона: (источник, текст)"""
+        if not self.loaded:
+            self.load()
+        variants = self._sources.get(name)
+        return variants[0] if variants else None
+    
+    def render(self, name: str, **context) -> str:
+        """
+        Текст сообщения по шаблону (завершающие переводы строк отбрасываются)
+        
+        Raises:
+            KeyError: если шаблона нет
+        """
+        if not self.loaded:
+            # Первый вызов до загрузки при запуске - только файлы, без запроса к БД
+            self.load(include_db=False)
+        
+        with self._lock:
+            variants = self._templates[name]
+            generation = self._generation
+        
+        def render_first() -> str:
+            # Ошибка рендера не кэшируется: пробуем следующий вариант, последний - встроенный
+            for position, (origin, template) in enumerate(variants):
+                try:
+                    return template.render(**context).rstrip('\n')
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Ошибка рендера шаблона {name} ({origin}): {e}")
+                    if position == len(variants) - 1:
+                        raise
+        
+        key = (name, generation, tuple(sorted(context.items())))
+        return self.render_cache.get_or_load(key, render_first)
+    
+    def stats(self) -> Dict:
+        return {
+            'templates': len(self._templates),
+            'reloads': self.reloads,
+            'errors': self.errors,
+            'render_cache': self.render_cache.stats(),
+        }
+
+
+# Общие шаблоны для всего приложения
+message_templates = MessageTemplates()
+
+
+def reload_message_templates():
+    """Задача планировщика: подхватить изменённые шаблоны"""
+    try:
+        message_templates.load()
+    except Exception as e:
+        logger.error(f"Ошибка перезагрузки шаблонов сообщений: {e}", exc_info=True)
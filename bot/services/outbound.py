@@ -0,0 +1,293 @@
+"""
+Диспетчер исходящих сообщений Telegram
+
+Все отправки проходят через общую очередь с приоритетами и ограничением
+частоты: глобально на бота (лимит Telegram ~30 сообщений/с) и на каждый чат
+(~1 сообщение/с). При RetryAfter сообщение откладывается и отправляется повторно.
+"""
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Dict, Optional
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from bot.config import Config
+from bot.utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# При превышении этого количества бакетов чатов неиспользуемые удаляются
+MAX_CHAT_BUCKETS = 10000
+
+
+class Priority(IntEnum):
+    """Приоритеты исходящих сообщений (меньше - важнее)"""
+    NOTIFICATION = 0  # Уведомление о записи
+    REMINDER = 1  # Напоминание за 24 часа
+    SURVEY = 2  # Опрос после процедуры
+    ADMIN_ALERT = 3  # Уведомления администраторам
+
+
+@dataclass
+class OutboundMessage:
+    """Сообщение в очереди на отправку"""
+    chat_id: int
+    text: str
+    priority: Priority
+    kwargs: Dict[str, Any]
+    future: asyncio.Future
+    attempts: int = 0
+
+
+@dataclass
+class _Counters:
+    sent: int = 0
+    throttled: int = 0  # Сообщение упёрлось в лимит чата
+    deferred: int = 0  # Сообщение отложено (лимит чата, RetryAfter, сетевая ошибка)
+    retry_after: int = 0
+    failed: int = 0
+    by_priority: Dict[str, int] = field(default_factory=dict)
+
+
+class OutboundDispatcher:
+    """Очередь отправки сообщений с приоритетами и ограничением частоты"""
+    
+    def __init__(
+        self,
+        global_rate: float = None,
+        chat_rate: float = None,
+        workers: int = None,
+        max_retries: int = None
+    ):
+        """
+        Args:
+            global_rate: Сообщений в секунду на бота
+            chat_rate: Сообщений в секунду в один чат
+            workers: Количество параллельных отправителей
+            max_retries: Повторов при RetryAfter и сетевых ошибках
+        """
+        self.global_rate = global_rate or Config.TELEGRAM_GLOBAL_RATE
+        self.chat_rate = chat_rate or Config.TELEGRAM_CHAT_RATE
+        self.workers = workers or Config.OUTBOUND_WORKERS
+        self.max_retries = Config.OUTBOUND_MAX_RETRIES if max_retries is None else max_retries
+        
+        self._bot = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks = []
+        self._delayed: Dict[asyncio.TimerHandle, OutboundMessage] = {}
+        self._sequence = itertools.count()
+        self._global_bucket = TokenBucket(self.global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._counters = _Counters()
+    
+    @property
+    def is_running(self) -> bool:
+        return bool(self._tasks)
+    
+    async def start(self, bot):
+        """Запуск отправителей (вызывается из post_init приложения)"""
+        if self.is_running:
+            return
+        
+        self._bot = bot
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [
+            asyncio.create_task(self._worker_loop(), name=f"Outbound-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(
+            f"Диспетчер исходящих сообщений запущен: {self.global_rate} сообщ./с, "
+            f"{self.chat_rate} сообщ./с на чат"
+        )
+    
+    async def stop(self, timeout: float = 10):
+        """Остановка с попыткой отправить уже поставленные сообщения"""
+        if not self.is_running:
+            return
+        
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не все сообщения отправлены при остановке: {self._queue.qsize()} в очереди")
+        
+        for handle, message in list(self._delayed.items()):
+            handle.cancel()
+            if not message.future.done():
+                message.future.set_exception(RuntimeError("Диспетчер сообщений остановлен"))
+        self._delayed.clear()
+        
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Диспетчер исходящих сообщений остановлен")
+    
+    def enqueue(self, chat_id: int, text: str, priority: Priority = Priority.NOTIFICATION, **kwargs) -> asyncio.Future:
+        """
+        Постановка сообщения в очередь (вызывать из event loop бота)
+        
+        Args:
+            chat_id: ID чата
+            text: Текст сообщения
+            priority: Приоритет
+            **kwargs: Дополнительные параметры send_message (reply_markup, parse_mode, ...)
+        
+        Returns:
+            Future с отправленным сообщением
+        """
+        if not self.is_running:
+            raise RuntimeError("Диспетчер сообщений не запущен")
+        
+        message = OutboundMessage(
+            chat_id=chat_id,
+            text=text,
+            priority=Priority(priority),
+            kwargs=kwargs,
+            future=asyncio.get_running_loop().create_future()
+        )
+        self._put(message)
+        return message.future
+    
+    async def send(self, chat_id: int, text: str, priority: Priority = Priority.NOTIFICATION, bot=None, **kwargs):
+        """
+        Отправка сообщения с ожиданием результата
+        
+        Если диспетчер не запущен, сообщение отправляется напрямую через bot.
+        
+        Returns:
+            Отправленное сообщение (telegram.Message)
+        """
+        if not self.is_running:
+            bot = bot or self._bot
+            if not bot:
+                raise RuntimeError("Диспетчер сообщений не запущен и бот не передан")
+            return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+        
+        return await self.enqueue(chat_id, text, priority, **kwargs)
+    
+    def send_nowait(self, chat_id: int, text: str, priority: Priority = Priority.ADMIN_ALERT, bot=None, **kwargs):
+        """Отправка без ожидания результата (ошибки только логируются)"""
+        task = asyncio.ensure_future(self.send(chat_id, text, priority, bot=bot, **kwargs))
+        task.add_done_callback(self._log_failure)
+        return task
+    
+    def stats(self) -> Dict:
+        """Счётчики диспетчера"""
+        counters = self._counters
+        return {
+            'sent': counters.sent,
+            'throttled': counters.throttled,
+            'deferred': counters.deferred,
+            'retry_after': counters.retry_after,
+            'failed': counters.failed,
+            'sent_by_priority': dict(counters.by_priority),
+            'queued': self._queue.qsize() if self._queue else 0,
+            'delayed': len(self._delayed),
+        }
+    
+    @staticmethod
+    def _log_failure(task: asyncio.Future):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error:
+            logger.error(f"Не удалось отправить сообщение: {error}")
+    
+    def _put(self, message: OutboundMessage):
+        self._queue.put_nowait((message.priority, next(self._sequence), message))
+    
+    def _defer(self, message: OutboundMessage, delay: float):
+        """Возврат сообщения в очередь через delay секунд"""
+        self._counters.deferred += 1
+        handle = None
+        
+        def requeue():
+            self._delayed.pop(handle, None)
+            if not message.future.done():
+                self._put(message)
+        
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._delayed[handle] = message
+    
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_CHAT_BUCKETS:
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items() if not value.is_full
+                }
+            bucket = TokenBucket(self.chat_rate, capacity=1)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+    
+    async def _worker_loop(self):
+        while True:
+            _, _, message = await self._queue.get()
+            try:
+                if message.future.done():
+                    # Отправитель перестал ждать (таймаут/отмена)
+                    continue
+                
+                chat_bucket = self._chat_bucket(message.chat_id)
+                wait = chat_bucket.try_acquire()
+                if wait:
+                    # Не блокируем очередь: сообщения в другие чаты идут дальше
+                    self._counters.throttled += 1
+                    self._defer(message, wait)
+                    continue
+                
+                await self._global_bucket.acquire_async()
+                await self._deliver(message, chat_bucket)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка диспетчера сообщений: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+    
+    async def _deliver(self, message: OutboundMessage, chat_bucket: TokenBucket):
+        message.attempts += 1
+        
+        try:
+            result = await self._bot.send_message(chat_id=message.chat_id, text=message.text, **message.kwargs)
+        except RetryAfter as e:
+            self._counters.retry_after += 1
+            delay = float(e.retry_after)
+            logger.warning(f"Telegram RetryAfter {delay} с для чата {message.chat_id}")
+            chat_bucket.penalize(delay)
+            self._global_bucket.penalize(delay)
+            self._retry_or_fail(message, e, delay)
+            return
+        except BadRequest as e:
+            self._fail(message, e)
+            return
+        except NetworkError as e:
+            self._retry_or_fail(message, e, float(2 ** message.attempts))
+            return
+        except Exception as e:
+            self._fail(message, e)
+            return
+        
+        self._counters.sent += 1
+        lane = message.priority.name.lower()
+        self._counters.by_priority[lane] = self._counters.by_priority.get(lane, 0) + 1
+        if not message.future.done():
+            message.future.set_result(result)
+    
+    def _retry_or_fail(self, message: OutboundMessage, error: Exception, delay: float):
+        if message.attempts > self.max_retries:
+            self._fail(message, error)
+        else:
+            self._defer(message, delay)
+    
+    def _fail(self, message: OutboundMessage, error: Exception):
+        self._counters.failed += 1
+        if not message.future.done():
+            message.future.set_exception(error)
+
+
+# Общий диспетчер для всего приложения
+outbound_dispatcher = OutboundDispatcher()
@@ -0,0 +1,88 @@
+"""
+Заполнение канонических номеров (phone_e164) и их хэшей (phone_hash) для существующих строк
+
+Строки обходятся пачками по первичному ключу, номера нормализуются пачкой
+и записываются одним bulk UPDATE на пачку. После смены PHONE_HASH_SECRET хэши
+пересчитываются у всех строк (rehash=True).
+"""
+import logging
+from typing import Dict
+
+from sqlalchemy import or_, select, update
+
+from bot.database import SessionLocal
+from bot.models import Appointment, User
+from bot.utils.phone import normalize_phones, phone_hash
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_phone_columns(
+    model,
+    batch_size: int = 1000,
+    session_factory=SessionLocal,
+    rehash: bool = False
+) -> Dict[str, int]:
+    """
+    Заполнение phone_e164 и phone_hash по phone_number для одной таблицы
+    
+    Args:
+        model: User или Appointment
+        batch_size: Размер пачки
+        session_factory: Фабрика сессий БД
+        rehash: Пересчитать все строки, а не только незаполненные
+    
+    Returns:
+        {'scanned': ..., 'updated': ..., 'invalid': ...}
+    """
+    stats = {'scanned': 0, 'updated': 0, 'invalid': 0}
+    last_id = 0
+    db = session_factory()
+    
+    conditions = [model.phone_number != None]
+    if not rehash:
+        conditions.append(or_(model.phone_e164 == None, model.phone_hash == None))
+    
+    try:
+        while True:
+            rows = db.execute(
+                select(model.id, model.phone_number).where(
+                    *conditions,
+                    model.id > last_id
+                ).order_by(model.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            
+            last_id = rows[-1].id
+            normalized = normalize_phones(row.phone_number for row in rows)
+            values = [
+                {'id': row.id, 'phone_e164': phone, 'phone_hash': phone_hash(phone)}
+                for row, phone in zip(rows, normalized) if phone
+            ]
+            if values:
+                db.execute(update(model), values)
+                db.commit()
+            
+            stats['scanned'] += len(rows)
+            stats['updated'] += len(values)
+            stats['invalid'] += len(rows) - len(values)
+        
+        logger.info(f"Номера телефонов {model.__tablename__} заполнены: {stats}")
+        return stats
+    
+    except Exception as e:
+        logger.error(f"Ошибка заполнения номеров телефонов {model.__tablename__}: {e}", exc_info=True)
+        db.rollback()
+        raise
+    
+    finally:
+        db.close()
+
+
+def backfill_all(batch_size: int = 1000, session_factory=SessionLocal, rehash: bool = False) -> Dict[str, Dict[str, int]]:
+    """Заполнение phone_e164 и phone_hash у пользователей и записей"""
+    return {
+        model.__tablename__: backfill_phone_columns(model, batch_size, session_factory, rehash)
+        for model in (User, Appointment)
+    }
@@ -0,0 +1,329 @@
+"""
+Хранение старых данных: архивирование и удаление пачками
+
+Для каждой таблицы задаётся срок хранения (RETENTION_*_DAYS, 0 - хранить всё).
+Просроченные строки выбираются пачками по RETENTION_BATCH_SIZE, дописываются
+в сжатый архив (RETENTION_ARCHIVE_DIR/<таблица>/<таблица>-<время>.jsonl.gz)
+и удаляются в короткой транзакции, поэтому долгих блокировок нет.
+
+Архив пишется до фиксации удаления: при сбое строки могут попасть в архив
+повторно, но не теряются.
+
+В PostgreSQL interaction_logs секционирована по месяцам created_at
+(миграция c7e1f4a9b2d8): целиком просроченные секции архивируются и
+удаляются через DETACH/DROP, секции на RETENTION_PARTITION_MONTHS_AHEAD
+месяцев вперёд создаются заранее.
+"""
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, select, text
+
+from bot.config import Config
+from bot.database import SessionLocal
+from bot.models import Appointment, InteractionLog, Survey, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = '.jsonl.gz'
+
+# Таблицы, которые миграция секционирует в PostgreSQL
+PARTITIONED_TABLES = ('interaction_logs',)
+
+
+class RetentionPolicy(NamedTuple):
+    """Правило хранения таблицы"""
+    model: type
+    days: int
+    date_column: str
+    conditions: Callable[[], list] = list  # дополнительные условия отбора
+    children: Tuple[Tuple[type, str], ...] = ()  # (модель, внешний ключ) - удаляются вместе со строкой
+    
+    @property
+    def table(self):
+        return self.model.__table__
+
+
+def default_policies() -> List[RetentionPolicy]:
+    """Правила хранения из настроек"""
+    return [
+        RetentionPolicy(InteractionLog, Config.RETENTION_INTERACTION_DAYS, 'created_at'),
+        RetentionPolicy(
+            WebhookEvent, Config.RETENTION_WEBHOOK_EVENT_DAYS, 'created_at',
+            conditions=lambda: [WebhookEvent.status.in_(('done', 'failed'))]
+        ),
+        RetentionPolicy(
+            Appointment, Config.RETENTION_APPOINTMENT_DAYS, 'appointment_date',
+            children=((Survey, 'appointment_id'),)
+        ),
+    ]
+
+
+def appointment_retention_cutoff(now: datetime = None) -> Optional[datetime]:
+    """Записи раньше этой даты уже архивированы (None - записи хранятся бессрочно)"""
+    if Config.RETENTION_APPOINTMENT_DAYS <= 0:
+        return None
+    return (now or datetime.utcnow()) - timedelta(days=Config.RETENTION_APPOINTMENT_DAYS)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+class ArchiveWriter:
+    """Архив таблицы в формате gzip JSONL (строка на запись), файл создаётся при первой записи"""
+    
+    def __init__(self, directory: str, table: str, started: datetime):
+        self.path = os.path.join(directory, table, f"{table}-{started:%Y%m%dT%H%M%S}{ARCHIVE_SUFFIX}") if directory else None
+        self.rows = 0
+        self._file = None
+    
+    def write(self, rows):
+        if not self.path or not rows:
+            return
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = gzip.open(self.path, 'at', encoding='utf-8')
+        for row in rows:
+            self._file.write(json.dumps(dict(row), ensure_ascii=False, default=_json_default) + '\n')
+        # Сжатые данные пачки должны оказаться на диске до удаления строк
+        self._file.flush()
+        self.rows += len(rows)
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    month = value.month - 1 + months
+    return datetime(value.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    """Имя месячной секции: interaction_logs_p202610"""
+    return f"{table}_p{month:%Y%m}"
+
+
+class RetentionService:
+    """Архивирование и удаление строк старше срока хранения"""
+    
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        policies: List[RetentionPolicy] = None,
+        batch_size: int = None,
+        archive_dir: str = None,
+        pause: float = None
+    ):
+        """
+        Args:
+            session_factory: Фабрика сессий БД
+            policies: Правила хранения (по умолчанию из настроек)
+            batch_size: Строк на одну транзакцию удаления
+            archive_dir: Каталог архива ('' - удалять без архивирования)
+            pause: Пауза между пачками (секунды), чтобы не мешать рабочей нагрузке
+        """
+        self.session_factory = session_factory
+        self.policies = default_policies() if policies is None else policies
+        self.batch_size = batch_size or Config.RETENTION_BATCH_SIZE
+        self.archive_dir = Config.RETENTION_ARCHIVE_DIR if archive_dir is None else archive_dir
+        self.pause = Config.RETENTION_BATCH_PAUSE if pause is None else pause
+    
+    def _is_partitioned(self, table: str) -> bool:
+        db = self.session_factory()
+        try:
+            if db.get_bind().dialect.name != 'postgresql' or table not in PARTITIONED_TABLES:
+                return False
+            return db.execute(text(
+                "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = :table"
+            ), {'table': table}).first() is not None
+        finally:
+            db.close()
+    
+    def ensure_partitions(self, table: str, now: datetime = None) -> int:
+        """Создание секций на текущий и следующие месяцы (PostgreSQL)"""
+        month = _month_start(now or datetime.utcnow())
+        created = 0
+        for offset in range(Config.RETENTION_PARTITION_MONTHS_AHEAD + 1):
+            start = _add_months(month, offset)
+            name = partition_name(table, start)
+            db = self.session_factory()
+            try:
+                if db.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar() is None:
+                    db.execute(text(
+                        f"CREATE TABLE {name} PARTITION OF {table} "
+                        f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{_add_months(start, 1):%Y-%m-%d}')"
+                    ))
+                    db.commit()
+                    created += 1
+                    logger.info(f"Создана секция {name}")
+            except Exception as e:
+                # Например, строки этого месяца уже лежат в секции по умолчанию
+                db.rollback()
+                logger.error(f"Не удалось создать секцию {name}: {e}")
+            finally:
+                db.close()
+        return created
+    
+    def _drop_partitions(self, policy: RetentionPolicy, cutoff: datetime, archive: ArchiveWriter) -> Tuple[int, int]:
+        """Архивирование и удаление секций, целиком попадающих под срок хранения"""
+        table = policy.table.name
+        pattern = re.compile(rf"^{table}_p(\d{{4}})(\d{{2}})$")
+        
+        db = self.session_factory()
+        try:
+            partitions = db.execute(text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = :table ORDER BY c.relname"
+            ), {'table': table}).scalars().all()
+        finally:
+            db.close()
+        
+        dropped = archived = 0
+        for name in partitions:
+            match = pattern.match(name)
+            if not match or _add_months(datetime(int(match[1]), int(match[2]), 1), 1) > cutoff:
+                continue
+            
+            last_id = 0
+            while True:
+                db = self.session_factory()
+                try:
+                    rows = db.execute(text(
+                        f"SELECT * FROM {name} WHERE id > :last_id ORDER BY id LIMIT :limit"
+                    ), {'last_id': last_id, 'limit': self.batch_size}).mappings().all()
+                finally:
+                    db.close()
+                archive.write(rows)
+                archived += len(rows)
+                if len(rows) < self.batch_size:
+                    break
+                last_id = rows[-1]['id']
+            
+            db = self.session_factory()
+            try:
+                db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                db.execute(text(f"DROP TABLE {name}"))
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+            dropped += 1
+            logger.info(f"Секция {name} архивирована и удалена")
+        
+        return dropped, archived
+    
+    def _delete_batch(self, policy: RetentionPolicy, cutoff: datetime, last_id: int, writers) -> List[int]:
+        """Архивирование и удаление одной пачки просроченных строк"""
+        table = policy.table
+        db = self.session_factory()
+        try:
+            rows = db.execute(
+                select(table)
+                .where(table.c[policy.date_column] < cutoff, table.c.id > last_id, *policy.conditions())
+                .order_by(table.c.id)
+                .limit(self.batch_size)
+            ).mappings().all()
+            if not rows:
+                return []
+            ids = [row['id'] for row in rows]
+            
+            for child_model, foreign_key in policy.children:
+                child = child_model.__table__
+                child_rows = db.execute(select(child).where(child.c[foreign_key].in_(ids))).mappings().all()
+                if child_rows:
+                    writers(child.name).write(child_rows)
+                    db.execute(delete(child).where(child.c[foreign_key].in_(ids)))
+            
+            writers(table.name).write(rows)
+            db.execute(delete(table).where(table.c.id.in_(ids)))
+            db.commit()
+            return ids
+        
+        except Exception:
+            db.rollback()
+            raise
+        
+        finally:
+            db.close()
+    
+    def purge(self, policy: RetentionPolicy, now: datetime = None) -> Dict:
+        """
+        Архивирование и удаление строк таблицы старше срока хранения
+        
+        Returns:
+            Статистика: удалённые строки (и секции), файлы архива
+        """
+        now = now or datetime.utcnow()
+        table = policy.table.name
+        stats = {'cutoff': None, 'deleted': 0, 'partitions_dropped': 0, 'archives': []}
+        if policy.days <= 0:
+            return stats
+        
+        cutoff = now - timedelta(days=policy.days)
+        stats['cutoff'] = cutoff
+        writers: Dict[str, ArchiveWriter] = {}
+        
+        def writer(name: str) -> ArchiveWriter:
+            if name not in writers:
+                writers[name] = ArchiveWriter(self.archive_dir, name, now)
+            return writers[name]
+        
+        try:
+            if self._is_partitioned(table):
+                self.ensure_partitions(table, now)
+                stats['partitions_dropped'], stats['deleted'] = self._drop_partitions(policy, cutoff, writer(table))
+            
+            last_id = 0
+            while True:
+                ids = self._delete_batch(policy, cutoff, last_id, writer)
+                stats['deleted'] += len(ids)
+                if len(ids) < self.batch_size:
+                    break
+                last_id = ids[-1]
+                if self.pause:
+                    time.sleep(self.pause)
+        
+        finally:
+            for archive in writers.values():
+                archive.close()
+                if archive.rows:
+                    stats['archives'].append(archive.path)
+        
+        if stats['deleted']:
+            logger.info(f"{table}: удалено {stats['deleted']} строк старше {cutoff:%Y-%m-%d}")
+        return stats
+    
+    def run(self, now: datetime = None) -> Dict[str, Dict]:
+        """Применение всех правил хранения; ошибка одной таблицы не останавливает остальные"""
+        results = {}
+        for policy in self.policies:
+            try:
+                results[policy.table.name] = self.purge(policy, now)
+            except Exception as e:
+                logger.error(f"Ошибка очистки {policy.table.name}: {e}", exc_info=True)
+                results[policy.table.name] = {'error': str(e)}
+        return results
+
+
+def apply_retention():
+    """Задача планировщика: очистка данных старше сроков хранения"""
+    RetentionService().run()
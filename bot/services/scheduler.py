@@ -1,43 +1,119 @@
 """
 Сервис планировщика задач (APScheduler)
+
+Общие задачи (напоминания, опросы, обходы) хранятся в БД и выполняются только
+на ведущем экземпляре: у остальных общий планировщик стоит на паузе. Задачи,
+касающиеся памяти процесса (обновление справочников), выполняет локальный
+планировщик на каждом экземпляре.
 """
+import asyncio
 import logging
 from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.jobstores.base import JobLookupError
 
 from bot.config import Config
 from bot.database import engine
+from bot.services.leader import LeaderElection
+from bot.services.loop_bridge import run_coroutine_job
 
 logger = logging.getLogger(__name__)
 
+# Режимы планирования
+MODE_SWEEPER = 'sweeper'  # Периодический обход БД, постоянное число задач в jobstore
+MODE_JOBS = 'jobs'  # Отдельная задача на каждое напоминание/опрос
+
 
 class SchedulerService:
     """Сервис для управления планировщиком задач"""
     
-    def __init__(self):
-        # Хранилище задач в БД для персистентности
-        jobstore = SQLAlchemyJobStore(engine=engine)
+    def __init__(self, jobstore=None):
+        """
+        Args:
+            jobstore: Хранилище общих задач (по умолчанию в БД для персистентности)
+        """
+        if jobstore is None:
+            jobstore = SQLAlchemyJobStore(engine=engine)
         
+        # Пока ведущий не выбран (до SCHEDULER_LEASE_TTL), общий планировщик стоит на паузе:
+        # подошедшие за это время напоминания должны выполниться после возобновления,
+        # а не пропускаться как опоздавшие (по умолчанию в APScheduler - через 1 с)
         self.scheduler = AsyncIOScheduler(
             jobstores={'default': jobstore},
             executors={'default': ThreadPoolExecutor(20)},
-            job_defaults={'coalesce': True, 'max_instances': 3},
+            job_defaults={
+                'coalesce': True,
+                'max_instances': 3,
+                'misfire_grace_time': max(Config.SCHEDULER_MISFIRE_GRACE, 3 * Config.SCHEDULER_LEASE_TTL)
+            },
             timezone=Config.SCHEDULER_TIMEZONE
         )
+        
+        # Задачи отдельного экземпляра (не сохраняются в БД)
+        self.local_scheduler = AsyncIOScheduler(
+            jobstores={'default': MemoryJobStore()},
+            executors={'default': ThreadPoolExecutor(4)},
+            job_defaults={'coalesce': True, 'max_instances': 1},
+            timezone=Config.SCHEDULER_TIMEZONE
+        )
+        self.mode = Config.SCHEDULER_MODE
+        
+        self.leader = None
+        if Config.SCHEDULER_LEADER_ELECTION:
+            self.leader = LeaderElection(
+                'scheduler',
+                on_elected=self._on_elected,
+                on_demoted=self._on_demoted
+            )
+    
+    @property
+    def is_leader(self) -> bool:
+        """Выполняет ли этот экземпляр общие задачи"""
+        return self.leader is None or self.leader.is_leader
     
     def start(self):
-        """Запуск планировщика"""
-        self.scheduler.start()
+        """Запуск планировщика (общие задачи - только после получения роли ведущего)"""
+        self.local_scheduler.start()
+        self.scheduler.start(paused=self.leader is not None)
+        if self.leader:
+            self.leader.start()
         logger.info("Планировщик задач запущен")
     
+    def start_for_writes(self):
+        """
+        Запуск общего планировщика на паузе - только для записи задач в jobstore
+        
+        Для отдельных процессов (python -m bot.cli reconcile): задачи попадают
+        в общую БД и выполняются ведущим экземпляром бота.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # AsyncIOScheduler привязывается к текущему event loop, в CLI его ещё нет
+            asyncio.set_event_loop(asyncio.new_event_loop())
+        self.scheduler.start(paused=True)
+    
     def shutdown(self):
         """Остановка планировщика"""
+        if self.leader:
+            self.leader.stop()
         self.scheduler.shutdown()
+        self.local_scheduler.shutdown()
         logger.info("Планировщик задач остановлен")
     
+    def _on_elected(self):
+        self.scheduler.resume()
+        logger.info("Общие задачи планировщика выполняются на этом экземпляре")
+    
+    def _on_demoted(self):
+        self.scheduler.pause()
+        logger.info("Общие задачи планировщика приостановлены на этом экземпляре")
+    
     def schedule_reminder(self, appointment_id: int, appointment_date: datetime, callback_func, bot=None):
         """
         Планирование напоминания за 24 часа до записи
@@ -46,8 +122,12 @@ class SchedulerService:
             appointment_id: ID записи
             appointment_date: Дата и время записи
             callback_func: Функция для вызова при срабатывании
-            bot: Экземпляр бота (опционально)
+            bot: Не используется, оставлен для совместимости
         """
+        if self.mode == MODE_SWEEPER:
+            # Напоминание отправит периодический обход
+            return
+        
         reminder_time = appointment_date - timedelta(hours=24)
         
         # Не планируем, если время уже прошло
@@ -56,15 +136,7 @@ class SchedulerService:
             return
         
         job_id = f"reminder_{appointment_id}"
-        kwargs = {'bot': bot} if bot else {}
-        self.scheduler.add_job(
-            callback_func,
-            trigger=DateTrigger(run_date=reminder_time),
-            id=job_id,
-            args=[appointment_id],
-            kwargs=kwargs,
-            replace_existing=True
-        )
+        self._add_date_job(job_id, reminder_time, callback_func, appointment_id)
         logger.info(f"Запланировано напоминание для записи {appointment_id} на {reminder_time}")
     
     def schedule_survey(self, appointment_id: int, appointment_date: datetime, callback_func, bot=None):
@@ -75,27 +147,90 @@ class SchedulerService:
             appointment_id: ID записи
             appointment_date: Дата и время записи
             callback_func: Функция для вызова при срабатывании
-            bot: Экземпляр бота (опционально)
+            bot: Не используется, оставлен для совместимости
         """
+        if self.mode == MODE_SWEEPER:
+            return
+        
         survey_time = appointment_date + timedelta(days=3)
         
         job_id = f"survey_{appointment_id}"
-        kwargs = {'bot': bot} if bot else {}
+        self._add_date_job(job_id, survey_time, callback_func, appointment_id)
+        logger.info(f"Запланирован опрос для записи {appointment_id} на {survey_time}")
+    
+    def start_sweepers(self, reminder_sweep, survey_sweep):
+        """
+        Запуск периодического обхода напоминаний и опросов (режим sweeper)
+        
+        Вместо задачи на каждую запись в jobstore хранятся две задачи,
+        которые раз в SWEEPER_INTERVAL секунд выбирают подошедшие записи из БД.
+        
+        Args:
+            reminder_sweep: Асинхронная функция обхода напоминаний
+            survey_sweep: Асинхронная функция обхода опросов
+        """
+        if self.mode != MODE_SWEEPER:
+            return
+        
+        self.add_interval_job('sweep_reminders', Config.SWEEPER_INTERVAL, reminder_sweep)
+        self.add_interval_job('sweep_surveys', Config.SWEEPER_INTERVAL, survey_sweep)
+        logger.info(f"Запущен обход напоминаний и опросов каждые {Config.SWEEPER_INTERVAL} с")
+    
+    def add_interval_job(self, job_id: str, seconds: float, callback_func, *args, local: bool = False):
+        """
+        Добавление периодической задачи (не более одного запуска одновременно)
+        
+        Args:
+            job_id: ID задачи
+            seconds: Интервал запуска
+            callback_func: Функция (синхронная или асинхронная)
+            *args: Аргументы функции
+            local: Выполнять на каждом экземпляре (иначе только на ведущем)
+        """
+        if asyncio.iscoroutinefunction(callback_func):
+            func, args = run_coroutine_job, (callback_func, *args)
+        else:
+            func = callback_func
+        
+        scheduler = self.local_scheduler if local else self.scheduler
+        scheduler.add_job(
+            func,
+            trigger=IntervalTrigger(seconds=seconds),
+            id=job_id,
+            args=list(args),
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+    
+    def _add_date_job(self, job_id: str, run_date: datetime, callback_func, *args):
+        """
+        Добавление разовой задачи
+        
+        Асинхронные функции выполняются в event loop бота через loop_bridge,
+        т.к. задачи запускаются в потоках ThreadPoolExecutor.
+        Экземпляр бота в задачу не передаётся (он не сериализуется в jobstore).
+        """
+        if asyncio.iscoroutinefunction(callback_func):
+            func, args = run_coroutine_job, (callback_func, *args)
+        else:
+            func = callback_func
+        
         self.scheduler.add_job(
-            callback_func,
-            trigger=DateTrigger(run_date=survey_time),
+            func,
+            trigger=DateTrigger(run_date=run_date),
             id=job_id,
-            args=[appointment_id],
-            kwargs=kwargs,
+            args=list(args),
             replace_existing=True
         )
-        logger.info(f"Запланирован опрос для записи {appointment_id} на {survey_time}")
     
     def cancel_job(self, job_id: str):
         """Отмена задачи"""
         try:
             self.scheduler.remove_job(job_id)
             logger.info(f"Задача {job_id} отменена")
+        except JobLookupError:
+            logger.debug(f"Задача {job_id} не найдена")
         except Exception as e:
             logger.error(f"Ошибка отмены задачи {job_id}: {e}")
 
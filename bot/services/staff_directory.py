@@ -0,0 +1,211 @@
+"""
+Справочник сотрудников и контактов Битрикс24
+
+Имена загружаются пакетно (user.get, crm.contact.list) при запуске и
+обновляются по расписанию, а поиск по ID выполняется в памяти без запросов к API.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from bot.config import Config
+from bot.services.bitrix24 import get_bitrix_client
+
+logger = logging.getLogger(__name__)
+
+CONTACT_SELECT = ['ID', 'NAME', 'SECOND_NAME', 'LAST_NAME', 'DATE_MODIFY']
+
+
+def format_person_name(item: Dict) -> Optional[str]:
+    """
+    Имя сотрудника или контакта для сообщений
+    
+    Args:
+        item: Запись user.get или crm.contact.get
+    
+    Returns:
+        "Имя Фамилия" или None, если имя не заполнено
+    """
+    parts = [(item.get(key) or '').strip() for key in ('NAME', 'LAST_NAME')]
+    name = ' '.join(part for part in parts if part)
+    return name or None
+
+
+class StaffDirectory:
+    """
+    Кэш имён сотрудников (ASSIGNED_BY_ID) и контактов в памяти
+    
+    Словари заменяются целиком при загрузке, поэтому чтение идёт без блокировок.
+    """
+    
+    def __init__(self, client=None, load_contacts: bool = None):
+        """
+        Args:
+            client: Клиент Битрикс24 (по умолчанию общий)
+            load_contacts: Загружать ли контакты (по умолчанию STAFF_DIRECTORY_CONTACTS,
+                и только если задано BITRIX24_DOCTOR_FIELD: среди контактов
+                в основном пациенты, а без поля врача их имена не нужны)
+        """
+        self._client = client
+        if load_contacts is None:
+            load_contacts = Config.STAFF_DIRECTORY_CONTACTS and bool(Config.BITRIX24_DOCTOR_FIELD)
+        self.load_contacts = load_contacts
+        self._users: Dict[str, str] = {}
+        self._contacts: Dict[str, str] = {}
+        self._contacts_modified: Optional[str] = None
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.loaded_at: Optional[float] = None
+        self.refreshes = 0
+        self.errors = 0
+        self.misses = 0
+    
+    @property
+    def client(self):
+        return self._client or get_bitrix_client()
+    
+    def _load_users(self):
+        """Полная загрузка сотрудников (включая уволенных: на них могут быть старые сделки)"""
+        users = {}
+        for page in self.client.iter_list('user.get', {'sort': 'ID', 'order': 'ASC'}):
+            for item in page:
+                name = format_person_name(item)
+                if name:
+                    users[str(item['ID'])] = name
+        self._users = users
+    
+    def _load_contacts(self, since: Optional[str] = None):
+        """
+        Загрузка контактов
+        
+        Args:
+            since: Загрузить только изменённые начиная с этой даты (DATE_MODIFY)
+        """
+        contacts = dict(self._contacts) if since else {}
+        params = {'select': CONTACT_SELECT, 'order': {'DATE_MODIFY': 'ASC', 'ID': 'ASC'}}
+        if since:
+            # >= : изменения в ту же секунду, что и прошлая загрузка, не теряются
+            params['filter'] = {'>=DATE_MODIFY': since}
+        
+        modified = since
+        for page in self.client.iter_list('crm.contact.list', params):
+            for item in page:
+                name = format_person_name(item)
+                if name:
+                    contacts[str(item['ID'])] = name
+                else:
+                    contacts.pop(str(item['ID']), None)
+                if item.get('DATE_MODIFY'):
+                    modified = max(modified or '', item['DATE_MODIFY'])
+        
+        self._contacts = contacts
+        self._contacts_modified = modified
+    
+    def load(self) -> bool:
+        """Полная загрузка справочника"""
+        with self._lock:
+            started = time.monotonic()
+            try:
+                self._load_users()
+                if self.load_contacts:
+                    self._load_contacts()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка загрузки справочника сотрудников: {e}")
+                return False
+            
+            self.loaded = True
+            self.loaded_at = time.time()
+            logger.info(
+                f"Справочник загружен за {time.monotonic() - started:.1f} с: "
+                f"{len(self._users)} сотрудников, {len(self._contacts)} контактов"
+            )
+            return True
+    
+    def refresh(self) -> bool:
+        """
+        Обновление справочника по расписанию
+        
+        Сотрудники перечитываются полностью (их немного), контакты — только
+        изменённые после последней загрузки.
+        """
+        if not self.loaded:
+            return self.load()
+        
+        with self._lock:
+            try:
+                self._load_users()
+                if self.load_contacts:
+                    self._load_contacts(since=self._contacts_modified)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка обновления справочника сотрудников: {e}")
+                return False
+            
+            self.refreshes += 1
+            self.loaded_at = time.time()
+            logger.debug(f"Справочник обновлён: {len(self._users)} сотрудников, {len(self._contacts)} контактов")
+            return True
+    
+    def resolve_user(self, user_id) -> Optional[str]:
+        """Имя сотрудника по ID или None"""
+        if not user_id:
+            return None
+        name = self._users.get(str(user_id))
+        if name is None:
+            self.misses += 1
+        return name
+    
+    def resolve_contact(self, contact_id) -> Optional[str]:
+        """Имя контакта по ID или None"""
+        if not contact_id:
+            return None
+        name = self._contacts.get(str(contact_id))
+        if name is None:
+            self.misses += 1
+        return name
+    
+    def stats(self) -> Dict:
+        """Статистика справочника"""
+        return {
+            'loaded': self.loaded,
+            'users': len(self._users),
+            'contacts': len(self._contacts),
+            'contacts_modified': self._contacts_modified,
+            'loaded_at': self.loaded_at,
+            'refreshes': self.refreshes,
+            'errors': self.errors,
+            'misses': self.misses,
+        }
+
+
+# Общий справочник приложения
+staff_directory = StaffDirectory()
+
+
+def resolve_doctor_name(deal: Dict) -> Optional[str]:
+    """
+    Имя врача по сделке
+    
+    Если задано BITRIX24_DOCTOR_FIELD (поле сделки с ID контакта врача),
+    используется оно, иначе ответственный сотрудник (ASSIGNED_BY_ID).
+    
+    Returns:
+        Имя врача или None, если его нет в справочнике
+    """
+    if Config.BITRIX24_DOCTOR_FIELD and deal.get(Config.BITRIX24_DOCTOR_FIELD):
+        name = staff_directory.resolve_contact(deal[Config.BITRIX24_DOCTOR_FIELD])
+        if name:
+            return name
+    
+    assigned_by_id = deal.get('ASSIGNED_BY_ID')
+    name = staff_directory.resolve_user(assigned_by_id)
+    if assigned_by_id and not name:
+        logger.warning(f"Сотрудник {assigned_by_id} не найден в справочнике")
+    return name
+
+
+def refresh_staff_directory():
+    """Задача планировщика: обновление справочника"""
+    staff_directory.refresh()
@@ -0,0 +1,233 @@
+"""
+Агрегаты статистики взаимодействий (stats_hourly, stats_daily)
+
+Задача update_stats_rollups (на ведущем экземпляре) читает новые строки
+interaction_logs после сохранённого id (SyncState) пачками и прибавляет их
+к почасовым и дневным счётчикам в той же транзакции, что и сдвиг отметки.
+Отметка сдвигается условным UPDATE по прежнему значению: без выбора ведущего
+задача выполняется на каждом экземпляре, и пачку учитывает только первый.
+Команда /stats читает только дневные агрегаты, поэтому отвечает быстро
+при любом объёме исходных таблиц.
+"""
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Tuple
+
+from sqlalchemy import func, select, update
+
+from bot.config import Config
+from bot.database import AsyncSessionLocal, SessionLocal
+from bot.models import Appointment, InteractionLog, StatsDaily, StatsHourly, SyncState
+from bot.services.interactions import SURVEY_ANSWER
+
+logger = logging.getLogger(__name__)
+
+SYNC_NAME = 'stats_rollup'
+
+# (период, тип, статус, процедура) -> [количество, сумма оценок, число оценок]
+RollupKey = Tuple[object, str, str, str]
+
+
+def _parse_data(value):
+    if not value:
+        return {}
+    try:
+        data = json.loads(value)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+class StatsRollup:
+    """Инкрементальное обновление агрегатов по id строк interaction_logs"""
+    
+    def __init__(self, session_factory=SessionLocal, batch_size: int = None, lag: int = None):
+        """
+        Args:
+            session_factory: Фабрика сессий БД
+            batch_size: Строк interaction_logs за одну транзакцию
+            lag: Строки моложе lag секунд ждут следующего запуска
+                 (буфер записи мог ещё не сохранить более ранние события)
+        """
+        self.session_factory = session_factory
+        self.batch_size = batch_size or Config.STATS_ROLLUP_BATCH
+        self.lag = Config.STATS_ROLLUP_LAG if lag is None else lag
+    
+    def get_watermark(self) -> int:
+        """id последней учтённой строки interaction_logs"""
+        db = self.session_factory()
+        try:
+            state = db.get(SyncState, SYNC_NAME)
+            return int(state.watermark) if state and state.watermark else 0
+        finally:
+            db.close()
+    
+    @staticmethod
+    def _advance_watermark(db, old: str, new: str) -> bool:
+        """
+        Сдвиг отметки, только если её не сдвинул другой экземпляр
+        
+        В PostgreSQL UPDATE блокирует строку до конца транзакции, поэтому
+        параллельная пачка ждёт и после фиксации этой не находит прежнее значение.
+        """
+        return db.execute(
+            update(SyncState)
+            .where(SyncState.name == SYNC_NAME, SyncState.watermark == old)
+            .values(watermark=new),
+            execution_options={'synchronize_session': False}
+        ).rowcount == 1
+    
+    @staticmethod
+    def _merge(db, model, totals: Dict[RollupKey, list]):
+        """Прибавление счётчиков к существующим строкам агрегата или создание новых"""
+        buckets = {key[0] for key in totals}
+        existing = {
+            (row.bucket, row.interaction_type, row.status, row.procedure_name): row
+            for row in db.scalars(select(model).where(model.bucket.in_(buckets)))
+        }
+        for key, (count, rating_sum, rating_count) in totals.items():
+            row = existing.get(key)
+            if row is None:
+                bucket, interaction_type, status, procedure_name = key
+                row = model(
+                    bucket=bucket, interaction_type=interaction_type, status=status,
+                    procedure_name=procedure_name, count=0, rating_sum=0, rating_count=0
+                )
+                db.add(row)
+            row.count += count
+            row.rating_sum += rating_sum
+            row.rating_count += rating_count
+    
+    def run_once(self) -> int:
+        """
+        Обработка одной пачки строк
+        
+        Returns:
+            Количество учтённых строк
+        """
+        db = self.session_factory()
+        try:
+            state = db.get(SyncState, SYNC_NAME)
+            if state is None:
+                state = SyncState(name=SYNC_NAME, watermark='0')
+                db.add(state)
+                db.flush()
+            watermark = state.watermark
+            last_id = int(watermark or 0)
+            
+            rows = db.execute(
+                select(
+                    InteractionLog.id, InteractionLog.created_at, InteractionLog.interaction_type,
+                    InteractionLog.status, InteractionLog.interaction_data
+                ).where(InteractionLog.id > last_id).order_by(InteractionLog.id).limit(self.batch_size)
+            ).all()
+            
+            # Останавливаемся на первой слишком свежей строке, чтобы не перешагнуть
+            # через события, которые ещё лежат в буфере записи
+            cutoff = datetime.utcnow() - timedelta(seconds=self.lag)
+            for index, row in enumerate(rows):
+                if row.created_at and row.created_at > cutoff:
+                    rows = rows[:index]
+                    break
+            if not rows:
+                db.rollback()
+                return 0
+            
+            # Сначала отметка: счётчики читаются уже после того, как пачка закреплена за этим экземпляром
+            if not self._advance_watermark(db, watermark, str(rows[-1].id)):
+                db.rollback()
+                logger.info("Пачка агрегатов уже учтена другим экземпляром")
+                return 0
+            
+            data = [_parse_data(row.interaction_data) for row in rows]
+            appointment_ids = {item['appointment_id'] for item in data if isinstance(item.get('appointment_id'), int)}
+            procedures = dict(db.execute(
+                select(Appointment.id, Appointment.procedure_name).where(Appointment.id.in_(appointment_ids))
+            ).all()) if appointment_ids else {}
+            
+            hourly: Dict[RollupKey, list] = {}
+            daily: Dict[RollupKey, list] = {}
+            for row, item in zip(rows, data):
+                created_at = row.created_at or datetime.utcnow()
+                procedure_name = procedures.get(item.get('appointment_id')) or ''
+                rating = item.get('rating') if row.interaction_type == SURVEY_ANSWER else None
+                
+                for totals, bucket in (
+                    (hourly, created_at.replace(minute=0, second=0, microsecond=0)),
+                    (daily, created_at.date()),
+                ):
+                    counters = totals.setdefault((bucket, row.interaction_type, row.status, procedure_name), [0, 0, 0])
+                    counters[0] += 1
+                    if isinstance(rating, int):
+                        counters[1] += rating
+                        counters[2] += 1
+            
+            self._merge(db, StatsHourly, hourly)
+            self._merge(db, StatsDaily, daily)
+            db.commit()
+            return len(rows)
+        
+        except Exception:
+            db.rollback()
+            raise
+        
+        finally:
+            db.close()
+    
+    def run(self, max_batches: int = 100) -> int:
+        """Обработка накопившихся строк (не более max_batches пачек за запуск)"""
+        processed = 0
+        for _ in range(max_batches):
+            count = self.run_once()
+            processed += count
+            if count < self.batch_size:
+                break
+        return processed
+
+
+def update_stats_rollups():
+    """Задача планировщика: обновление агрегатов статистики"""
+    try:
+        processed = StatsRollup().run()
+        if processed:
+            logger.info(f"Агрегаты статистики обновлены: учтено {processed} событий")
+    except Exception as e:
+        logger.error(f"Ошибка обновления агрегатов статистики: {e}", exc_info=True)
+
+
+async def load_stats_summary(days: int = 7, session_factory=AsyncSessionLocal) -> Dict:
+    """
+    Сводка за последние days дней (включая сегодня) по дневным агрегатам
+    
+    Returns:
+        {'days', 'since', 'counts': {(тип, статус): количество},
+         'ratings': [(процедура, средняя оценка, число оценок)], 'rating_avg', 'rating_count'}
+    """
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    
+    async with session_factory() as db:
+        counts = (await db.execute(
+            select(StatsDaily.interaction_type, StatsDaily.status, func.sum(StatsDaily.count))
+            .where(StatsDaily.bucket >= since)
+            .group_by(StatsDaily.interaction_type, StatsDaily.status)
+        )).all()
+        ratings = (await db.execute(
+            select(StatsDaily.procedure_name, func.sum(StatsDaily.rating_sum), func.sum(StatsDaily.rating_count))
+            .where(StatsDaily.bucket >= since, StatsDaily.interaction_type == SURVEY_ANSWER)
+            .group_by(StatsDaily.procedure_name)
+        )).all()
+    
+    rating_sum = sum(row[1] or 0 for row in ratings)
+    rating_count = sum(row[2] or 0 for row in ratings)
+    return {
+        'days': days,
+        'since': since,
+        'counts': {(interaction_type, status): int(total or 0) for interaction_type, status, total in counts},
+        'ratings': sorted(
+            ((name, round(total / number, 2), int(number)) for name, total, number in ratings if number),
+            key=lambda item: -item[2]
+        ),
+        'rating_avg': round(rating_sum / rating_count, 2) if rating_count else None,
+        'rating_count': int(rating_count),
+    }
@@ -0,0 +1,121 @@
+"""
+Приём обновлений Telegram через вебхук (альтернатива run_polling)
+
+Эндпоинт вебхук-сервера передаёт обновления в update_queue приложения PTB,
+дальше они обрабатываются теми же обработчиками, что и при polling.
+"""
+import asyncio
+import logging
+import signal
+from typing import Dict, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from bot.config import Config
+from bot.services.loop_bridge import loop_bridge
+
+logger = logging.getLogger(__name__)
+
+# Типы обновлений, которые обрабатывает бот (сообщения и нажатия кнопок)
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+
+class TelegramUpdateFeed:
+    """Передача обновлений из потоков HTTP-сервера в приложение PTB"""
+    
+    def __init__(self):
+        self._application: Optional[Application] = None
+        self.received = 0
+        self.rejected = 0
+    
+    def attach(self, application: Application):
+        """Подключение приложения (после его инициализации)"""
+        self._application = application
+    
+    def detach(self):
+        """Отключение приложения (новые обновления отклоняются)"""
+        self._application = None
+    
+    @property
+    def is_attached(self) -> bool:
+        return self._application is not None and loop_bridge.is_attached
+    
+    def feed(self, data: Dict) -> bool:
+        """
+        Передача обновления в очередь приложения
+        
+        Args:
+            data: JSON обновления от Telegram
+        
+        Returns:
+            True, если обновление принято, False - если приложение не запущено
+        """
+        application = self._application
+        if application is None or not loop_bridge.is_attached:
+            self.rejected += 1
+            return False
+        
+        update = Update.de_json(data, application.bot)
+        loop_bridge.run(application.update_queue.put(update), timeout=5)
+        self.received += 1
+        return True
+    
+    def stats(self) -> Dict:
+        return {
+            'attached': self.is_attached,
+            'received': self.received,
+            'rejected': self.rejected,
+        }
+
+
+# Общий приёмник обновлений
+telegram_update_feed = TelegramUpdateFeed()
+
+
+async def run_webhook_mode(application: Application):
+    """
+    Запуск приложения в режиме вебхука
+    
+    Повторяет жизненный цикл run_polling (initialize, post_init, start, ...),
+    но вместо опроса регистрирует вебхук; обновления приходят через эндпоинт
+    вебхук-сервера. Вебхук при остановке не удаляется: его могут обслуживать
+    другие экземпляры бота за балансировщиком.
+    """
+    stop_event = asyncio.Event()
+    try:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+    except (NotImplementedError, RuntimeError):
+        # Windows: остановка по KeyboardInterrupt
+        pass
+    
+    url = Config.TELEGRAM_WEBHOOK_URL.rstrip('/') + Config.TELEGRAM_WEBHOOK_PATH
+    
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        
+        await application.bot.set_webhook(
+            url=url,
+            allowed_updates=ALLOWED_UPDATES,
+            secret_token=Config.TELEGRAM_WEBHOOK_SECRET,
+            max_connections=Config.TELEGRAM_WEBHOOK_MAX_CONNECTIONS
+        )
+        await application.start()
+        telegram_update_feed.attach(application)
+        logger.info(f"Вебхук Telegram установлен: {url}")
+        
+        try:
+            await stop_event.wait()
+        finally:
+            telegram_update_feed.detach()
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    finally:
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
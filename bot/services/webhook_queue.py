@@ -0,0 +1,445 @@
+"""
+Очередь обработки вебхуков Битрикс24
+
+Эндпоинт только сохраняет событие в таблицу webhook_events и сразу отвечает,
+а получение сделки, запись в БД и отправку в Telegram выполняет пул воркеров.
+Событие помечается выполненным только после успешной обработки, поэтому при
+падении процесса оно будет обработано повторно (at-least-once).
+
+Повторная доставка того же события (тот же тип, ID и ts) отбрасывается по
+уникальному dedup_key, а серия ONCRMDEALUPDATE по одной сделке объединяется
+с ещё не обработанным событием этой сделки: сделка всё равно запрашивается
+из API в момент обработки, поэтому одного запроса достаточно.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+
+from bot.config import Config
+from bot.database import SessionLocal
+from bot.models import WebhookEvent
+from bot.handlers.notifications import handle_bitrix24_webhook
+
+logger = logging.getLogger(__name__)
+
+DEAL_EVENTS = ('ONCRMDEALADD', 'ONCRMDEALUPDATE')
+
+
+def event_keys(payload: Dict) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Ключи события для дедупликации и объединения
+    
+    Returns:
+        (ID сделки или None, ключ идемпотентности или None, если в событии нет ts)
+    """
+    event = payload.get('event', '')
+    data = payload.get('data') or {}
+    entity_id = (data.get('FIELDS') or {}).get('ID')
+    
+    try:
+        entity_id = int(entity_id) if entity_id is not None else None
+    except (TypeError, ValueError):
+        entity_id = None
+    
+    deal_id = entity_id if event in DEAL_EVENTS else None
+    ts = payload.get('ts')
+    dedup_key = f"{event}:{entity_id}:{ts}" if ts and entity_id is not None else None
+    return deal_id, dedup_key
+
+
+class WebhookQueue:
+    """Ограниченная персистентная очередь вебхуков с пулом воркеров"""
+    
+    def __init__(
+        self,
+        handler: Callable[[Dict], bool],
+        session_factory=SessionLocal,
+        maxsize: int = None,
+        workers: int = None,
+        max_attempts: int = None,
+        retry_delay: int = None,
+        poll_interval: int = None,
+        lock_timeout: int = None,
+        debounce: float = None
+    ):
+        """
+        Args:
+            handler: Функция обработки вебхука, возвращает True при успехе
+            session_factory: Фабрика сессий БД
+            maxsize: Максимальная глубина очереди в памяти (backpressure)
+            workers: Количество потоков-обработчиков
+            max_attempts: Количество попыток до перевода события в failed
+            retry_delay: Базовая задержка перед повтором (секунды)
+            poll_interval: Период дозагрузки событий из БД (секунды)
+            lock_timeout: Через сколько секунд событие в processing считается потерянным
+            debounce: Задержка обработки ONCRMDEALUPDATE, за которую копятся обновления сделки
+        """
+        self.handler = handler
+        self.session_factory = session_factory
+        self.maxsize = maxsize or Config.WEBHOOK_QUEUE_SIZE
+        self.workers = workers or Config.WEBHOOK_WORKERS
+        self.max_attempts = max_attempts or Config.WEBHOOK_MAX_ATTEMPTS
+        self.retry_delay = Config.WEBHOOK_RETRY_DELAY if retry_delay is None else retry_delay
+        self.poll_interval = poll_interval or Config.WEBHOOK_POLL_INTERVAL
+        self.lock_timeout = lock_timeout or Config.WEBHOOK_LOCK_TIMEOUT
+        self.debounce = Config.WEBHOOK_DEBOUNCE if debounce is None else debounce
+        self.max_backlog = Config.WEBHOOK_MAX_BACKLOG
+        self._pending_count = 0
+        self._pending_checked = 0.0
+        
+        self._queue = queue.Queue(maxsize=self.maxsize)
+        self._queued_ids = set()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = {
+            'accepted': 0,
+            'rejected': 0,
+            'duplicates': 0,
+            'coalesced': 0,
+            'processed': 0,
+            'retried': 0,
+            'failed': 0,
+        }
+    
+    @property
+    def is_running(self) -> bool:
+        return bool(self._threads) and not self._stop_event.is_set()
+    
+    def start(self):
+        """Запуск воркеров и фоновой дозагрузки событий из БД"""
+        if self.is_running:
+            return
+        
+        self._stop_event.clear()
+        
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, daemon=True, name=f"WebhookWorker-{i}")
+            thread.start()
+            self._threads.append(thread)
+        
+        poller = threading.Thread(target=self._poll_loop, daemon=True, name="WebhookPoller")
+        poller.start()
+        self._threads.append(poller)
+        
+        # Подхватываем события, оставшиеся с прошлого запуска
+        self._recover_stale()
+        self._refill()
+        
+        logger.info(f"Очередь вебхуков запущена: {self.workers} воркеров, ёмкость {self.maxsize}")
+    
+    def stop(self, timeout: float = 10):
+        """Остановка воркеров (необработанные события остаются в БД)"""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        logger.info("Очередь вебхуков остановлена")
+    
+    def enqueue(self, payload: Dict) -> Optional[int]:
+        """
+        Постановка вебхука в очередь
+        
+        Args:
+            payload: Тело вебхука от Битрикс24
+        
+        Returns:
+            ID события (для дубликата или объединённого обновления - ID уже
+            сохранённого события) или None, если очередь переполнена
+        """
+        if self._is_full():
+            self._incr('rejected')
+            logger.warning("Очередь вебхуков переполнена, событие отклонено")
+            return None
+        
+        event_name = payload.get('event', '')
+        deal_id, dedup_key = event_keys(payload)
+        delay = self.debounce if event_name == 'ONCRMDEALUPDATE' and deal_id else 0
+        
+        db = self.session_factory()
+        try:
+            if dedup_key:
+                existing_id = self._find_duplicate(db, dedup_key)
+                if existing_id:
+                    return existing_id
+            
+            if delay:
+                target_id = self._coalesce(db, deal_id)
+                if target_id:
+                    self._incr('coalesced')
+                    logger.debug(f"Обновление сделки {deal_id} объединено с событием {target_id}")
+                    return target_id
+            
+            event = WebhookEvent(
+                event=event_name,
+                payload=json.dumps(payload, ensure_ascii=False),
+                deal_id=deal_id,
+                dedup_key=dedup_key,
+                status='pending',
+                available_at=datetime.utcnow() + timedelta(seconds=delay)
+            )
+            db.add(event)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Дубликат сохранён параллельным запросом
+                db.rollback()
+                return self._find_duplicate(db, dedup_key)
+            event_id = event.id
+        finally:
+            db.close()
+        
+        self._incr('accepted')
+        # В процессе, который только принимает вебхуки (внешний WSGI-сервер), воркеров
+        # нет: таймер не нужен, событие по available_at заберёт опрос БД процессом бота
+        if delay and self.is_running:
+            timer = threading.Timer(delay, self._put, [event_id])
+            timer.daemon = True
+            timer.start()
+        else:
+            self._put(event_id)
+        return event_id
+    
+    def _is_full(self) -> bool:
+        """
+        Проверка переполнения
+        
+        В процессе, который только принимает вебхуки (внешний WSGI-сервер),
+        воркеров нет, поэтому ограничивается число необработанных событий в БД
+        (значение обновляется не чаще раза в секунду).
+        """
+        if self._queue.full():
+            return True
+        if self.is_running:
+            return False
+        
+        now = time.monotonic()
+        if now - self._pending_checked >= 1:
+            db = self.session_factory()
+            try:
+                self._pending_count = db.query(func.count(WebhookEvent.id)).filter(
+                    WebhookEvent.status == 'pending'
+                ).scalar()
+            finally:
+                db.close()
+            self._pending_checked = now
+        return self._pending_count >= self.max_backlog
+    
+    def _find_duplicate(self, db, dedup_key: str) -> Optional[int]:
+        """ID уже сохранённого события с тем же ключом идемпотентности"""
+        existing_id = db.query(WebhookEvent.id).filter(WebhookEvent.dedup_key == dedup_key).scalar()
+        if existing_id:
+            self._incr('duplicates')
+            logger.info(f"Повторная доставка события {dedup_key} отброшена")
+        return existing_id
+    
+    def _coalesce(self, db, deal_id: int) -> Optional[int]:
+        """
+        Объединение обновления сделки с её ещё не взятым в работу событием
+        
+        Захват происходит только из статуса pending, поэтому если событие
+        удалось отметить в этом статусе, сделка будет запрошена уже после
+        нового обновления.
+        
+        Returns:
+            ID события, с которым объединено обновление, или None
+        """
+        target_id = db.query(WebhookEvent.id).filter(
+            WebhookEvent.deal_id == deal_id,
+            WebhookEvent.event.in_(DEAL_EVENTS),
+            WebhookEvent.status == 'pending'
+        ).order_by(WebhookEvent.id).limit(1).scalar()
+        
+        if target_id is None:
+            return None
+        
+        updated = db.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id == target_id, WebhookEvent.status == 'pending')
+            .values(coalesced=WebhookEvent.coalesced + 1)
+        ).rowcount
+        db.commit()
+        return target_id if updated else None
+    
+    def stats(self) -> Dict:
+        """Метрики очереди"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = self._in_flight
+        stats['depth'] = self._queue.qsize()
+        stats['capacity'] = self.maxsize
+        stats['workers'] = self.workers
+        return stats
+    
+    def backlog(self) -> Dict:
+        """Количество событий в БД по статусам (включая ещё не загруженные в память)"""
+        db = self.session_factory()
+        try:
+            rows = db.query(WebhookEvent.status, func.count(WebhookEvent.id)).group_by(WebhookEvent.status).all()
+            return {status: count for status, count in rows}
+        finally:
+            db.close()
+    
+    def _incr(self, counter: str, value: int = 1):
+        with self._lock:
+            self._counters[counter] += value
+    
+    def _put(self, event_id: int):
+        """Передача события воркерам; при переполнении его подхватит _refill"""
+        if not self.is_running:
+            return
+        
+        with self._lock:
+            if event_id in self._queued_ids:
+                return
+            self._queued_ids.add(event_id)
+        
+        try:
+            self._queue.put_nowait(event_id)
+        except queue.Full:
+            with self._lock:
+                self._queued_ids.discard(event_id)
+    
+    def _worker_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                event_id = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            
+            with self._lock:
+                self._queued_ids.discard(event_id)
+            
+            try:
+                self._process(event_id)
+            finally:
+                self._queue.task_done()
+    
+    def _poll_loop(self):
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self._recover_stale()
+                self._refill()
+            except Exception as e:
+                logger.error(f"Ошибка дозагрузки очереди вебхуков: {e}", exc_info=True)
+    
+    def _process(self, event_id: int):
+        """Обработка одного события: захват, вызов обработчика, фиксация результата"""
+        db = self.session_factory()
+        
+        try:
+            # Атомарный захват: событие обработает только тот воркер, который перевёл его в processing
+            claimed = db.execute(
+                update(WebhookEvent)
+                .where(
+                    WebhookEvent.id == event_id,
+                    WebhookEvent.status == 'pending',
+                    WebhookEvent.available_at <= datetime.utcnow()
+                )
+                .values(status='processing', locked_at=datetime.utcnow(), attempts=WebhookEvent.attempts + 1)
+            ).rowcount
+            db.commit()
+            
+            if not claimed:
+                return
+            
+            event = db.get(WebhookEvent, event_id)
+            payload = json.loads(event.payload)
+            
+            with self._lock:
+                self._in_flight += 1
+            try:
+                ok = self.handler(payload)
+                error = None if ok else "Обработчик вернул False"
+            except Exception as e:
+                logger.error(f"Ошибка обработки события {event_id}: {e}", exc_info=True)
+                ok = False
+                error = str(e)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+            
+            event.last_error = error
+            event.locked_at = None
+            
+            if ok:
+                event.status = 'done'
+                event.processed_at = datetime.utcnow()
+                self._incr('processed')
+            elif event.attempts >= self.max_attempts:
+                event.status = 'failed'
+                event.processed_at = datetime.utcnow()
+                self._incr('failed')
+                logger.error(f"Событие {event_id} ({event.event}) не обработано за {event.attempts} попыток")
+            else:
+                event.status = 'pending'
+                event.available_at = datetime.utcnow() + timedelta(seconds=self.retry_delay * event.attempts)
+                self._incr('retried')
+                logger.warning(f"Событие {event_id} будет обработано повторно (попытка {event.attempts})")
+            
+            db.commit()
+        
+        except Exception as e:
+            logger.error(f"Ошибка очереди при обработке события {event_id}: {e}", exc_info=True)
+            db.rollback()
+        
+        finally:
+            db.close()
+    
+    def _recover_stale(self):
+        """Возврат в очередь событий, зависших в processing (воркер упал)"""
+        db = self.session_factory()
+        try:
+            deadline = datetime.utcnow() - timedelta(seconds=self.lock_timeout)
+            recovered = db.execute(
+                update(WebhookEvent)
+                .where(WebhookEvent.status == 'processing', WebhookEvent.locked_at < deadline)
+                .values(status='pending', locked_at=None)
+            ).rowcount
+            db.commit()
+            if recovered:
+                logger.warning(f"Возвращено в очередь {recovered} зависших событий")
+        finally:
+            db.close()
+    
+    def _refill(self):
+        """Загрузка готовых к обработке событий из БД в свободные слоты очереди"""
+        free = self.maxsize - self._queue.qsize()
+        if free <= 0 or not self.is_running:
+            return
+        
+        db = self.session_factory()
+        try:
+            with self._lock:
+                queued = set(self._queued_ids)
+            
+            rows = db.query(WebhookEvent.id).filter(
+                WebhookEvent.status == 'pending',
+                WebhookEvent.available_at <= datetime.utcnow()
+            ).order_by(WebhookEvent.id).limit(free + len(queued)).all()
+        finally:
+            db.close()
+        
+        for (event_id,) in rows:
+            if event_id not in queued:
+                self._put(event_id)
+
+
+# Ленивая инициализация очереди
+_webhook_queue = None
+
+
+def get_webhook_queue() -> WebhookQueue:
+    """Получение экземпляра очереди вебхуков (создаём при первом вызове)"""
+    global _webhook_queue
+    if _webhook_queue is None:
+        _webhook_queue = WebhookQueue(handle_bitrix24_webhook)
+    return _webhook_queue
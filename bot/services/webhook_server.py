@@ -1,12 +1,27 @@
 """
 Flask сервер для приема вебхуков от Битрикс24
 """
+import hmac
 import logging
-from flask import Flask, request, jsonify
+import threading
+from datetime import datetime
+from typing import Optional
+
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler, make_server
 
 from bot.config import Config
-from bot.handlers.notifications import handle_bitrix24_webhook
+from bot.database import get_pool_stats
+from bot.services.webhook_queue import get_webhook_queue
+from bot.services.outbound import outbound_dispatcher
+from bot.services.bitrix24 import get_bitrix_stats
+from bot.services.export import FORMATS, parse_date_bound, stream_export
+from bot.services.identity_cache import identity_cache
+from bot.services.interactions import interaction_recorder
+from bot.services.message_templates import message_templates
+from bot.services.staff_directory import staff_directory
+from bot.services.telegram_webhook import telegram_update_feed
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +37,7 @@ def bitrix24_webhook():
     Ожидаемые события:
     - ONCRMDEALADD - создание сделки
     - ONCRMDEALUPDATE - обновление сделки
+    - ONCRMCONTACTUPDATE - обновление контакта (сброс кэша)
     """
     try:
         data = request.get_json()
@@ -46,20 +62,52 @@ def bitrix24_webhook():
         # Обработка вебхука
         logger.info(f"Получен вебхук: {event}")
         
-        # Асинхронная обработка через очередь или напрямую
-        # Для MVP используем прямую обработку
-        result = handle_bitrix24_webhook(data)
+        # Сохраняем событие в очередь и сразу отвечаем, обработку выполняют воркеры
+        event_id = get_webhook_queue().enqueue(data)
+        
+        if event_id is None:
+            # Очередь переполнена - Битрикс24 повторит доставку позже
+            response = jsonify({"status": "busy", "message": "Webhook queue is full"})
+            response.headers['Retry-After'] = str(Config.WEBHOOK_RETRY_DELAY)
+            return response, 503
         
-        if result:
-            return jsonify({"status": "ok"}), 200
-        else:
-            return jsonify({"status": "error", "message": "Failed to process webhook"}), 500
+        return jsonify({"status": "queued", "id": event_id}), 200
     
     except Exception as e:
         logger.error(f"Ошибка обработки вебхука: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
 
+@app.route(Config.TELEGRAM_WEBHOOK_PATH, methods=['POST'])
+def telegram_webhook():
+    """
+    Эндпоинт для обновлений Telegram (TELEGRAM_UPDATE_MODE=webhook)
+    
+    Telegram передаёт секрет, указанный в setWebhook, в заголовке
+    X-Telegram-Bot-Api-Secret-Token. Без настроенного секрета запросы не принимаются.
+    """
+    received_secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not Config.TELEGRAM_WEBHOOK_SECRET or not hmac.compare_digest(received_secret, Config.TELEGRAM_WEBHOOK_SECRET):
+        logger.warning("Неверный секрет вебхука Telegram")
+        return jsonify({"error": "Invalid secret"}), 403
+    
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "Empty request"}), 400
+    
+    try:
+        accepted = telegram_update_feed.feed(data)
+    except Exception as e:
+        logger.error(f"Ошибка передачи обновления Telegram: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+    
+    if not accepted:
+        # Бот не запущен - Telegram повторит доставку
+        return jsonify({"status": "unavailable"}), 503
+    
+    return jsonify({"status": "ok"}), 200
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check эндпоинт"""
@@ -69,11 +117,118 @@ def health_check():
     }), 200
 
 
-def run_webhook_server():
-    """Запуск Flask сервера для вебхуков"""
-    app.run(
-        host=Config.WEBHOOK_HOST,
-        port=Config.WEBHOOK_PORT,
-        debug=Config.DEBUG
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Метрики очереди вебхуков, исходящих сообщений и клиента Битрикс24
+    
+    Порт публичный (вебхуки), поэтому нужен тот же токен, что и для /admin/*.
+    """
+    denied = _check_admin_request()
+    if denied:
+        return denied
+    
+    webhook_queue = get_webhook_queue()
+    return jsonify({
+        "webhook_queue": webhook_queue.stats(),
+        "webhook_backlog": webhook_queue.backlog(),
+        "outbound": outbound_dispatcher.stats(),
+        "bitrix24": get_bitrix_stats(),
+        "staff_directory": staff_directory.stats(),
+        "identity_cache": identity_cache.stats(),
+        "interactions": interaction_recorder.stats(),
+        "message_templates": message_templates.stats(),
+        "telegram_webhook": telegram_update_feed.stats(),
+        "db_pool": get_pool_stats()
+    }), 200
+
+
+def _is_admin_request() -> bool:
+    """Проверка заголовка Authorization: Bearer <ADMIN_API_TOKEN>"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return scheme == 'Bearer' and hmac.compare_digest(token, Config.ADMIN_API_TOKEN)
+
+
+def _check_admin_request():
+    """Ответ с ошибкой для неавторизованного запроса или None (без ADMIN_API_TOKEN - 404)"""
+    if not Config.ADMIN_API_TOKEN:
+        return jsonify({"error": "Not found"}), 404
+    if not _is_admin_request():
+        logger.warning(f"Неверный токен {request.path} с адреса {request.remote_addr}")
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+
+@app.route('/admin/export/<dataset>', methods=['GET'])
+def admin_export(dataset):
+    """
+    Потоковая выгрузка для аналитики
+    
+    GET /admin/export/surveys?format=csv&from=2026-10-01&to=2026-10-31&procedure=...
+    Набор: surveys или appointments, формат: csv или jsonl. Без ADMIN_API_TOKEN эндпоинт отключён.
+    """
+    denied = _check_admin_request()
+    if denied:
+        return denied
+    
+    fmt = request.args.get('format', 'csv')
+    try:
+        chunks = stream_export(
+            dataset,
+            fmt,
+            date_from=parse_date_bound(request.args.get('from')),
+            date_to=parse_date_bound(request.args.get('to'), end=True),
+            procedure=request.args.get('procedure') or None
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    filename = f"{dataset}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+    return Response(
+        stream_with_context(chunks),
+        content_type=FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
     )
 
+
+class TimeoutRequestHandler(WSGIRequestHandler):
+    """Обработчик с таймаутом сокета: медленный клиент не занимает поток бесконечно"""
+    timeout = Config.WEBHOOK_REQUEST_TIMEOUT
+
+
+_server: Optional[BaseWSGIServer] = None
+
+
+def start_webhook_server() -> threading.Thread:
+    """
+    Запуск встроенного сервера для вебхуков в фоновом потоке (режим embedded)
+    
+    Многопоточный WSGI-сервер werkzeug без отладчика и перезагрузчика.
+    Порт занимается сразу, поэтому ошибка запуска видна в вызывающем потоке.
+    
+    Returns:
+        Поток, обслуживающий запросы
+    """
+    global _server
+    _server = make_server(
+        Config.WEBHOOK_HOST,
+        Config.WEBHOOK_PORT,
+        app,
+        threaded=True,
+        request_handler=TimeoutRequestHandler
+    )
+    
+    thread = threading.Thread(target=_server.serve_forever, daemon=True, name="WebhookServer")
+    thread.start()
+    return thread
+
+
+def stop_webhook_server():
+    """Остановка встроенного сервера (текущие запросы дорабатывают)"""
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
+        logger.info("Вебхук-сервер остановлен")
+
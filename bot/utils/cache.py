@@ -0,0 +1,140 @@
+"""
+Кэш в памяти с вытеснением LRU и временем жизни записей
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU-кэш с ограничением времени жизни записей
+    
+    get_or_load объединяет одновременные промахи по одному ключу:
+    загрузку выполняет первый поток, остальные ждут его результат.
+    """
+    
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        Args:
+            maxsize: Максимальное количество записей
+            ttl: Время жизни записи (секунды)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __len__(self):
+        return len(self._data)
+    
+    def _lookup(self, key: Hashable):
+        """Поиск действующей записи (вызывать под блокировкой)"""
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+    
+    def _store(self, key: Hashable, value: Any):
+        """Сохранение записи с вытеснением самой старой (вызывать под блокировкой)"""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Значение из кэша или default"""
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+    
+    def set(self, key: Hashable, value: Any):
+        """Сохранение значения"""
+        with self._lock:
+            self._store(key, value)
+    
+    def invalidate(self, key: Hashable):
+        """Удаление записи (и отказ от кэширования загружаемого сейчас значения)"""
+        with self._lock:
+            self._data.pop(key, None)
+            self._inflight.pop(key, None)
+    
+    def clear(self):
+        """Очистка кэша"""
+        with self._lock:
+            self._data.clear()
+            self._inflight.clear()
+    
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Значение из кэша или результат loader() при промахе
+        
+        None (ошибка загрузки / объект не найден) не кэшируется.
+        
+        Args:
+            key: Ключ
+            loader: Функция загрузки значения
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            
+            self.misses += 1
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        
+        if not owner:
+            return future.result()
+        
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+            future.set_exception(e)
+            raise
+        
+        with self._lock:
+            # Если ключ инвалидировали во время загрузки, значение может быть устаревшим
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+                if value is not None:
+                    self._store(key, value)
+        
+        future.set_result(value)
+        return value
+    
+    def stats(self) -> Dict:
+        """Статистика попаданий"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
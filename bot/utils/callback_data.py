@@ -0,0 +1,113 @@
+"""
+Компактные подписанные callback_data для inline-кнопок
+
+Формат: <вид>:<действие>:<id записи в base36>:<подпись>, например "rm:y:2n9c:Xk3v0bQa".
+Подпись - усечённый HMAC-SHA256, поэтому нажатие кнопки сразу даёт id записи
+(поиск по первичному ключу), а подделать id в callback_data нельзя.
+Telegram ограничивает callback_data 64 байтами, строка укладывается в ~30.
+"""
+import base64
+import hashlib
+import hmac
+import logging
+from typing import NamedTuple, Optional
+
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Виды кнопок
+REMINDER = 'rm'
+SURVEY = 'sv'
+
+# Допустимые действия для каждого вида
+ACTIONS = {
+    REMINDER: {'y', 'n'},
+    SURVEY: {'1', '2', '3', '4', '5'},
+}
+
+MAX_CALLBACK_DATA = 64
+SIGNATURE_LENGTH = 8  # символов base64url (48 бит)
+
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+class CallbackPayload(NamedTuple):
+    """Разобранные данные кнопки"""
+    kind: str
+    action: str
+    appointment_id: int
+
+
+def _to_base36(value: int) -> str:
+    if value < 0:
+        raise ValueError("id записи не может быть отрицательным")
+    digits = []
+    while True:
+        value, rem = divmod(value, 36)
+        digits.append(_DIGITS[rem])
+        if not value:
+            return ''.join(reversed(digits))
+
+
+def _secret() -> bytes:
+    """Ключ подписи: CALLBACK_SECRET или производный от токена бота"""
+    if Config.CALLBACK_SECRET:
+        return Config.CALLBACK_SECRET.encode()
+    return hashlib.sha256(f"callback:{Config.TELEGRAM_BOT_TOKEN}".encode()).digest()
+
+
+def _sign(body: str) -> str:
+    digest = hmac.new(_secret(), body.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode()[:SIGNATURE_LENGTH]
+
+
+def encode_callback(kind: str, action: str, appointment_id: int) -> str:
+    """
+    Формирование callback_data
+    
+    Args:
+        kind: Вид кнопки (REMINDER, SURVEY)
+        action: Действие ('y'/'n' для напоминания, '1'..'5' для опроса)
+        appointment_id: ID записи
+    
+    Returns:
+        Строка не длиннее 64 байт
+    """
+    if action not in ACTIONS.get(kind, ()):
+        raise ValueError(f"Недопустимое действие {action!r} для кнопки {kind!r}")
+    
+    body = f"{kind}:{action}:{_to_base36(appointment_id)}"
+    data = f"{body}:{_sign(body)}"
+    if len(data.encode()) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт")
+    return data
+
+
+def decode_callback(data: str) -> Optional[CallbackPayload]:
+    """
+    Разбор и проверка подписи callback_data
+    
+    Returns:
+        CallbackPayload или None, если формат не тот (например, кнопки старого
+        формата "reminder_confirm") или подпись не сходится
+    """
+    parts = (data or '').split(':')
+    if len(parts) != 4:
+        return None
+    
+    kind, action, id36, signature = parts
+    if action not in ACTIONS.get(kind, ()):
+        return None
+    
+    body = f"{kind}:{action}:{id36}"
+    if not hmac.compare_digest(_sign(body), signature):
+        logger.warning(f"Неверная подпись callback_data: {data}")
+        return None
+    
+    try:
+        appointment_id = int(id36, 36)
+    except ValueError:
+        return None
+    
+    return CallbackPayload(kind, action, appointment_id)
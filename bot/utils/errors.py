@@ -6,6 +6,8 @@ from functools import wraps
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from bot.services.outbound import outbound_dispatcher, Priority
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,14 +24,16 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             logger.error(f"Не удалось отправить сообщение об ошибке: {e}")
     
-    # Уведомляем администраторов
+    # Уведомляем администраторов (в фоне, с наименьшим приоритетом)
     if context.bot and hasattr(context, 'bot_data'):
         admin_ids = context.bot_data.get('admin_ids', [])
         for admin_id in admin_ids:
             try:
-                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=f"❌ Ошибка в боте: {type(context.error).__name__}: {context.error}"
+                outbound_dispatcher.send_nowait(
+                    admin_id,
+                    f"❌ Ошибка в боте: {type(context.error).__name__}: {context.error}",
+                    Priority.ADMIN_ALERT,
+                    bot=context.bot
                 )
             except Exception as e:
                 logger.error(f"Не удалось уведомить администратора {admin_id}: {e}")
@@ -1,29 +1,56 @@
 """
 Клавиатуры для Telegram-бота
 """
+from typing import Optional
+
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 
+from bot.utils.callback_data import REMINDER, SURVEY, encode_callback
+
 
-def get_reminder_keyboard():
-    """Клавиатура для напоминания за 24 часа"""
+def get_reminder_keyboard(appointment_id: Optional[int] = None):
+    """
+    Клавиатура для напоминания за 24 часа
+    
+    Args:
+        appointment_id: ID записи; без него кнопки старого формата (поиск последней записи)
+    """
+    if appointment_id is None:
+        confirm, cancel = "reminder_confirm", "reminder_cancel"
+    else:
+        confirm = encode_callback(REMINDER, 'y', appointment_id)
+        cancel = encode_callback(REMINDER, 'n', appointment_id)
+    
     keyboard = [
         [
-            InlineKeyboardButton("✅ Да, приду", callback_data="reminder_confirm"),
-            InlineKeyboardButton("❌ Нет, не получается", callback_data="reminder_cancel")
+            InlineKeyboardButton("✅ Да, приду", callback_data=confirm),
+            InlineKeyboardButton("❌ Нет, не получается", callback_data=cancel)
         ]
     ]
     return InlineKeyboardMarkup(keyboard)
 
 
-def get_survey_keyboard():
-    """Клавиатура для опроса (оценка 1-5)"""
+def get_survey_keyboard(appointment_id: Optional[int] = None):
+    """
+    Клавиатура для опроса (оценка 1-5)
+    
+    Args:
+        appointment_id: ID записи; без него кнопки старого формата (поиск последней записи)
+    """
+    def button(rating: int, label: str):
+        if appointment_id is None:
+            data = f"survey_{rating}"
+        else:
+            data = encode_callback(SURVEY, str(rating), appointment_id)
+        return InlineKeyboardButton(label, callback_data=data)
+    
     keyboard = [
         [
-            InlineKeyboardButton("1", callback_data="survey_1"),
-            InlineKeyboardButton("2", callback_data="survey_2"),
-            InlineKeyboardButton("3", callback_data="survey_3"),
-            InlineKeyboardButton("4", callback_data="survey_4"),
-            InlineKeyboardButton("5 ⭐", callback_data="survey_5")
+            button(1, "1"),
+            button(2, "2"),
+            button(3, "3"),
+            button(4, "4"),
+            button(5, "5 ⭐")
         ]
     ]
     return InlineKeyboardMarkup(keyboard)
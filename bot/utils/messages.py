@@ -1,8 +1,13 @@
 """
 Шаблоны сообщений для бота
+
+Тексты для клиентов хранятся в шаблонах Jinja2 (bot/templates/messages,
+переопределяются файлами MESSAGE_TEMPLATES_DIR или таблицей message_templates).
 """
 from datetime import datetime
 
+from bot.services.message_templates import message_templates
+
 
 def format_appointment_notification(
     appointment_date: datetime,
@@ -15,27 +20,13 @@ def format_appointment_notification(
     
     TODO: Согласовать точный формат с клиентом
     """
-    date_str = appointment_date.strftime("%d.%m.%Y")
-    time_str = appointment_date.strftime("%H:%M")
-    
-    message = (
-        f"📅 Вы записаны в Uclinic!\n\n"
-        f"Дата: {date_str}\n"
-        f"Время: {time_str}\n"
+    return message_templates.render(
+        'appointment_notification',
+        appointment_date=appointment_date,
+        doctor_name=doctor_name,
+        procedure_name=procedure_name,
+        address=address
     )
-    
-    if doctor_name:
-        message += f"👩‍⚕️ Врач: {doctor_name}\n"
-    
-    if procedure_name:
-        message += f"💆 Процедура: {procedure_name}\n"
-    
-    if address:
-        message += f"\n📍 Адрес: {address}\n"
-    
-    message += "\nМы напомним вам за 24 часа до визита! ⏰"
-    
-    return message
 
 
 def format_reminder_24h(
@@ -44,57 +35,58 @@ def format_reminder_24h(
     procedure_name: str = None
 ) -> str:
     """Форматирование напоминания за 24 часа"""
-    date_str = appointment_date.strftime("%d.%m.%Y")
-    time_str = appointment_date.strftime("%H:%M")
-    
-    message = (
-        f"⏰ Напоминание о записи\n\n"
-        f"Завтра, {date_str} в {time_str}\n"
+    return message_templates.render(
+        'reminder_24h',
+        appointment_date=appointment_date,
+        doctor_name=doctor_name,
+        procedure_name=procedure_name
     )
-    
-    if doctor_name:
-        message += f"👩‍⚕️ Врач: {doctor_name}\n"
-    
-    if procedure_name:
-        message += f"💆 Процедура: {procedure_name}\n"
-    
-    message += "\nПожалуйста, подтвердите, что вы придёте:"
-    
-    return message
 
 
 def format_survey_message(procedure_name: str = None) -> str:
     """Форматирование сообщения опроса"""
+    return message_templates.render('survey_message', procedure_name=procedure_name)
+
+
+def format_survey_thanks(rating: int) -> str:
+    """Благодарность после опроса"""
+    return message_templates.render('survey_thanks', rating=rating)
+
+
+def format_stats_summary(summary: dict) -> str:
+    """Форматирование сводки /stats (см. load_stats_summary)"""
+    counts = summary['counts']
+    
+    def count(interaction_type: str, *statuses: str) -> int:
+        return sum(counts.get((interaction_type, status), 0) for status in statuses)
+    
+    def share(part: int, total: int) -> str:
+        return f" ({part * 100 // total}%)" if total else ""
+    
+    reminders_sent = count('reminder', 'sent')
+    confirmed = count('reminder_answer', 'confirmed')
+    cancelled = count('reminder_answer', 'cancelled')
+    surveys_sent = count('survey', 'sent')
+    answered = count('survey_answer', 'answered')
+    
     message = (
-        "Спасибо, что выбрали Uclinic! 💙\n\n"
-        "Мы были бы рады узнать ваше мнение о посещении."
+        f"📊 Статистика за {summary['days']} дн. "
+        f"(с {summary['since'].strftime('%d.%m.%Y')})\n\n"
+        f"Уведомления о записи: {count('notification', 'sent')}, "
+        f"ошибок {count('notification', 'failed')}\n"
+        f"Напоминания: {reminders_sent}, ошибок {count('reminder', 'failed')}\n"
+        f"  подтверждено {confirmed}{share(confirmed, reminders_sent)}, "
+        f"отменено {cancelled}{share(cancelled, reminders_sent)}\n"
+        f"Опросы: {surveys_sent}, ответов {answered}{share(answered, surveys_sent)}"
     )
     
-    if procedure_name:
-        message += f"\n\nКак вам процедура \"{procedure_name}\"?"
-    else:
-        message += "\n\nКак вам ваше посещение?"
+    if summary['rating_avg'] is not None:
+        message += f"\nСредняя оценка: {summary['rating_avg']} ({summary['rating_count']})"
     
-    message += "\n\nОцените от 1 до 5:"
+    if summary['ratings']:
+        message += "\n\nОценки по процедурам:"
+        for procedure_name, average, number in summary['ratings'][:10]:
+            message += f"\n• {procedure_name or 'Без процедуры'}: {average} ({number})"
     
     return message
 
-
-def format_survey_thanks(rating: int) -> str:
-    """Благодарность после опроса"""
-    if rating == 5:
-        return (
-            "Спасибо за высокую оценку! ⭐⭐⭐⭐⭐\n\n"
-            "Мы были бы очень благодарны, если бы вы оставили отзыв в Яндекс.Картах!"
-        )
-    elif rating >= 4:
-        return "Спасибо за вашу оценку! Рады, что вам понравилось! 😊"
-    elif rating >= 3:
-        return "Спасибо за обратную связь! Мы всегда работаем над улучшением сервиса."
-    else:
-        return (
-            "Спасибо за честную оценку. "
-            "Мы сожалеем, что не оправдали ваших ожиданий. "
-            "Наша команда обязательно свяжется с вами для решения вопроса."
-        )
-
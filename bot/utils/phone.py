@@ -0,0 +1,125 @@
+"""
+Нормализация телефонов к E.164 (+79991234567)
+
+В Битрикс24 телефон - мультиполе: список словарей
+[{'ID': '1', 'VALUE': '8 (999) 123-45-67', 'VALUE_TYPE': 'MOBILE'}].
+Для точного поиска по индексу в БД хранится канонический вид в phone_e164.
+
+Ссылки привязки аккаунта (t.me/<бот>?start=phone_<хэш>) содержат не номер,
+а его HMAC-хэш (phone_hash), по которому запись ищется по индексу.
+"""
+import base64
+import hashlib
+import hmac
+import re
+from typing import Any, Iterable, List, Optional
+
+from bot.config import Config
+
+DEFAULT_COUNTRY_CODE = '7'
+PHONE_HASH_LENGTH = 16  # символов base64url (96 бит)
+
+# Всё, кроме цифр (и одного ведущего '+', он проверяется отдельно)
+_NON_DIGITS = re.compile(r'\D+')
+
+
+def phone_values(field: Any) -> List[str]:
+    """
+    Строковые значения телефона из мультиполя Битрикс24 или обычной строки
+    
+    Args:
+        field: Строка, словарь {'VALUE': ...} или список таких значений
+    """
+    if not field:
+        return []
+    if isinstance(field, str):
+        return [field]
+    if isinstance(field, dict):
+        value = field.get('VALUE')
+        return [value] if isinstance(value, str) and value else []
+    if isinstance(field, (list, tuple)):
+        return [value for item in field for value in phone_values(item)]
+    return []
+
+
+def normalize_phone(value: Any, country_code: str = DEFAULT_COUNTRY_CODE) -> Optional[str]:
+    """
+    Приведение номера к E.164
+    
+    Российские номера: 8XXXXXXXXXX и XXXXXXXXXX (10 цифр) дополняются кодом +7.
+    
+    Args:
+        value: Номер в любом формате или мультиполе Битрикс24 (берётся первое значение)
+        country_code: Код страны для номеров без него
+    
+    Returns:
+        "+<цифры>" или None, если номер не распознан
+    """
+    if not isinstance(value, str):
+        values = phone_values(value)
+        if not values:
+            return None
+        value = values[0]
+    
+    value = value.strip()
+    digits = _NON_DIGITS.sub('', value)
+    
+    if not value.startswith('+'):
+        if len(digits) == 11 and digits[0] == '8' and country_code == '7':
+            digits = country_code + digits[1:]
+        elif len(digits) == 10:
+            digits = country_code + digits
+        elif digits.startswith('00'):
+            digits = digits[2:]
+    
+    # E.164: не более 15 цифр; короче 8 - внутренние и ошибочные номера
+    if not 8 <= len(digits) <= 15 or digits[0] == '0':
+        return None
+    return f"+{digits}"
+
+
+def normalize_phones(values: Iterable[Any], country_code: str = DEFAULT_COUNTRY_CODE) -> List[Optional[str]]:
+    """Пакетная нормализация (для загрузки сделок и заполнения колонок)"""
+    return [normalize_phone(value, country_code) for value in values]
+
+
+def _hash_secret() -> bytes:
+    """
+    Ключ хэша: PHONE_HASH_SECRET или производный от токена бота
+    
+    Запасной ключ годится только без ссылок привязки: при смене токена все хэши
+    меняются (после смены ключа - backfill-phones --rehash).
+    """
+    if Config.PHONE_HASH_SECRET:
+        return Config.PHONE_HASH_SECRET.encode()
+    return hashlib.sha256(f"phone:{Config.TELEGRAM_BOT_TOKEN}".encode()).digest()
+
+
+def phone_hash(phone: Any) -> Optional[str]:
+    """
+    Ключевой хэш номера для ссылок привязки (без ключа номер по хэшу не подобрать)
+    
+    Args:
+        phone: Номер в любом формате (нормализуется к E.164)
+    
+    Returns:
+        Строка из PHONE_HASH_LENGTH символов [A-Za-z0-9_-] или None
+    """
+    e164 = normalize_phone(phone)
+    if not e164:
+        return None
+    digest = hmac.new(_hash_secret(), e164.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode()[:PHONE_HASH_LENGTH]
+
+
+def is_valid_phone_hash(value: Optional[str]) -> bool:
+    """Похоже ли значение на phone_hash (проверка до запроса в БД)"""
+    return bool(value) and len(value) == PHONE_HASH_LENGTH and re.fullmatch(r'[A-Za-z0-9_-]+', value) is not None
+
+
+def build_start_link(phone: Any) -> Optional[str]:
+    """Ссылка на бота с параметром привязки по номеру телефона"""
+    value = phone_hash(phone)
+    if not value or not Config.TELEGRAM_BOT_USERNAME:
+        return None
+    return f"https://t.me/{Config.TELEGRAM_BOT_USERNAME}?start=phone_{value}"
@@ -0,0 +1,79 @@
+"""
+Ограничение частоты запросов (токен-бакет)
+"""
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Токен-бакет: пополняется со скоростью rate токенов в секунду,
+    в запасе не более capacity токенов
+    """
+    
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        Args:
+            rate: Скорость пополнения (токенов в секунду)
+            capacity: Максимальный запас (размер всплеска), по умолчанию max(rate, 1)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def try_acquire(self, tokens: float = 1) -> float:
+        """
+        Попытка взять токены без ожидания
+        
+        Returns:
+            0, если токены получены, иначе сколько секунд подождать до следующей попытки
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+    
+    def acquire(self, tokens: float = 1):
+        """Получение токенов с блокирующим ожиданием (для потоков)"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+    
+    async def acquire_async(self, tokens: float = 1) -> float:
+        """
+        Получение токенов с асинхронным ожиданием
+        
+        Returns:
+            Сколько секунд пришлось ждать
+        """
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return waited
+            waited += wait
+            await asyncio.sleep(wait)
+    
+    def penalize(self, seconds: float):
+        """Запрет выдачи токенов на seconds секунд (например, после RetryAfter)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0) - seconds * self.rate
+    
+    @property
+    def is_full(self) -> bool:
+        """Бакет полностью пополнен (давно не использовался)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens >= self.capacity
@@ -0,0 +1,22 @@
+"""
+WSGI-точка входа вебхук-сервера для запуска отдельным процессом
+
+    gunicorn -c gunicorn.conf.py bot.wsgi:app
+
+Сервер только сохраняет события в таблицу webhook_events и отвечает Битрикс24,
+обрабатывают их воркеры очереди в процессе бота (WEBHOOK_SERVER_MODE=external).
+"""
+import logging
+
+from bot.config import Config
+from bot.database import init_db
+from bot.services.webhook_server import app
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=getattr(logging, Config.LOG_LEVEL)
+)
+
+init_db()
+
+__all__ = ['app']
@@ -0,0 +1,33 @@
+"""
+Конфигурация gunicorn для вебхук-сервера (WEBHOOK_SERVER_MODE=external)
+
+    gunicorn -c gunicorn.conf.py bot.wsgi:app
+"""
+import multiprocessing
+import os
+
+bind = f"{os.getenv('WEBHOOK_HOST', '0.0.0.0')}:{os.getenv('WEBHOOK_PORT', '5000')}"
+
+# Процессы масштабируются по ядрам независимо от бота; потоки - на ожидание БД
+workers = int(os.getenv('WEBHOOK_SERVER_WORKERS', str(multiprocessing.cpu_count() * 2 + 1)))
+worker_class = 'gthread'
+threads = int(os.getenv('WEBHOOK_SERVER_THREADS', '4'))
+
+# Таймауты запроса и корректного завершения (текущие запросы дорабатывают)
+timeout = int(os.getenv('WEBHOOK_REQUEST_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('WEBHOOK_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+# Периодический перезапуск воркеров против утечек памяти
+max_requests = 1000
+max_requests_jitter = 100
+
+preload_app = True
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Соединения БД, открытые мастером при preload_app, не используются в дочерних процессах"""
+    from bot.database import engine
+    engine.dispose(close=False)
@@ -8,7 +8,10 @@ from alembic import context
 
 # Импортируем Base и модели
 from bot.database import Base
-from bot.models import User, Appointment, Survey, InteractionLog  # noqa: F401
+from bot.models import (  # noqa: F401
+    User, Appointment, Survey, InteractionLog, StatsHourly, StatsDaily,
+    WebhookEvent, SchedulerLease, SyncState, MessageTemplate
+)
 
 # this is the Alembic Config object
 config = context.config
@@ -35,7 +38,7 @@ def run_migrations_offline() -> None:
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
-
+    
     with context.begin_transaction():
         context.run_migrations()
 
@@ -50,12 +53,12 @@ def run_migrations_online() -> None:
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
     )
-
+    
     with connectable.connect() as connection:
         context.configure(
             connection=connection, target_metadata=target_metadata
         )
-
+        
         with context.begin_transaction():
             context.run_migrations()
 
@@ -0,0 +1,97 @@
+"""Составные индексы для частых запросов
+
+Таблицы создаются init_db() при первом запуске, поэтому миграция идемпотентна:
+таблица webhook_events создаётся, если её ещё нет, недостающие колонки
+добавляются, индексы создаются IF NOT EXISTS.
+
+Revision ID: 3f1c2a7d9b10
+Revises:
+Create Date: 2026-10-18 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a7d9b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    # (имя, таблица, колонки, уникальный)
+    ('ix_appointments_reminder_due', 'appointments', ['reminder_sent', 'appointment_date'], False),
+    ('ix_appointments_appointment_date', 'appointments', ['appointment_date'], False),
+    ('ix_appointments_user_reminder', 'appointments', ['user_id', 'reminder_sent', 'reminder_confirmed', 'appointment_date'], False),
+    ('ix_appointments_user_date', 'appointments', ['user_id', 'appointment_date'], False),
+    ('uq_surveys_appointment_id', 'surveys', ['appointment_id'], True),
+    ('ix_webhook_events_status_available', 'webhook_events', ['status', 'available_at'], False),
+    ('ix_webhook_events_deal_id', 'webhook_events', ['deal_id'], False),
+    ('uq_webhook_events_dedup_key', 'webhook_events', ['dedup_key'], True),
+]
+
+
+# Дубликаты опросов по записи: оставляем отвеченный (с оценкой), иначе самый ранний
+DEDUP_SURVEYS_SQL = (
+    "DELETE FROM surveys WHERE id IN ("
+    " SELECT id FROM ("
+    "  SELECT id, ROW_NUMBER() OVER ("
+    "   PARTITION BY appointment_id"
+    "   ORDER BY rating IS NULL, answered_at IS NULL, id"
+    "  ) AS position FROM surveys"
+    " ) ranked WHERE position > 1"
+    ")"
+)
+
+
+def _create_webhook_events() -> None:
+    """Очередь вебхуков в базах, созданных до её появления (как в модели WebhookEvent)"""
+    op.create_table(
+        'webhook_events',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('event', sa.String(), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('deal_id', sa.Integer(), nullable=True),
+        sa.Column('dedup_key', sa.String(), nullable=True),
+        sa.Column('coalesced', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('status', sa.String(), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('available_at', sa.DateTime(), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_webhook_events_id', 'webhook_events', ['id'])
+    op.create_index('ix_webhook_events_status', 'webhook_events', ['status'])
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    
+    if not inspector.has_table('webhook_events'):
+        _create_webhook_events()
+    else:
+        # Колонки дедупликации вебхуков (в базах, созданных до их появления)
+        columns = {column['name'] for column in inspector.get_columns('webhook_events')}
+        with op.batch_alter_table('webhook_events') as batch_op:
+            if 'deal_id' not in columns:
+                batch_op.add_column(sa.Column('deal_id', sa.Integer(), nullable=True))
+            if 'dedup_key' not in columns:
+                batch_op.add_column(sa.Column('dedup_key', sa.String(), nullable=True))
+            if 'coalesced' not in columns:
+                batch_op.add_column(sa.Column('coalesced', sa.Integer(), nullable=False, server_default='0'))
+    
+    # Уникальный индекс опросов: по каждой записи остаётся один опрос
+    op.execute(DEDUP_SURVEYS_SQL)
+    
+    for name, table, columns, unique in INDEXES:
+        op.create_index(name, table, columns, unique=unique, if_not_exists=True)
+
+
+def downgrade() -> None:
+    # ix_appointments_reminder_due и ix_appointments_appointment_date появились раньше миграций
+    for name, table, columns, unique in reversed(INDEXES[2:]):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,41 @@
+"""Канонический номер телефона (E.164) у пользователей и записей
+
+Колонки заполняются при загрузке сделок; для существующих строк:
+
+    python -m bot.cli backfill-phones
+
+Revision ID: 5b8e0c4f2a61
+Revises: 3f1c2a7d9b10
+Create Date: 2026-10-18 15:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e0c4f2a61'
+down_revision = '3f1c2a7d9b10'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ['users', 'appointments']
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    
+    for table in TABLES:
+        columns = {column['name'] for column in inspector.get_columns(table)}
+        if 'phone_e164' not in columns:
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.add_column(sa.Column('phone_e164', sa.String(), nullable=True))
+        op.create_index(f'ix_{table}_phone_e164', table, ['phone_e164'], if_not_exists=True)
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_index(f'ix_{table}_phone_e164', table_name=table, if_exists=True)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('phone_e164')
@@ -0,0 +1,35 @@
+"""Хэш номера телефона у записей (поиск по ссылке привязки аккаунта)
+
+Для существующих строк заполняется командой:
+
+    python -m bot.cli backfill-phones
+
+Revision ID: 8d2f6a1c7e43
+Revises: 5b8e0c4f2a61
+Create Date: 2026-10-18 17:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2f6a1c7e43'
+down_revision = '5b8e0c4f2a61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('appointments')}
+    if 'phone_hash' not in columns:
+        with op.batch_alter_table('appointments') as batch_op:
+            batch_op.add_column(sa.Column('phone_hash', sa.String(), nullable=True))
+    op.create_index('ix_appointments_phone_hash', 'appointments', ['phone_hash'], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_appointments_phone_hash', table_name='appointments', if_exists=True)
+    with op.batch_alter_table('appointments') as batch_op:
+        batch_op.drop_column('phone_hash')
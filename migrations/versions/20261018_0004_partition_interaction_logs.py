@@ -0,0 +1,141 @@
+"""Секционирование interaction_logs по месяцам (только PostgreSQL)
+
+Таблица пересоздаётся как PARTITION BY RANGE (created_at) с месячными секциями
+interaction_logs_pYYYYMM и секцией по умолчанию, данные копируются. Первичный
+ключ становится (id, created_at) - ключ секционирования обязан в него входить.
+Новые секции создаёт и просроченные удаляет задача apply_retention.
+
+В SQLite миграция ничего не делает.
+
+Revision ID: c7e1f4a9b2d8
+Revises: 8d2f6a1c7e43
+Create Date: 2026-10-18 20:00:00
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e1f4a9b2d8'
+down_revision = '8d2f6a1c7e43'
+branch_labels = None
+depends_on = None
+
+
+TABLE = 'interaction_logs'
+COLUMNS = 'id, user_id, interaction_type, interaction_data, status, created_at'
+INDEXES = [
+    ('ix_interaction_logs_id', ['id']),
+    ('ix_interaction_logs_user_id', ['user_id']),
+    ('ix_interaction_logs_interaction_type', ['interaction_type']),
+    ('ix_interaction_logs_created_at', ['created_at']),
+]
+MONTHS_AHEAD = 2
+
+
+def _is_partitioned(bind) -> bool:
+    return bind.execute(sa.text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :table"
+    ), {'table': TABLE}).first() is not None
+
+
+def _move_aside(bind, old_name: str) -> str:
+    """Переименование таблицы и её индексов, чтобы освободить имена; возвращает последовательность id"""
+    sequence = bind.execute(sa.text("SELECT pg_get_serial_sequence(:table, 'id')"), {'table': TABLE}).scalar()
+    if sequence is None:
+        sequence = f'{TABLE}_id_seq'
+        op.execute(f"CREATE SEQUENCE IF NOT EXISTS {sequence}")
+        op.execute(f"SELECT setval('{sequence}', COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)")
+    
+    op.execute(f"ALTER TABLE {TABLE} RENAME TO {old_name}")
+    indexes = bind.execute(
+        sa.text("SELECT indexname FROM pg_indexes WHERE tablename = :table"), {'table': old_name}
+    ).scalars().all()
+    for name in indexes:
+        op.execute(f'ALTER INDEX "{name}" RENAME TO "{name[:50]}_old"')
+    return sequence
+
+
+def _add_month(value: datetime) -> datetime:
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql' or _is_partitioned(bind):
+        return
+    if not sa.inspect(bind).has_table(TABLE):
+        return
+    
+    old_name = f'{TABLE}_unpartitioned'
+    sequence = _move_aside(bind, old_name)
+    
+    op.execute(f"""
+        CREATE TABLE {TABLE} (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+            user_id INTEGER NOT NULL,
+            interaction_type VARCHAR NOT NULL,
+            interaction_data TEXT,
+            status VARCHAR NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    
+    # Месячные секции от самой старой строки до MONTHS_AHEAD месяцев вперёд
+    now = datetime.utcnow()
+    oldest = bind.execute(sa.text(f"SELECT MIN(created_at) FROM {old_name}")).scalar() or now
+    month = datetime(oldest.year, oldest.month, 1)
+    last = datetime(now.year, now.month, 1)
+    for _ in range(MONTHS_AHEAD):
+        last = _add_month(last)
+    while month <= last:
+        following = _add_month(month)
+        op.execute(
+            f"CREATE TABLE {TABLE}_p{month:%Y%m} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        )
+        month = following
+    op.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+    
+    op.execute(
+        f"INSERT INTO {TABLE} ({COLUMNS}) "
+        f"SELECT id, user_id, interaction_type, interaction_data, status, "
+        f"COALESCE(created_at, now() AT TIME ZONE 'utc') FROM {old_name}"
+    )
+    # Последовательность должна пережить удаление старой таблицы
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id")
+    op.execute(f"DROP TABLE {old_name}")
+    
+    for name, columns in INDEXES:
+        op.create_index(name, TABLE, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql' or not _is_partitioned(bind):
+        return
+    
+    old_name = f'{TABLE}_partitioned'
+    sequence = _move_aside(bind, old_name)
+    
+    op.execute(f"""
+        CREATE TABLE {TABLE} (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}') PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            interaction_type VARCHAR NOT NULL,
+            interaction_data TEXT,
+            status VARCHAR NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE
+        )
+    """)
+    op.execute(f"INSERT INTO {TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM {old_name}")
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id")
+    op.execute(f"DROP TABLE {old_name}")
+    
+    for name, columns in INDEXES:
+        op.create_index(name, TABLE, columns, if_not_exists=True)
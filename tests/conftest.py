@@ -0,0 +1,53 @@
+"""
+Общие фикстуры тестов: отдельные БД SQLite со всеми таблицами
+"""
+import pytest
+import pytest_asyncio
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from bot.database import Base
+
+MEMORY_URL = "sqlite://"
+
+
+@pytest.fixture
+def make_session_factory():
+    """
+    Создание фабрики сессий к отдельной БД
+    
+    make_session_factory() - БД в памяти: все сессии работают через одно
+    соединение (StaticPool). make_session_factory(url, timeout=10) - файловая БД,
+    у каждого потока своё соединение; именованные аргументы уходят в connect_args.
+    """
+    engines = []
+    
+    def make(url: str = MEMORY_URL, **connect_args):
+        pool = {'poolclass': StaticPool} if url == MEMORY_URL else {}
+        engine = create_engine(url, connect_args={"check_same_thread": False, **connect_args}, **pool)
+        Base.metadata.create_all(bind=engine)
+        engines.append(engine)
+        return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    
+    yield make
+    
+    for engine in engines:
+        engine.dispose()
+
+
+@pytest.fixture
+def session_factory(make_session_factory):
+    """Сессии к отдельной БД в памяти"""
+    return make_session_factory()
+
+
+@pytest_asyncio.fixture
+async def async_session_factory():
+    """Асинхронные сессии к отдельной БД в памяти"""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
@@ -0,0 +1,50 @@
+"""
+Тесты привязки аккаунта по ссылке start=phone_<хэш>
+"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from bot.models import Appointment, User
+from bot.services.account_linking import link_account
+from bot.utils.phone import phone_hash
+
+PHONE = '+79991234567'
+
+
+@pytest.mark.asyncio
+async def test_link_backfills_appointments(async_session_factory):
+    """Привязка создаёт пользователя, привязывает все записи номера и отдаёт ожидающие напоминания"""
+    now = datetime.now()
+    async with async_session_factory() as db:
+        db.add_all([
+            Appointment(bitrix24_deal_id=1, phone_number='8 999 123-45-67', phone_e164=PHONE,
+                        phone_hash=phone_hash(PHONE), appointment_date=now - timedelta(days=5)),
+            Appointment(bitrix24_deal_id=2, phone_number='8 999 123-45-67', phone_e164=PHONE,
+                        phone_hash=phone_hash(PHONE), appointment_date=now + timedelta(days=2)),
+            Appointment(bitrix24_deal_id=3, phone_e164='+79990000000', appointment_date=now + timedelta(days=2)),
+        ])
+        await db.commit()
+    
+    tg_user = SimpleNamespace(id=555, username='anna', first_name='Анна', last_name=None)
+    
+    assert await link_account(tg_user, 'not-a-hash', async_session_factory) is None
+    assert await link_account(tg_user, phone_hash('+79990000001'), async_session_factory) is None
+    
+    result = await link_account(tg_user, phone_hash('8 (999) 123-45-67'), async_session_factory)
+    
+    assert result.linked_appointments == 2
+    assert [appointment_id for appointment_id, _ in result.pending] == [2]
+    
+    async with async_session_factory() as db:
+        user = await db.scalar(select(User).where(User.telegram_id == 555))
+        assert user.phone_e164 == PHONE
+        linked = (await db.scalars(select(Appointment.bitrix24_deal_id).where(Appointment.user_id == user.id))).all()
+        assert sorted(linked) == [1, 2]
+    
+    # Повторная привязка ничего не меняет
+    again = await link_account(tg_user, phone_hash(PHONE), async_session_factory)
+    assert again.user_id == result.user_id
+    assert again.linked_appointments == 0
@@ -0,0 +1,106 @@
+"""
+Тесты клиента Битрикс24
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bot.config import Config
+from bot.services.bitrix24 import Bitrix24Batcher, Bitrix24Client, build_query
+
+
+class FakeResponse:
+    """Ответ requests с заданным статусом и телом"""
+    
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+    
+    def json(self):
+        return self.body
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Клиент без задержек между повторами"""
+    monkeypatch.setattr(Config, 'BITRIX24_WEBHOOK_URL', 'https://example.bitrix24.ru/rest/1/token/')
+    monkeypatch.setattr(Config, 'BITRIX24_BACKOFF', 0)
+    monkeypatch.setattr(Config, 'BITRIX24_BATCH_ENABLED', False)
+    return Bitrix24Client()
+
+
+def fake_post(client, monkeypatch, responses):
+    """Подмена session.post последовательностью ответов"""
+    calls = []
+    
+    def post(url, json=None, timeout=None):
+        calls.append(url)
+        return responses.pop(0)
+    
+    monkeypatch.setattr(client.session, 'post', post)
+    return calls
+
+
+def test_query_limit_exceeded_is_retried(client, monkeypatch):
+    """QUERY_LIMIT_EXCEEDED и 5xx повторяются до успешного ответа"""
+    calls = fake_post(client, monkeypatch, [
+        FakeResponse(503, {'error': 'QUERY_LIMIT_EXCEEDED'}),
+        FakeResponse(502, {}),
+        FakeResponse(200, {'result': {'ID': '7'}}),
+    ])
+    
+    assert client.get_deal(7) == {'ID': '7'}
+    assert len(calls) == 3
+
+
+def test_client_error_not_retried(client, monkeypatch):
+    """Ошибки клиента (4xx) не повторяются"""
+    calls = fake_post(client, monkeypatch, [
+        FakeResponse(400, {'error': 'NOT_FOUND'}),
+    ])
+    
+    assert client.get_deal(7) is None
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_async_variant(client, monkeypatch):
+    """Асинхронный вариант выполняется в пуле потоков клиента"""
+    fake_post(client, monkeypatch, [
+        FakeResponse(200, {'result': True}),
+    ])
+    
+    assert await client.update_deal_async(7, {'UF_CRM_REMINDER_CONFIRMED': 'Y'}) is True
+
+
+def test_build_query_nested_params():
+    """Параметры команд batch кодируются как http_build_query"""
+    query = build_query({'id': 5, 'fields': {'UF_CRM_REMINDER_CONFIRMED': 'Y'}, 'select': ['ID', 'TITLE']})
+    
+    assert query == (
+        'id=5&fields%5BUF_CRM_REMINDER_CONFIRMED%5D=Y'
+        '&select%5B0%5D=ID&select%5B1%5D=TITLE'
+    )
+
+
+def test_concurrent_calls_coalesced_into_batch(client, monkeypatch):
+    """Одновременные get_deal из разных потоков уходят одним вызовом batch"""
+    monkeypatch.setattr(client, 'batcher', Bitrix24Batcher(client, window=0.2))
+    requests_sent = []
+    
+    def post(url, json=None, timeout=None):
+        requests_sent.append((url, json))
+        results = {
+            key: {'ID': command.split('id=')[1]}
+            for key, command in json['cmd'].items()
+        }
+        return FakeResponse(200, {'result': {'result': results, 'result_error': []}})
+    
+    monkeypatch.setattr(client.session, 'post', post)
+    
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        deals = list(executor.map(client.get_deal, [1, 2, 3, 4, 5]))
+    
+    assert deals == [{'ID': str(deal_id)} for deal_id in [1, 2, 3, 4, 5]]
+    assert len(requests_sent) == 1
+    assert requests_sent[0][0].endswith('/batch')
@@ -0,0 +1,66 @@
+"""
+Тесты кэша TTL + LRU
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bot.utils.cache import TTLCache
+
+
+def test_lru_eviction():
+    """При переполнении вытесняется давно не использованная запись"""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set(1, 'a')
+    cache.set(2, 'b')
+    cache.get(1)
+    cache.set(3, 'c')
+    
+    assert cache.get(1) == 'a'
+    assert cache.get(2) is None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_ttl_expiry():
+    """Запись перестаёт отдаваться после истечения TTL"""
+    cache = TTLCache(maxsize=10, ttl=0.05)
+    cache.set(1, 'a')
+    time.sleep(0.1)
+    
+    assert cache.get(1) is None
+
+
+def test_concurrent_misses_load_once():
+    """Одновременные промахи по одному ключу вызывают загрузку один раз"""
+    cache = TTLCache(maxsize=10, ttl=60)
+    calls = []
+    
+    def loader():
+        calls.append(1)
+        time.sleep(0.1)
+        return {'ID': '1'}
+    
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        results = list(executor.map(lambda _: cache.get_or_load(1, loader), range(5)))
+    
+    assert len(calls) == 1
+    assert results == [{'ID': '1'}] * 5
+
+
+def test_invalidate_during_load_not_cached():
+    """Значение, загруженное до инвалидации, не попадает в кэш"""
+    cache = TTLCache(maxsize=10, ttl=60)
+    
+    def loader():
+        cache.invalidate(1)
+        return 'stale'
+    
+    assert cache.get_or_load(1, loader) == 'stale'
+    assert cache.get(1) is None
+
+
+def test_none_not_cached():
+    """Ошибка загрузки (None) не кэшируется"""
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.get_or_load(1, lambda: None)
+    
+    assert cache.get_or_load(1, lambda: 'fresh') == 'fresh'
@@ -0,0 +1,41 @@
+"""
+Тесты подписанных callback_data
+"""
+import pytest
+
+from bot.utils.callback_data import (
+    MAX_CALLBACK_DATA, REMINDER, SURVEY, decode_callback, encode_callback
+)
+from bot.utils.keyboards import get_reminder_keyboard, get_survey_keyboard
+
+
+def test_roundtrip():
+    """Закодированные данные разбираются обратно в вид, действие и id записи"""
+    data = encode_callback(SURVEY, '5', 123456)
+    payload = decode_callback(data)
+    
+    assert payload.kind == SURVEY
+    assert payload.action == '5'
+    assert payload.appointment_id == 123456
+
+
+def test_tampered_data_rejected():
+    """Изменённый id записи или действие не проходят проверку подписи"""
+    data = encode_callback(REMINDER, 'y', 42)
+    kind, action, id36, signature = data.split(':')
+    
+    assert decode_callback(f"{kind}:{action}:{id36}0:{signature}") is None
+    assert decode_callback(f"{kind}:n:{id36}:{signature}") is None
+    assert decode_callback("reminder_confirm") is None
+    
+    with pytest.raises(ValueError):
+        encode_callback(REMINDER, '5', 42)
+
+
+def test_fits_telegram_limit():
+    """Даже для максимального id строка укладывается в лимит Telegram"""
+    data = encode_callback(REMINDER, 'n', 2 ** 63 - 1)
+    assert len(data.encode()) <= MAX_CALLBACK_DATA
+    
+    buttons = get_reminder_keyboard(7).inline_keyboard[0] + get_survey_keyboard(7).inline_keyboard[0]
+    assert all(decode_callback(b.callback_data).appointment_id == 7 for b in buttons)
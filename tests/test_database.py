@@ -0,0 +1,36 @@
+"""
+Тесты профиля подключения к БД
+"""
+from sqlalchemy import text
+
+from bot.database import TimedQueuePool, create_db_engine, engine_options, get_async_database_url
+
+
+def test_async_database_url():
+    """URL переводится на асинхронный драйвер"""
+    assert get_async_database_url('sqlite:///./bot.db') == 'sqlite+aiosqlite:///./bot.db'
+    assert get_async_database_url('postgresql://u:p@db/bot') == 'postgresql+asyncpg://u:p@db/bot'
+    assert get_async_database_url('postgresql+psycopg2://u:p@db/bot') == 'postgresql+asyncpg://u:p@db/bot'
+
+
+def test_engine_options_by_profile():
+    """Пул с замером ожидания для файловой SQLite и PostgreSQL, пул по умолчанию для SQLite в памяти"""
+    assert 'poolclass' not in engine_options('sqlite://')
+    assert engine_options('sqlite:///./bot.db')['poolclass'] is TimedQueuePool
+    
+    options = engine_options('postgresql://u:p@db/bot')
+    assert options['pool_pre_ping'] is True
+    assert 'connect_args' not in options
+
+
+def test_sqlite_pragmas_applied(tmp_path):
+    """Файловая SQLite работает в режиме WAL с busy_timeout"""
+    db_engine = create_db_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    
+    with db_engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == 'wal'
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+    
+    assert db_engine.pool.wait_stats.stats()['checkouts'] == 1
+    db_engine.dispose()
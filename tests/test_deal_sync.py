@@ -0,0 +1,210 @@
+"""
+Тесты сверки записей со сделками Битрикс24
+"""
+from datetime import datetime
+
+from bot.config import Config
+from bot.handlers import notifications
+from bot.models import Appointment, SyncState, User
+from bot.services.bitrix24 import Bitrix24Client
+from bot.services.deal_sync import DealReconciler
+
+
+def make_deal(deal_id, date='2026-11-01T10:00:00+03:00', modified='2026-10-01T10:00:00+03:00', title='Чистка'):
+    return {
+        'ID': str(deal_id),
+        'TITLE': title,
+        'BEGINDATE': date,
+        'DATE_MODIFY': modified,
+        'PHONE': [{'VALUE': f'8 999 000 {deal_id:04d}', 'VALUE_TYPE': 'MOBILE'}],
+    }
+
+
+class FakeClient:
+    """Клиент Битрикс24 со сделками в памяти"""
+    
+    def __init__(self, deals):
+        self.deals = deals
+        self.filters = []
+    
+    def iter_list_by_id(self, method, params=None):
+        self.filters.append(params['filter'])
+        since = params['filter'].get('>=DATE_MODIFY')
+        deals = [deal for deal in self.deals if not since or deal['DATE_MODIFY'] >= since]
+        for offset in range(0, len(deals), 50):
+            yield deals[offset:offset + 50]
+
+
+def test_reconcile_creates_and_updates_in_bulk(session_factory):
+    """Отсутствующие сделки создаются, изменённые обновляются, остальные не трогаются"""
+    db = session_factory()
+    user = User(telegram_id=1, phone_e164='+79990000002')
+    db.add(user)
+    db.add(Appointment(bitrix24_deal_id=1, appointment_date=datetime(2026, 11, 1, 10), procedure_name='Старое'))
+    db.commit()
+    user_id = user.id
+    db.close()
+    
+    deals = [make_deal(i) for i in range(1, 121)] + [{'ID': '500', 'TITLE': 'Без даты'}]
+    reconciler = DealReconciler(client=FakeClient(deals), session_factory=session_factory, batch_size=40)
+    stats = reconciler.run(full=True)
+    
+    assert stats['created'] == 119
+    assert stats['updated'] == 1
+    assert stats['skipped'] == 1
+    
+    db = session_factory()
+    assert db.query(Appointment).count() == 120
+    updated = db.query(Appointment).filter(Appointment.bitrix24_deal_id == 1).one()
+    assert updated.procedure_name == 'Чистка'
+    assert updated.phone_e164 == '+79990000001'
+    linked = db.query(Appointment).filter(Appointment.bitrix24_deal_id == 2).one()
+    assert linked.user_id == user_id
+    assert db.get(SyncState, 'deals').watermark == '2026-10-01T10:00:00+03:00'
+    db.close()
+    
+    # Повторная сверка без изменений ничего не пишет
+    stats = reconciler.run(full=True)
+    assert stats['created'] == stats['updated'] == 0
+    assert stats['unchanged'] == 120
+
+
+def test_incremental_run_starts_from_watermark(session_factory):
+    """Инкрементальная сверка запрашивает сделки от сохранённой отметки с запасом"""
+    client = FakeClient([make_deal(1), make_deal(2, modified='2026-10-05T10:00:00+03:00')])
+    reconciler = DealReconciler(client=client, session_factory=session_factory, overlap=60)
+    reconciler.run(full=True)
+    
+    client.deals.append(make_deal(3, modified='2026-10-06T10:00:00+03:00'))
+    stats = reconciler.run()
+    
+    assert client.filters[-1] == {'>=DATE_MODIFY': '2026-10-05T09:59:00+03:00'}
+    assert stats['deals'] == 2
+    assert stats['created'] == 1
+    assert reconciler.get_watermark() == '2026-10-06T10:00:00+03:00'
+
+
+def test_archived_appointments_are_not_recreated(session_factory, monkeypatch):
+    """Полная сверка не возвращает записи старше срока хранения"""
+    monkeypatch.setattr(Config, 'RETENTION_APPOINTMENT_DAYS', 30)
+    client = FakeClient([make_deal(1, date='2020-01-10T10:00:00+03:00'), make_deal(2)])
+    stats = DealReconciler(client=client, session_factory=session_factory).run(full=True)
+    
+    assert stats['created'] == 1
+    assert stats['skipped'] == 1
+
+
+def test_iter_list_by_id_chains_pages_in_batch(monkeypatch):
+    """Страницы запрашиваются пачкой через batch со ссылкой на ID последнего элемента"""
+    monkeypatch.setattr(Config, 'BITRIX24_WEBHOOK_URL', 'https://example.bitrix24.ru/rest/1/token/')
+    monkeypatch.setattr(Config, 'BITRIX24_BATCH_ENABLED', False)
+    client = Bitrix24Client()
+    items = [{'ID': str(i)} for i in range(1, 131)]
+    calls = []
+    
+    def batch_call(commands):
+        calls.append(commands)
+        pages, last_id = [], commands[0][1]['filter']['>ID']
+        for _, params in commands:
+            page = [item for item in items if int(item['ID']) > last_id][:50]
+            pages.append(page)
+            last_id = int(page[-1]['ID']) if page else last_id
+        return pages
+    
+    monkeypatch.setattr(client, 'batch_call', batch_call)
+    pages = list(client.iter_list_by_id('crm.deal.list', {'filter': {'CATEGORY_ID': 0}}, pages_per_call=2))
+    
+    assert [len(page) for page in pages] == [50, 50, 30]
+    assert len(calls) == 2
+    first, second = calls[0]
+    assert first[1]['start'] == -1
+    assert second[1]['filter'] == {'CATEGORY_ID': 0, '>ID': '$result[c0][49][ID]'}
+    assert calls[1][0][1]['filter']['>ID'] == 100
+
+
+def test_created_appointments_passed_to_scheduler(session_factory):
+    """Созданные сверкой записи передаются на планирование, уже сохранённые - нет"""
+    db = session_factory()
+    db.add(Appointment(bitrix24_deal_id=1, appointment_date=datetime(2026, 11, 1, 10)))
+    db.commit()
+    db.close()
+    
+    scheduled = []
+    
+    def on_created(pending):
+        scheduled.extend(pending)
+        return len(pending)
+    
+    reconciler = DealReconciler(
+        client=FakeClient([make_deal(i) for i in range(1, 4)]),
+        session_factory=session_factory,
+        on_created=on_created
+    )
+    stats = reconciler.run(full=True)
+    
+    db = session_factory()
+    expected = sorted(
+        (row.id, row.appointment_date)
+        for row in db.query(Appointment).filter(Appointment.bitrix24_deal_id.in_([2, 3]))
+    )
+    db.close()
+    assert sorted(scheduled) == expected
+    assert expected[0][1] == datetime(2026, 11, 1, 10)
+    assert stats['created'] == stats['scheduled'] == 2
+
+
+def test_rescheduled_deal_moves_reminder(session_factory, monkeypatch):
+    """Перенос записи на новое время сбрасывает отправленное напоминание и переносит задачи"""
+    db = session_factory()
+    user = User(telegram_id=1)
+    db.add(user)
+    db.flush()
+    appointment = Appointment(
+        bitrix24_deal_id=7, user_id=user.id, appointment_date=datetime(2026, 11, 1, 10),
+        reminder_sent=True, reminder_confirmed=True
+    )
+    db.add(appointment)
+    db.commit()
+    appointment_id = appointment.id
+    db.close()
+    
+    calls = []
+    
+    class FakeScheduler:
+        mode = 'jobs'
+        
+        def cancel_job(self, job_id):
+            calls.append(('cancel', job_id))
+        
+        def schedule_reminder(self, appointment_id, appointment_date, callback_func):
+            calls.append(('reminder', appointment_id, appointment_date))
+        
+        def schedule_survey(self, appointment_id, appointment_date, callback_func):
+            calls.append(('survey', appointment_id, appointment_date))
+    
+    class DealClient:
+        def get_deal(self, deal_id):
+            return make_deal(deal_id, date='2099-11-05T12:00:00+03:00')
+    
+    monkeypatch.setattr(notifications, 'SessionLocal', session_factory)
+    monkeypatch.setattr(notifications, 'get_bitrix_client', DealClient)
+    monkeypatch.setattr(notifications, '_app_scheduler', FakeScheduler())
+    
+    assert notifications.update_appointment(7)
+    
+    new_date = datetime(2099, 11, 5, 12)
+    assert calls == [
+        ('cancel', f'reminder_{appointment_id}'),
+        ('reminder', appointment_id, new_date),
+        ('survey', appointment_id, new_date),
+    ]
+    db = session_factory()
+    updated = db.get(Appointment, appointment_id)
+    assert updated.appointment_date == new_date
+    assert updated.reminder_sent is False and updated.reminder_confirmed is None
+    db.close()
+    
+    # Повторное обновление без смены даты задачи не трогает
+    calls.clear()
+    assert notifications.update_appointment(7)
+    assert calls == []
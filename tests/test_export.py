@@ -0,0 +1,110 @@
+"""
+Тесты потоковой выгрузки опросов и записей
+"""
+import csv
+import functools
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from bot.config import Config
+from bot.models import Appointment, Survey, User
+from bot.services import export, webhook_server
+from bot.services.export import parse_date_bound, stream_export
+
+START = datetime(2026, 10, 1, 10, 0)
+
+
+@pytest.fixture
+def session_factory(session_factory):
+    """БД в памяти с 300 записями и опросами"""
+    db = session_factory()
+    user = User(telegram_id=42)
+    db.add(user)
+    db.flush()
+    for i in range(300):
+        appointment = Appointment(
+            bitrix24_deal_id=i + 1, user_id=user.id, appointment_date=START + timedelta(hours=i),
+            procedure_name='Чистка' if i % 2 else 'Осмотр, первичный'
+        )
+        db.add(appointment)
+        db.flush()
+        db.add(Survey(appointment_id=appointment.id, user_id=user.id, rating=i % 5 + 1,
+                      sent_at=appointment.appointment_date + timedelta(hours=2)))
+    db.commit()
+    db.close()
+    return session_factory
+
+
+def test_csv_export_streams_filtered_rows_in_chunks(session_factory, monkeypatch):
+    """CSV отдаётся кусками, фильтры по периоду и процедуре применяются в запросе"""
+    monkeypatch.setattr(export, 'WRITE_BUFFER_SIZE', 1024)
+    chunks = list(stream_export(
+        'surveys', 'csv',
+        date_from=parse_date_bound('2026-10-02'),
+        date_to=parse_date_bound('2026-10-03', end=True),
+        procedure='Осмотр, первичный',
+        session_factory=session_factory
+    ))
+    
+    assert len(chunks) > 1
+    rows = list(csv.DictReader(io.StringIO(''.join(chunks))))
+    assert len(rows) == 24
+    assert rows[0]['procedure_name'] == 'Осмотр, первичный'
+    assert rows[0]['telegram_id'] == '42'
+    assert rows[0]['sent_at'] == '2026-10-02T00:00:00'
+    assert rows[0]['answered_at'] == ''
+
+
+def test_invalid_arguments_rejected_before_reading():
+    """Неизвестный набор или формат - ошибка до обращения к БД"""
+    with pytest.raises(ValueError):
+        stream_export('users', 'csv')
+    with pytest.raises(ValueError):
+        stream_export('surveys', 'xlsx')
+    with pytest.raises(ValueError):
+        parse_date_bound('01.10.2026')
+
+
+def test_admin_endpoint_requires_token(session_factory, monkeypatch):
+    """Эндпоинт выгрузки отключён без токена и отдаёт JSONL с верным токеном"""
+    monkeypatch.setattr(webhook_server, 'stream_export', functools.partial(stream_export, session_factory=session_factory))
+    client = webhook_server.app.test_client()
+    
+    monkeypatch.setattr(Config, 'ADMIN_API_TOKEN', '')
+    assert client.get('/admin/export/surveys').status_code == 404
+    
+    monkeypatch.setattr(Config, 'ADMIN_API_TOKEN', 'token')
+    assert client.get('/admin/export/surveys', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/admin/export/users', headers={'Authorization': 'Bearer token'}).status_code == 400
+    
+    response = client.get(
+        '/admin/export/appointments?format=jsonl&procedure=Чистка',
+        headers={'Authorization': 'Bearer token'}
+    )
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.headers['Content-Type'].startswith('application/x-ndjson')
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(rows) == 150
+    assert rows[0]['rating'] == 2
+
+
+def test_metrics_requires_token(monkeypatch):
+    """Метрики на публичном порту отдаются только с токеном администратора"""
+    client = webhook_server.app.test_client()
+    
+    monkeypatch.setattr(Config, 'ADMIN_API_TOKEN', '')
+    assert client.get('/metrics').status_code == 404
+    
+    monkeypatch.setattr(Config, 'ADMIN_API_TOKEN', 'token')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    queue = type('Queue', (), {'stats': lambda self: {}, 'backlog': lambda self: {}})()
+    monkeypatch.setattr(webhook_server, 'get_webhook_queue', lambda: queue)
+    monkeypatch.setattr(webhook_server, 'get_pool_stats', lambda: {})
+    response = client.get('/metrics', headers={'Authorization': 'Bearer token'})
+    assert response.status_code == 200
+    assert 'webhook_queue' in response.get_json()
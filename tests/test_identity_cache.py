@@ -0,0 +1,46 @@
+"""
+Тесты кэша идентификации пользователей
+"""
+import pytest
+
+from bot.models import User
+from bot.services.identity_cache import IdentityCache
+
+
+@pytest.fixture
+def session_factory(session_factory):
+    """БД в памяти с двумя пользователями"""
+    db = session_factory()
+    db.add_all([
+        User(telegram_id=100, phone_number='8 (900) 000-00-01', phone_e164='+79000000001'),
+        User(telegram_id=200, phone_number='79000000002', phone_e164='+79000000002'),
+    ])
+    db.commit()
+    db.close()
+    return session_factory
+
+
+def test_warm_then_hit_without_queries(session_factory):
+    """После прогрева поиск по telegram_id и телефону не обращается к БД"""
+    cache = IdentityCache(maxsize=10, ttl=60, session_factory=session_factory)
+    assert cache.warm() == 2
+    
+    cache.session_factory = None  # любой запрос к БД упадёт
+    assert cache.user_id_by_telegram(100) == 1
+    assert cache.user_id_by_phone('8 900 000 00 01') == 1
+    assert cache.stats()['telegram_id']['hits'] == 1
+
+
+def test_miss_loads_and_invalidate_drops(session_factory):
+    """Промах загружает id из БД, сброс заставляет перечитать"""
+    cache = IdentityCache(maxsize=10, ttl=60, session_factory=session_factory)
+    
+    assert cache.user_id_by_telegram(200) == 2
+    assert cache.user_id_by_telegram(300) is None
+    assert cache.user_id_by_telegram(200) == 2
+    assert cache.stats()['telegram_id']['misses'] == 2
+    
+    cache.invalidate(telegram_id=200)
+    assert cache.by_telegram.get(200) is None
+    assert cache.user_id_by_phone('  ') is None
+    assert cache.user_id_by_phone([{'VALUE': '+7 900 000-00-02'}]) == 2
@@ -0,0 +1,63 @@
+"""
+Тесты буферизованной записи взаимодействий
+"""
+import json
+
+from bot.models import InteractionLog
+from bot.services.interactions import REMINDER, InteractionRecorder
+
+
+def count_logs(session_factory):
+    db = session_factory()
+    try:
+        return db.query(InteractionLog).count()
+    finally:
+        db.close()
+
+
+def test_burst_is_buffered_and_overflow_counted(session_factory):
+    """Всплеск не блокирует запись: сверх буфера события отбрасываются со счётчиком"""
+    recorder = InteractionRecorder(max_buffer=100, batch_size=30, flush_interval=60, session_factory=session_factory)
+    
+    accepted = [recorder.record(1, REMINDER, 'sent', {'appointment_id': i}) for i in range(150)]
+    
+    assert accepted.count(True) == 100
+    assert recorder.stats()['dropped'] == 50
+    assert count_logs(session_factory) == 0
+    
+    assert recorder.flush() == 100
+    assert recorder.stats()['flushes'] == 4
+    assert count_logs(session_factory) == 100
+    
+    db = session_factory()
+    row = db.query(InteractionLog).order_by(InteractionLog.id).first()
+    assert json.loads(row.interaction_data) == {'appointment_id': 0}
+    db.close()
+
+
+def test_stop_flushes_remaining(session_factory):
+    """При остановке буфер сбрасывается в БД"""
+    recorder = InteractionRecorder(max_buffer=100, batch_size=50, flush_interval=60, session_factory=session_factory)
+    recorder.start()
+    recorder.record(1, REMINDER, 'sent')
+    recorder.record(None, REMINDER, 'sent')  # без пользователя не пишется
+    recorder.stop()
+    
+    assert count_logs(session_factory) == 1
+    assert recorder.stats()['buffered'] == 0
+
+
+def test_failed_flush_keeps_events():
+    """Если БД недоступна, события остаются в буфере до следующего сброса"""
+    def broken_session():
+        raise RuntimeError("БД недоступна")
+    
+    recorder = InteractionRecorder(max_buffer=10, batch_size=5, flush_interval=60, session_factory=broken_session)
+    for _ in range(3):
+        recorder.record(1, REMINDER, 'sent')
+    
+    assert recorder.flush() == 0
+    stats = recorder.stats()
+    assert stats['buffered'] == 3
+    assert stats['failed'] == 3
+    assert stats['dropped'] == 0
@@ -0,0 +1,132 @@
+"""
+Тесты выбора ведущего экземпляра и атомарного захвата напоминаний
+"""
+import asyncio
+import functools
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from apscheduler.jobstores.memory import MemoryJobStore
+from sqlalchemy import select
+
+from bot.config import Config
+from bot.handlers import notifications
+from bot.handlers.notifications import _claim_reminders, _claim_survey, _release_reminder, _sweep
+from bot.models import Appointment, User
+from bot.services.leader import LeaderElection
+from bot.services.scheduler import SchedulerService
+
+
+def test_only_one_instance_is_leader(session_factory):
+    """Аренду держит один экземпляр, после освобождения её забирает другой"""
+    first = LeaderElection(ttl=30, session_factory=session_factory)
+    second = LeaderElection(ttl=30, session_factory=session_factory)
+    
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    assert first.try_acquire()
+    
+    first.release()
+    
+    assert not first.is_leader
+    assert second.try_acquire()
+
+
+def test_expired_lease_taken_over(session_factory):
+    """Если ведущий перестал продлевать аренду, её забирает другой экземпляр"""
+    demoted = []
+    first = LeaderElection(ttl=1, session_factory=session_factory, on_demoted=lambda: demoted.append(True))
+    second = LeaderElection(ttl=1, session_factory=session_factory)
+    
+    assert first.try_acquire()
+    time.sleep(1.1)
+    
+    assert second.try_acquire()
+    assert not first.try_acquire()
+    assert demoted == [True]
+
+
+@pytest.mark.asyncio
+async def test_reminder_and_survey_claimed_once(async_session_factory):
+    """Напоминание и опрос захватываются только одним обработчиком"""
+    async with async_session_factory() as db:
+        user = User(telegram_id=1)
+        db.add(user)
+        await db.flush()
+        appointment = Appointment(bitrix24_deal_id=1, user_id=user.id, appointment_date=datetime.utcnow())
+        db.add(appointment)
+        await db.commit()
+    
+    assert await _claim_reminders([appointment.id], async_session_factory) == {appointment.id}
+    assert await _claim_reminders([appointment.id], async_session_factory) == set()
+    
+    assert await _claim_survey(appointment, async_session_factory)
+    assert not await _claim_survey(appointment, async_session_factory)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_sweep_releases_unsent_claims(async_session_factory, monkeypatch):
+    """Отмена обхода посреди пачки снимает захват с неотправленных записей"""
+    monkeypatch.setattr(notifications, 'AsyncSessionLocal', async_session_factory)
+    
+    async with async_session_factory() as db:
+        user = User(telegram_id=1)
+        db.add(user)
+        await db.flush()
+        db.add_all([
+            Appointment(bitrix24_deal_id=i, user_id=user.id, appointment_date=datetime(2026, 10, 19, 10, i))
+            for i in (1, 2)
+        ])
+        await db.commit()
+    
+    first_sent = asyncio.Event()
+    
+    async def deliver(appointment, user, bot):
+        if appointment.bitrix24_deal_id == 1:
+            first_sent.set()
+            return
+        await asyncio.sleep(60)
+    
+    async def claim(appointments):
+        return await _claim_reminders([appointment.id for appointment in appointments], async_session_factory)
+    
+    sweep = asyncio.create_task(_sweep(
+        'test', lambda: [Appointment.reminder_sent == False], deliver, claim,
+        functools.partial(_release_reminder, session_factory=async_session_factory),
+        bot=object()
+    ))
+    await asyncio.wait_for(first_sent.wait(), timeout=5)
+    await asyncio.sleep(0.05)
+    sweep.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await sweep
+    
+    async with async_session_factory() as db:
+        rows = (await db.execute(
+            select(Appointment.bitrix24_deal_id, Appointment.reminder_sent).order_by(Appointment.bitrix24_deal_id)
+        )).all()
+    assert [tuple(row) for row in rows] == [(1, True), (2, False)]
+
+
+@pytest.mark.asyncio
+async def test_job_due_during_failover_runs_after_resume(monkeypatch):
+    """Напоминание, подошедшее пока общий планировщик на паузе, выполняется после возобновления"""
+    monkeypatch.setattr(Config, 'SCHEDULER_LEADER_ELECTION', False)
+    service = SchedulerService(jobstore=MemoryJobStore())
+    service.scheduler.start(paused=True)
+    fired = threading.Event()
+    try:
+        service._add_date_job('reminder_1', datetime.now(timezone.utc) + timedelta(seconds=0.1), fired.set)
+        # Дольше стандартного misfire_grace_time APScheduler (1 с)
+        await asyncio.sleep(1.5)
+        
+        service._on_elected()
+        for _ in range(50):
+            if fired.is_set():
+                break
+            await asyncio.sleep(0.05)
+        assert fired.is_set()
+    finally:
+        service.scheduler.shutdown(wait=False)
@@ -0,0 +1,47 @@
+"""
+Тесты выполнения задач планировщика в event loop приложения
+"""
+import asyncio
+import threading
+
+import pytest
+
+from bot.config import Config
+from bot.services.loop_bridge import LoopBridge, loop_bridge, run_coroutine_job
+
+
+@pytest.fixture
+def running_loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    loop_bridge.attach(loop)
+    yield loop
+    loop_bridge.detach()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=2)
+    loop.close()
+
+
+def test_long_job_is_not_cancelled(running_loop, monkeypatch):
+    """Задача дольше LOOP_BRIDGE_TIMEOUT дорабатывает до конца"""
+    monkeypatch.setattr(Config, 'LOOP_BRIDGE_TIMEOUT', 0.05)
+    sent = []
+    
+    async def sweep():
+        for i in range(5):
+            await asyncio.sleep(0.03)
+            sent.append(i)
+        return len(sent)
+    
+    assert run_coroutine_job(sweep) == 5
+    assert sent == [0, 1, 2, 3, 4]
+
+
+def test_request_timeout_still_applies(running_loop):
+    """Обычный вызов run по-прежнему ограничен таймаутом"""
+    bridge = LoopBridge()
+    bridge.attach(running_loop)
+    
+    with pytest.raises(TimeoutError):
+        bridge.run(asyncio.sleep(1), timeout=0.05)
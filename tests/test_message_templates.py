@@ -0,0 +1,83 @@
+"""
+Тесты шаблонов сообщений и кэша готовых текстов
+"""
+from datetime import datetime
+
+from bot.models import MessageTemplate
+from bot.services.message_templates import DEFAULT_TEMPLATES_DIR, MessageTemplates
+from bot.utils.messages import format_appointment_notification, format_survey_thanks
+
+SLOT = datetime(2026, 10, 19, 9, 30)
+
+
+def test_builtin_templates():
+    """Встроенные шаблоны дают прежние тексты"""
+    assert format_appointment_notification(SLOT, procedure_name='Чистка') == (
+        "📅 Вы записаны в Uclinic!\n\n"
+        "Дата: 19.10.2026\n"
+        "Время: 09:30\n"
+        "💆 Процедура: Чистка\n"
+        "\nМы напомним вам за 24 часа до визита! ⏰"
+    )
+    assert format_survey_thanks(4) == "Спасибо за вашу оценку! Рады, что вам понравилось! 😊"
+
+
+def test_same_slot_rendered_once(session_factory):
+    """Повторный рендер с теми же параметрами берётся из кэша"""
+    templates = MessageTemplates(session_factory=session_factory)
+    texts = {templates.render('reminder_24h', appointment_date=SLOT, doctor_name=None, procedure_name='Чистка')
+             for _ in range(100)}
+    
+    assert len(texts) == 1
+    assert templates.render_cache.stats()['misses'] == 1
+    assert templates.render_cache.stats()['hits'] == 99
+
+
+def test_db_override_hot_reload_and_fallback(session_factory, tmp_path):
+    """Шаблон из БД заменяет файл после перезагрузки, шаблон с ошибкой не применяется"""
+    (tmp_path / 'survey_message.j2').write_text('Оцените {{ procedure_name }}\n', encoding='utf-8')
+    templates = MessageTemplates(directories=[str(tmp_path), DEFAULT_TEMPLATES_DIR], session_factory=session_factory)
+    
+    assert templates.load() is True
+    assert templates.render('survey_message', procedure_name='Чистку') == 'Оцените Чистку'
+    assert templates.load() is False
+    
+    db = session_factory()
+    db.add(MessageTemplate(name='survey_message', body='Как прошла {{ procedure_name|lower }}?'))
+    db.commit()
+    assert templates.load() is True
+    assert templates.render('survey_message', procedure_name='Чистка') == 'Как прошла чистка?'
+    
+    db.get(MessageTemplate, 'survey_message').body = '{% if procedure_name %}Сломано'
+    db.commit()
+    db.close()
+    templates.load()
+    assert templates.stats()['errors'] == 1
+    assert templates.render('survey_message', procedure_name='Чистку') == 'Оцените Чистку'
+    assert templates.render('survey_thanks', rating=3).startswith('Спасибо за обратную связь')
+
+
+def test_render_error_falls_back(session_factory):
+    """Шаблон, падающий при рендере, заменяется встроенным, ошибка не кэшируется"""
+    db = session_factory()
+    db.add(MessageTemplate(name='survey_message', body='Как прошла {{ procedure_name.upper() }}?'))
+    db.commit()
+    db.close()
+    templates = MessageTemplates(session_factory=session_factory)
+    templates.load()
+    
+    assert templates.render('survey_message', procedure_name='чистка') == 'Как прошла ЧИСТКА?'
+    builtin = templates.render('survey_message', procedure_name=None)
+    assert 'Как прошла' not in builtin and builtin == templates.render('survey_message', procedure_name=None)
+    assert templates.stats()['errors'] == 1
+
+
+def test_check_source_renders_samples():
+    """Перед сохранением шаблон проверяется пробным рендером"""
+    templates = MessageTemplates(session_factory=None)
+    source = 'Как прошла {{ procedure_name.upper() }}?'
+    
+    assert templates.check_source(source) is None
+    assert 'ошибка рендера' in templates.check_source(source, 'survey_message')
+    assert templates.check_source('{{ rating }}', 'survey_thanks') is None
+    assert 'unsafe' in templates.check_source("{{ rating.__class__.__mro__ }}", 'survey_thanks')
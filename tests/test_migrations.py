@@ -0,0 +1,60 @@
+"""
+Тесты миграций данных
+"""
+import importlib.util
+from pathlib import Path
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import create_engine, inspect, text
+
+from bot.database import Base
+from bot.models import Appointment, Survey, User, WebhookEvent
+
+MIGRATIONS = Path(__file__).parent.parent / 'migrations' / 'versions'
+
+
+def load_migration(filename):
+    spec = importlib.util.spec_from_file_location(filename[:-3], MIGRATIONS / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_survey_dedup_keeps_answered_survey():
+    """При удалении дубликатов опросов остаётся отвеченный, а не самый ранний"""
+    migration = load_migration('20261018_0001_hot_path_indexes.py')
+    engine = create_engine("sqlite://")
+    
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE surveys (id INTEGER PRIMARY KEY, appointment_id INTEGER, rating INTEGER, answered_at TIMESTAMP)"
+        ))
+        conn.execute(text(
+            "INSERT INTO surveys VALUES "
+            "(1, 10, NULL, NULL), (2, 10, 5, '2026-10-01 10:00:00'), (3, 10, NULL, NULL), "
+            "(4, 20, NULL, NULL), (5, 20, NULL, NULL), "
+            "(6, 30, NULL, '2026-10-02 10:00:00'), (7, 30, 4, '2026-10-02 11:00:00')"
+        ))
+        conn.execute(text(migration.DEDUP_SURVEYS_SQL))
+        remaining = conn.execute(text("SELECT id FROM surveys ORDER BY id")).scalars().all()
+    
+    assert remaining == [2, 4, 7]
+
+
+def test_hot_path_indexes_create_missing_webhook_events():
+    """В базе, созданной до очереди вебхуков, миграция создаёт таблицу webhook_events"""
+    migration = load_migration('20261018_0001_hot_path_indexes.py')
+    engine = create_engine("sqlite://")
+    
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn, tables=[User.__table__, Appointment.__table__, Survey.__table__])
+        with Operations.context(MigrationContext.configure(conn)):
+            migration.upgrade()
+        
+        inspector = inspect(conn)
+        columns = {column['name'] for column in inspector.get_columns('webhook_events')}
+        indexes = {index['name'] for index in inspector.get_indexes('webhook_events')}
+    
+    assert set(WebhookEvent.__table__.columns.keys()) == columns
+    assert {'ix_webhook_events_status_available', 'ix_webhook_events_deal_id', 'uq_webhook_events_dedup_key'} <= indexes
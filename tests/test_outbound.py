@@ -0,0 +1,76 @@
+"""
+Тесты диспетчера исходящих сообщений
+"""
+import asyncio
+
+import pytest
+from telegram.error import RetryAfter
+
+from bot.services.outbound import OutboundDispatcher, Priority
+
+
+class FakeBot:
+    """Бот, запоминающий отправленные сообщения"""
+    
+    def __init__(self, failures=None):
+        self.sent = []
+        self.failures = list(failures or [])
+    
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append((chat_id, text))
+        return text
+
+
+@pytest.mark.asyncio
+async def test_messages_sent_in_priority_order():
+    """Сообщения с более высоким приоритетом уходят первыми"""
+    bot = FakeBot()
+    dispatcher = OutboundDispatcher(global_rate=1000, chat_rate=1000, workers=1)
+    await dispatcher.start(bot)
+    
+    futures = [
+        dispatcher.enqueue(1, "survey", Priority.SURVEY),
+        dispatcher.enqueue(2, "admin", Priority.ADMIN_ALERT),
+        dispatcher.enqueue(3, "notification", Priority.NOTIFICATION),
+        dispatcher.enqueue(4, "reminder", Priority.REMINDER),
+    ]
+    await asyncio.gather(*futures)
+    await dispatcher.stop()
+    
+    assert [text for _, text in bot.sent] == ["notification", "reminder", "survey", "admin"]
+    assert dispatcher.stats()['sent'] == 4
+
+
+@pytest.mark.asyncio
+async def test_chat_limit_defers_without_blocking_other_chats():
+    """Второе сообщение в тот же чат откладывается, другие чаты не ждут"""
+    bot = FakeBot()
+    dispatcher = OutboundDispatcher(global_rate=1000, chat_rate=20, workers=1)
+    await dispatcher.start(bot)
+    
+    first = dispatcher.enqueue(1, "first")
+    second = dispatcher.enqueue(1, "second")
+    other = dispatcher.enqueue(2, "other")
+    await asyncio.gather(first, second, other)
+    await dispatcher.stop()
+    
+    assert [text for _, text in bot.sent] == ["first", "other", "second"]
+    assert dispatcher.stats()['throttled'] == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_retried():
+    """При RetryAfter сообщение отправляется повторно"""
+    bot = FakeBot(failures=[RetryAfter(0)])
+    dispatcher = OutboundDispatcher(global_rate=1000, chat_rate=1000, workers=1, max_retries=1)
+    await dispatcher.start(bot)
+    
+    assert await dispatcher.send(1, "hello") == "hello"
+    await dispatcher.stop()
+    
+    stats = dispatcher.stats()
+    assert stats['retry_after'] == 1
+    assert stats['deferred'] >= 1
+    assert stats['sent'] == 1
@@ -0,0 +1,89 @@
+"""
+Тесты нормализации телефонов, хэшей для ссылок привязки и заполнения колонок
+"""
+import pytest
+
+from bot.config import Config
+from bot.models import User
+from bot.services.phone_index import backfill_phone_columns
+from bot.utils.phone import is_valid_phone_hash, normalize_phone, phone_hash, phone_values
+
+
+def test_normalize_formats():
+    """Разные записи одного номера приводятся к одному E.164"""
+    variants = ['8 (999) 123-45-67', '+7 999 123 45 67', '9991234567', '79991234567']
+    assert {normalize_phone(value) for value in variants} == {'+79991234567'}
+    assert normalize_phone('+375 29 123 45 67') == '+375291234567'
+    assert normalize_phone('123') is None
+    assert normalize_phone(None) is None
+
+
+def test_bitrix_multifield():
+    """Из мультиполя Битрикс24 берётся первое непустое значение"""
+    field = [
+        {'ID': '1', 'VALUE': '', 'VALUE_TYPE': 'WORK'},
+        {'ID': '2', 'VALUE': '8-999-123-45-67', 'VALUE_TYPE': 'MOBILE'},
+    ]
+    assert phone_values(field) == ['8-999-123-45-67']
+    assert normalize_phone(field) == '+79991234567'
+
+
+def test_phone_hash_stable_across_formats():
+    """Хэш не зависит от формата записи номера и пригоден для start-параметра"""
+    value = phone_hash('8 (999) 123-45-67')
+    
+    assert value == phone_hash([{'VALUE': '+79991234567'}])
+    assert value != phone_hash('+79991234568')
+    assert is_valid_phone_hash(value)
+    assert not is_valid_phone_hash('+79991234567')
+    assert phone_hash('12') is None
+
+
+def test_backfill_in_batches(session_factory):
+    """Заполнение проходит все строки пачками и пропускает нераспознанные номера"""
+    db = session_factory()
+    db.add_all([User(telegram_id=i, phone_number=f'8 999 000 00 {i:02d}') for i in range(1, 6)])
+    db.add(User(telegram_id=99, phone_number='12'))
+    db.commit()
+    db.close()
+    
+    stats = backfill_phone_columns(User, batch_size=2, session_factory=session_factory)
+    
+    assert stats == {'scanned': 6, 'updated': 5, 'invalid': 1}
+    db = session_factory()
+    user = db.query(User).filter(User.phone_e164 == '+79990000003').one()
+    assert user.telegram_id == 3
+    assert user.phone_hash == phone_hash('+79990000003')
+    db.close()
+
+
+def test_rehash_after_secret_change(session_factory, monkeypatch):
+    """После смены ключа --rehash пересчитывает уже заполненные хэши"""
+    monkeypatch.setattr(Config, 'PHONE_HASH_SECRET', 'old-secret')
+    db = session_factory()
+    db.add(User(telegram_id=1, phone_number='8 999 000 00 01'))
+    db.commit()
+    db.close()
+    backfill_phone_columns(User, session_factory=session_factory)
+    
+    monkeypatch.setattr(Config, 'PHONE_HASH_SECRET', 'new-secret')
+    assert backfill_phone_columns(User, session_factory=session_factory)['scanned'] == 0
+    assert backfill_phone_columns(User, session_factory=session_factory, rehash=True)['updated'] == 1
+    
+    db = session_factory()
+    assert db.query(User).one().phone_hash == phone_hash('+79990000001')
+    db.close()
+
+
+def test_secret_required_for_links(monkeypatch):
+    """Ссылки привязки без PHONE_HASH_SECRET - ошибка конфигурации"""
+    monkeypatch.setattr(Config, 'TELEGRAM_BOT_TOKEN', 'token')
+    monkeypatch.setattr(Config, 'BITRIX24_WEBHOOK_URL', 'https://example.bitrix24.ru/rest/1/x/')
+    monkeypatch.setattr(Config, 'TELEGRAM_UPDATE_MODE', 'polling')
+    monkeypatch.setattr(Config, 'TELEGRAM_BOT_USERNAME', 'uclinic_bot')
+    monkeypatch.setattr(Config, 'PHONE_HASH_SECRET', '')
+    with pytest.raises(ValueError, match='PHONE_HASH_SECRET'):
+        Config.validate()
+    
+    monkeypatch.setattr(Config, 'PHONE_HASH_SECRET', 'secret')
+    assert Config.validate()
@@ -0,0 +1,206 @@
+"""
+Регрессионные тесты планов частых запросов
+
+Каждый запрос выполняется через EXPLAIN на заполненной БД; тест падает, если
+в плане появляется полный просмотр таблицы. По умолчанию проверяется SQLite,
+PostgreSQL - если задан TEST_POSTGRES_URL (на нём seq scan запрещается,
+чтобы планировщик не выбирал его из-за малого объёма данных).
+"""
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, exists, or_, select, text
+from sqlalchemy.orm import contains_eager
+
+from bot.database import Base
+from bot.models import Appointment, Survey, User, WebhookEvent
+
+NOW = datetime(2026, 1, 15, 12, 0)
+
+
+def hot_queries():
+    """Частые запросы бота (в том же виде, что в обработчиках и сервисах)"""
+    return {
+        # reminder_callback_handler: последняя неподтверждённая запись пользователя
+        'reminder_callback': select(Appointment).where(
+            Appointment.user_id == 1,
+            Appointment.reminder_sent == True,
+            Appointment.reminder_confirmed == None
+        ).order_by(Appointment.appointment_date.desc()).limit(1),
+        # survey_callback_handler: последняя прошедшая запись пользователя
+        'survey_callback': select(Appointment).where(
+            Appointment.user_id == 1,
+            Appointment.appointment_date < NOW
+        ).order_by(Appointment.appointment_date.desc()).limit(1),
+        # survey_callback_handler: опрос по записи
+        'survey_by_appointment': select(Survey).where(
+            Survey.appointment_id == 1,
+            Survey.user_id == 1
+        ),
+        # IdentityCache: пользователь по telegram_id и телефону (при промахе кэша)
+        'user_by_telegram': select(User.id).where(User.telegram_id == 1001).limit(1),
+        'user_by_phone': select(User.id).where(User.phone_e164 == '+79990000001').limit(1),
+        # link_account: запись по хэшу номера из ссылки привязки
+        'link_by_hash': select(Appointment.phone_number, Appointment.phone_e164).where(
+            Appointment.phone_hash == 'AbCdEfGhIjKlMnOp'
+        ).limit(1),
+        # process_new_appointment: повторная сделка
+        'appointment_by_deal': select(Appointment.id).where(Appointment.bitrix24_deal_id == 1),
+        # sweep_reminders
+        'sweep_reminders': select(Appointment).join(Appointment.user).options(
+            contains_eager(Appointment.user)
+        ).where(
+            Appointment.reminder_sent == False,
+            Appointment.appointment_date > NOW,
+            Appointment.appointment_date <= NOW + timedelta(hours=1),
+            User.is_active == True
+        ).order_by(Appointment.appointment_date, Appointment.id).limit(200),
+        # sweep_surveys
+        'sweep_surveys': select(Appointment).join(Appointment.user).where(
+            Appointment.appointment_date > NOW - timedelta(days=7),
+            Appointment.appointment_date <= NOW,
+            or_(Appointment.reminder_confirmed == None, Appointment.reminder_confirmed == True),
+            ~exists().where(Survey.appointment_id == Appointment.id),
+            User.is_active == True
+        ).order_by(Appointment.appointment_date, Appointment.id).limit(200),
+        # WebhookQueue._refill
+        'webhook_refill': select(WebhookEvent.id).where(
+            WebhookEvent.status == 'pending',
+            WebhookEvent.available_at <= NOW
+        ).order_by(WebhookEvent.id).limit(100),
+        'webhook_dedup': select(WebhookEvent.id).where(WebhookEvent.dedup_key == 'ONCRMDEALADD:1:1'),
+    }
+
+
+# Индексы, на которые рассчитаны запросы (проверяется в SQLite)
+EXPECTED_INDEXES = {
+    'reminder_callback': 'ix_appointments_user_reminder',
+    'survey_callback': 'ix_appointments_user_date',
+    'survey_by_appointment': 'uq_surveys_appointment_id',
+    'user_by_phone': 'ix_users_phone_e164',
+    'link_by_hash': 'ix_appointments_phone_hash',
+    'sweep_reminders': 'ix_appointments_reminder_due',
+    'sweep_surveys': 'uq_surveys_appointment_id',
+    'webhook_dedup': 'uq_webhook_events_dedup_key',
+}
+
+
+def seed(engine):
+    """Заполнение БД данными, похожими на рабочие"""
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [
+            {
+                'id': i,
+                'telegram_id': 1000 + i,
+                'phone_number': f'8999{i:07d}',
+                'phone_e164': f'+7999{i:07d}',
+                'is_active': i % 10 != 0
+            }
+            for i in range(1, 501)
+        ])
+        connection.execute(Appointment.__table__.insert(), [
+            {
+                'id': i,
+                'bitrix24_deal_id': i,
+                'user_id': i % 500 + 1,
+                'phone_e164': f'+7999{i % 500 + 1:07d}',
+                'phone_hash': f'h{i % 500 + 1:015d}',
+                'appointment_date': NOW + timedelta(hours=i % 720 - 360),
+                'reminder_sent': i % 3 == 0,
+                'reminder_confirmed': None if i % 4 else True,
+            }
+            for i in range(1, 5001)
+        ])
+        connection.execute(Survey.__table__.insert(), [
+            {'appointment_id': i, 'user_id': i % 500 + 1, 'sent_at': NOW}
+            for i in range(1, 5001, 5)
+        ])
+        connection.execute(WebhookEvent.__table__.insert(), [
+            {
+                'event': 'ONCRMDEALADD',
+                'payload': '{}',
+                'status': 'done' if i % 20 else 'pending',
+                'available_at': NOW,
+                'dedup_key': f'ONCRMDEALADD:{i}:{i}',
+                'coalesced': 0,
+                'attempts': 1,
+            }
+            for i in range(1, 3001)
+        ])
+
+
+def explain_sqlite(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def sqlite_full_scans(plan):
+    """SCAN <таблица> (в т.ч. по всему индексу) - полный просмотр"""
+    return [step for step in plan if re.match(r'^SCAN \w+( USING (COVERING )?INDEX \w+)?$', step)]
+
+
+@pytest.fixture(scope='module')
+def sqlite_engine(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}")
+    seed(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ANALYZE")
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize('name', list(hot_queries()))
+def test_sqlite_plan_uses_indexes(sqlite_engine, name):
+    """Частые запросы в SQLite не просматривают таблицы целиком"""
+    with sqlite_engine.connect() as connection:
+        plan = explain_sqlite(connection, hot_queries()[name])
+    
+    assert not sqlite_full_scans(plan), f"{name}: полный просмотр таблицы\n" + "\n".join(plan)
+    if name in EXPECTED_INDEXES:
+        assert any(EXPECTED_INDEXES[name] in step for step in plan), f"{name}: индекс не используется\n" + "\n".join(plan)
+
+
+POSTGRES_URL = os.getenv('TEST_POSTGRES_URL')
+
+
+@pytest.fixture(scope='module')
+def postgres_engine():
+    if not POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL не задан")
+    engine = create_engine(POSTGRES_URL)
+    Base.metadata.drop_all(bind=engine)
+    seed(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ANALYZE")
+    yield engine
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+def postgres_seq_scans(node):
+    """Узлы Seq Scan в JSON-плане PostgreSQL"""
+    found = [node['Relation Name']] if node.get('Node Type') == 'Seq Scan' else []
+    for child in node.get('Plans', []):
+        found.extend(postgres_seq_scans(child))
+    return found
+
+
+@pytest.mark.parametrize('name', list(hot_queries()))
+def test_postgres_plan_uses_indexes(postgres_engine, name):
+    """Частые запросы в PostgreSQL выполнимы без Seq Scan"""
+    statement = hot_queries()[name]
+    with postgres_engine.connect() as connection:
+        connection.exec_driver_sql("SET enable_seqscan = off")
+        compiled = statement.compile(dialect=connection.dialect)
+        plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}"), compiled.params).scalar()
+    
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    
+    assert not postgres_seq_scans(plan[0]['Plan']), f"{name}: Seq Scan\n{json.dumps(plan, indent=2)}"
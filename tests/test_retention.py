@@ -0,0 +1,85 @@
+"""
+Тесты архивирования и удаления данных старше сроков хранения
+"""
+import gzip
+import json
+from datetime import datetime, timedelta
+
+from bot.models import Appointment, InteractionLog, Survey, User, WebhookEvent
+from bot.services.retention import RetentionPolicy, RetentionService, default_policies
+
+NOW = datetime(2026, 10, 18, 12, 0)
+
+
+def read_archive(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        return [json.loads(line) for line in archive]
+
+
+def test_expired_rows_archived_in_batches(session_factory, tmp_path):
+    """Старые строки уходят в gzip JSONL пачками, свежие остаются"""
+    db = session_factory()
+    db.add_all(
+        [InteractionLog(user_id=1, interaction_type='reminder', status='sent',
+                        created_at=NOW - timedelta(days=200, minutes=i)) for i in range(25)]
+        + [InteractionLog(user_id=1, interaction_type='reminder', status='sent', created_at=NOW)]
+    )
+    db.commit()
+    db.close()
+    
+    service = RetentionService(
+        session_factory=session_factory, batch_size=10, archive_dir=str(tmp_path), pause=0,
+        policies=[RetentionPolicy(InteractionLog, 180, 'created_at')]
+    )
+    stats = service.run(now=NOW)['interaction_logs']
+    
+    assert stats['deleted'] == 25
+    rows = read_archive(stats['archives'][0])
+    assert len(rows) == 25
+    assert rows[0]['interaction_type'] == 'reminder'
+    assert rows[0]['created_at'] == '2026-04-01T12:00:00'
+    
+    db = session_factory()
+    assert db.query(InteractionLog).count() == 1
+    db.close()
+    
+    # Повторный запуск ничего не удаляет и не создаёт пустой архив
+    assert service.run(now=NOW)['interaction_logs'] == {
+        'cutoff': NOW - timedelta(days=180), 'deleted': 0, 'partitions_dropped': 0, 'archives': []
+    }
+
+
+def test_default_policies_keep_pending_and_delete_children(session_factory, tmp_path, monkeypatch):
+    """Необработанные вебхуки не удаляются, опросы удаляются вместе с записью"""
+    from bot.config import Config
+    monkeypatch.setattr(Config, 'RETENTION_APPOINTMENT_DAYS', 365)
+    old = NOW - timedelta(days=400)
+    
+    db = session_factory()
+    user = User(telegram_id=1)
+    db.add(user)
+    db.flush()
+    appointment = Appointment(bitrix24_deal_id=1, user_id=user.id, appointment_date=old)
+    db.add_all([appointment, Appointment(bitrix24_deal_id=2, user_id=user.id, appointment_date=NOW)])
+    db.flush()
+    db.add(Survey(appointment_id=appointment.id, user_id=user.id, rating=5, sent_at=old))
+    db.add_all([
+        WebhookEvent(event='ONCRMDEALADD', payload='{}', status='done', created_at=old),
+        WebhookEvent(event='ONCRMDEALADD', payload='{}', status='pending', created_at=old),
+    ])
+    db.commit()
+    db.close()
+    
+    results = RetentionService(session_factory=session_factory, archive_dir=str(tmp_path), pause=0).run(now=NOW)
+    
+    assert results['webhook_events']['deleted'] == 1
+    assert results['appointments']['deleted'] == 1
+    assert len(results['appointments']['archives']) == 2
+    assert read_archive(tmp_path / 'surveys' / 'surveys-20261018T120000.jsonl.gz')[0]['rating'] == 5
+    
+    db = session_factory()
+    assert [event.status for event in db.query(WebhookEvent)] == ['pending']
+    assert [row.bitrix24_deal_id for row in db.query(Appointment)] == [2]
+    assert db.query(Survey).count() == 0
+    db.close()
+    assert [policy.table.name for policy in default_policies()] == ['interaction_logs', 'webhook_events', 'appointments']
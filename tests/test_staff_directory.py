@@ -0,0 +1,73 @@
+"""
+Тесты справочника сотрудников
+"""
+from bot.config import Config
+from bot.services.staff_directory import StaffDirectory
+
+
+class FakeClient:
+    """Клиент Битрикс24 со списками в памяти"""
+    
+    def __init__(self, users, contacts):
+        self.users = users
+        self.contacts = contacts
+        self.calls = []
+    
+    def iter_list(self, method, params=None):
+        self.calls.append((method, params))
+        if method == 'user.get':
+            yield self.users
+        else:
+            since = (params.get('filter') or {}).get('>=DATE_MODIFY')
+            yield [c for c in self.contacts if not since or c['DATE_MODIFY'] >= since]
+
+
+def test_load_and_resolve():
+    """Имена загружаются пакетно и ищутся по ID без запросов"""
+    client = FakeClient(
+        users=[{'ID': '1', 'NAME': 'Анна', 'LAST_NAME': 'Смирнова'}, {'ID': '2', 'NAME': '', 'LAST_NAME': ''}],
+        contacts=[{'ID': '10', 'NAME': 'Иван', 'LAST_NAME': 'Петров', 'DATE_MODIFY': '2024-01-01T10:00:00+03:00'}]
+    )
+    directory = StaffDirectory(client=client, load_contacts=True)
+    
+    assert directory.load()
+    calls = len(client.calls)
+    
+    assert directory.resolve_user(1) == 'Анна Смирнова'
+    assert directory.resolve_user('2') is None
+    assert directory.resolve_contact('10') == 'Иван Петров'
+    assert len(client.calls) == calls
+
+
+def test_refresh_loads_only_modified_contacts():
+    """Обновление запрашивает контакты начиная с последней даты изменения"""
+    client = FakeClient(
+        users=[],
+        contacts=[{'ID': '10', 'NAME': 'Иван', 'LAST_NAME': 'Петров', 'DATE_MODIFY': '2024-01-01T10:00:00+03:00'}]
+    )
+    directory = StaffDirectory(client=client, load_contacts=True)
+    directory.load()
+    
+    client.contacts.append({'ID': '11', 'NAME': 'Олег', 'LAST_NAME': 'Иванов', 'DATE_MODIFY': '2024-02-01T10:00:00+03:00'})
+    assert directory.refresh()
+    
+    method, params = client.calls[-1]
+    assert params['filter'] == {'>=DATE_MODIFY': '2024-01-01T10:00:00+03:00'}
+    assert directory.resolve_contact('10') == 'Иван Петров'
+    assert directory.resolve_contact('11') == 'Олег Иванов'
+    assert directory.stats()['contacts_modified'] == '2024-02-01T10:00:00+03:00'
+
+
+def test_contacts_skipped_without_doctor_field(monkeypatch):
+    """Без поля врача контакты не загружаются, даже если включены"""
+    monkeypatch.setattr(Config, 'STAFF_DIRECTORY_CONTACTS', True)
+    monkeypatch.setattr(Config, 'BITRIX24_DOCTOR_FIELD', '')
+    client = FakeClient(users=[{'ID': '7', 'NAME': 'Анна', 'LAST_NAME': 'Иванова'}], contacts=[])
+    directory = StaffDirectory(client=client)
+    
+    assert directory.load()
+    assert not directory.load_contacts
+    assert [method for method, _ in client.calls] == ['user.get']
+    
+    monkeypatch.setattr(Config, 'BITRIX24_DOCTOR_FIELD', 'UF_CRM_DOCTOR')
+    assert StaffDirectory(client=client).load_contacts
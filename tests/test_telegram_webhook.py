@@ -0,0 +1,116 @@
+"""
+Тесты приёма обновлений Telegram через вебхук
+"""
+import asyncio
+import threading
+
+import pytest
+
+from bot.config import Config
+from bot.services.loop_bridge import loop_bridge
+from bot.services.telegram_webhook import telegram_update_feed
+from bot.services.webhook_server import app
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 1700000000,
+        "chat": {"id": 42, "type": "private"},
+        "text": "/start"
+    }
+}
+
+
+class FakeApplication:
+    """Приложение PTB: только очередь обновлений"""
+    
+    def __init__(self):
+        self.bot = None
+        self.update_queue = asyncio.Queue()
+
+
+@pytest.fixture
+def running_loop():
+    """Event loop в отдельном потоке, подключённый к loop_bridge"""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    loop_bridge.attach(loop)
+    yield loop
+    loop_bridge.detach()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=2)
+    loop.close()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(Config, 'TELEGRAM_WEBHOOK_SECRET', 'secret')
+    return app.test_client()
+
+
+def test_invalid_secret_rejected(client):
+    """Запрос без секрета Telegram отклоняется"""
+    response = client.post(Config.TELEGRAM_WEBHOOK_PATH, json=UPDATE)
+    
+    assert response.status_code == 403
+
+
+def test_requests_rejected_without_configured_secret(client, monkeypatch):
+    """Без настроенного секрета эндпоинт не принимает обновления, а режим webhook не проходит валидацию"""
+    monkeypatch.setattr(Config, 'TELEGRAM_WEBHOOK_SECRET', '')
+    response = client.post(
+        Config.TELEGRAM_WEBHOOK_PATH,
+        json=UPDATE,
+        headers={'X-Telegram-Bot-Api-Secret-Token': ''}
+    )
+    assert response.status_code == 403
+    
+    monkeypatch.setattr(Config, 'TELEGRAM_BOT_TOKEN', 'token')
+    monkeypatch.setattr(Config, 'BITRIX24_WEBHOOK_URL', 'https://example.bitrix24.ru/rest/1/x/')
+    monkeypatch.setattr(Config, 'TELEGRAM_UPDATE_MODE', 'webhook')
+    monkeypatch.setattr(Config, 'TELEGRAM_WEBHOOK_URL', 'https://bot.example.com')
+    monkeypatch.setattr(Config, 'WEBHOOK_PORT', 5000)
+    monkeypatch.setattr(Config, 'WEBHOOK_SERVER_MODE', 'embedded')
+    with pytest.raises(ValueError, match='TELEGRAM_WEBHOOK_SECRET'):
+        Config.validate()
+    
+    monkeypatch.setattr(Config, 'TELEGRAM_WEBHOOK_SECRET', 'a' * 32)
+    assert Config.validate()
+
+
+def test_unavailable_without_application(client):
+    """Пока бот не запущен, Telegram получает 503 и повторит доставку"""
+    telegram_update_feed.detach()
+    response = client.post(
+        Config.TELEGRAM_WEBHOOK_PATH,
+        json=UPDATE,
+        headers={'X-Telegram-Bot-Api-Secret-Token': 'secret'}
+    )
+    
+    assert response.status_code == 503
+
+
+def test_update_put_into_application_queue(client, running_loop):
+    """Обновление передаётся в update_queue приложения"""
+    application = asyncio.run_coroutine_threadsafe(_make_application(), running_loop).result()
+    telegram_update_feed.attach(application)
+    
+    try:
+        response = client.post(
+            Config.TELEGRAM_WEBHOOK_PATH,
+            json=UPDATE,
+            headers={'X-Telegram-Bot-Api-Secret-Token': 'secret'}
+        )
+    finally:
+        telegram_update_feed.detach()
+    
+    assert response.status_code == 200
+    update = application.update_queue.get_nowait()
+    assert update.update_id == 1
+    assert update.message.text == "/start"
+
+
+async def _make_application():
+    return FakeApplication()
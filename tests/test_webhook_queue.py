@@ -0,0 +1,130 @@
+"""
+Тесты очереди вебхуков
+"""
+import threading
+import time
+
+import pytest
+
+from bot.models import WebhookEvent
+from bot.services.webhook_queue import WebhookQueue
+
+
+@pytest.fixture
+def session_factory(make_session_factory, tmp_path):
+    """Сессии к отдельной файловой БД: у каждого потока очереди своё соединение"""
+    return make_session_factory(f"sqlite:///{tmp_path / 'queue.db'}", timeout=10)
+
+
+def wait_for_status(session_factory, event_id, status, timeout=5):
+    """Ожидание перехода события в нужный статус"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db = session_factory()
+        try:
+            event = db.get(WebhookEvent, event_id)
+            if event.status == status:
+                return event
+        finally:
+            db.close()
+        time.sleep(0.05)
+    raise AssertionError(f"Событие {event_id} не перешло в статус {status}")
+
+
+def test_event_processed_by_worker(session_factory):
+    """Событие сохраняется в БД и обрабатывается воркером"""
+    received = []
+    webhook_queue = WebhookQueue(lambda payload: received.append(payload) or True, session_factory=session_factory, workers=2)
+    webhook_queue.start()
+    
+    try:
+        event_id = webhook_queue.enqueue({"event": "ONCRMDEALADD", "data": {"FIELDS": {"ID": 1}}})
+        event = wait_for_status(session_factory, event_id, 'done')
+    finally:
+        webhook_queue.stop()
+    
+    assert event.attempts == 1
+    assert received == [{"event": "ONCRMDEALADD", "data": {"FIELDS": {"ID": 1}}}]
+    assert webhook_queue.stats()['processed'] == 1
+
+
+def test_failed_event_retried_until_max_attempts(session_factory):
+    """Неуспешное событие повторяется и переводится в failed после лимита попыток"""
+    webhook_queue = WebhookQueue(
+        lambda payload: False,
+        session_factory=session_factory,
+        workers=1,
+        max_attempts=2,
+        retry_delay=0,
+        poll_interval=0.05
+    )
+    webhook_queue.start()
+    
+    try:
+        event_id = webhook_queue.enqueue({"event": "ONCRMDEALUPDATE"})
+        event = wait_for_status(session_factory, event_id, 'failed')
+    finally:
+        webhook_queue.stop()
+    
+    assert event.attempts == 2
+    assert webhook_queue.stats()['retried'] == 1
+    assert webhook_queue.stats()['failed'] == 1
+
+
+def test_enqueue_rejected_when_queue_full(session_factory):
+    """При переполнении очереди событие отклоняется (backpressure)"""
+    webhook_queue = WebhookQueue(lambda payload: True, session_factory=session_factory, maxsize=1)
+    webhook_queue._queue.put_nowait(0)
+    
+    assert webhook_queue.enqueue({"event": "ONCRMDEALADD"}) is None
+    assert webhook_queue.stats()['rejected'] == 1
+
+
+def test_duplicate_delivery_dropped(session_factory):
+    """Повторная доставка события с тем же ts не сохраняется второй раз"""
+    webhook_queue = WebhookQueue(lambda payload: True, session_factory=session_factory)
+    payload = {"event": "ONCRMDEALADD", "data": {"FIELDS": {"ID": "5"}}, "ts": "1700000000"}
+    
+    first_id = webhook_queue.enqueue(payload)
+    
+    assert webhook_queue.enqueue(dict(payload)) == first_id
+    assert webhook_queue.enqueue(dict(payload, ts="1700000001")) != first_id
+    assert webhook_queue.stats()['duplicates'] == 1
+
+
+def test_deal_updates_coalesced(session_factory):
+    """Серия обновлений одной сделки обрабатывается одним событием"""
+    received = []
+    webhook_queue = WebhookQueue(
+        lambda payload: received.append(payload) or True,
+        session_factory=session_factory,
+        debounce=0.3,
+        poll_interval=0.05
+    )
+    webhook_queue.start()
+    
+    try:
+        ids = {
+            webhook_queue.enqueue({"event": "ONCRMDEALUPDATE", "data": {"FIELDS": {"ID": "7"}}, "ts": str(ts)})
+            for ts in range(5)
+        }
+        assert len(ids) == 1
+        event = wait_for_status(session_factory, ids.pop(), 'done')
+    finally:
+        webhook_queue.stop()
+    
+    assert len(received) == 1
+    assert event.coalesced == 4
+    assert webhook_queue.stats()['coalesced'] == 4
+
+
+def test_ingest_only_process_starts_no_timers(session_factory):
+    """Без воркеров (внешний WSGI-сервер) отложенное обновление только сохраняется в БД"""
+    webhook_queue = WebhookQueue(lambda payload: True, session_factory=session_factory, debounce=30)
+    threads = threading.active_count()
+    
+    for deal_id in range(20):
+        assert webhook_queue.enqueue({"event": "ONCRMDEALUPDATE", "data": {"FIELDS": {"ID": str(deal_id)}}})
+    
+    assert threading.active_count() == threads
+    assert webhook_queue.backlog() == {'pending': 20}